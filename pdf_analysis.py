@@ -0,0 +1,358 @@
+"""页面图像分析
+
+空白页检测、重复页检测等功能需要逐页光栅化后统计像素。页面按块分配到进程池
+中，每页以较低分辨率渲染为固定尺寸的灰度图（页面按比例拉伸，不影响统计结果），
+同一块的页面叠成一个 NumPy 数组，一次向量化计算出整块页面的得分。分析在后台
+任务中进行，task 参数的用法与 pdf_core 相同。
+
+重复页检测使用感知哈希：页面缩小后做二维 DCT，取低频系数与中位数比较得到
+二进制位，重新扫描、轻微位移或压缩的同一页面哈希只相差少数几位。查找近似
+相同的哈希使用局部敏感哈希分桶（find_duplicates），耗时与页数近似成线性关系，
+不做两两比较。
+
+方向检测优先使用文字层中各行文字的书写方向；没有文字层的扫描件用投影轮廓
+判断：文字行方向上的行投影起伏明显，据此只能确定文字横排还是竖排，即页面是否
+需要转90°。图像中没有可靠区分上下的依据（按字母上伸部判断的方法对中日韩文字
+无效，对拉丁文字也不稳定），扫描件上下颠倒（180°）的页面需要用户自行检查。
+判断为竖排的扫描页无法区分该顺时针还是逆时针转，竖排的中日文页面也会得到
+这个结果，因此这些页面不自动旋转，和置信度低的页面一起交给用户检查（needs_review）。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pdf_metrics import stage
+from pdf_startup import lazy_import
+from pdf_tasks import NullTask
+
+fitz = lazy_import("fitz")  # pymupdf
+
+CHUNK_PAGES = 32  # 每个工作进程任务包含的页数
+
+# 空白页检测：统计比纸张背景明显更暗的像素所占比例（墨迹覆盖率）
+BLANK_RASTER = (256, 336)  # 渲染尺寸（宽, 高），约30dpi，单行小字仍可分辨
+BLANK_THRESHOLD = 0.0002  # 默认阈值，覆盖率低于此值视为空白页
+BLANK_MARGIN = 0.05  # 忽略的页边比例（扫描件边缘阴影、装订孔）
+INK_CONTRAST = 64  # 比背景暗这么多的像素算作墨迹
+
+# 重复页检测：64×64 灰度图的 16×16 低频 DCT 系数（去掉直流分量）共255位
+HASH_RASTER = (64, 64)
+HASH_FREQUENCIES = 16
+HASH_BITS = 256  # 按字节补齐后的位数，最低位恒为0
+# 汉明距离不超过此值视为重复页。同一页面重新扫描后约相差15~25位，
+# 版式相近但文字不同的页面通常相差70位以上
+DUPLICATE_DISTANCE = 24
+LSH_TABLES = 24  # 局部敏感哈希的表数
+LSH_BITS = 20  # 每张表采样的位数
+LSH_SEED = 2024
+
+# 方向检测：约75dpi，正文的文字行有8个像素以上，行与行之间可以分开
+ORIENT_RASTER = (640, 832)
+ORIENT_MIN_CONFIDENCE = 0.3  # 自动旋转只应用置信度不低于此值的结果
+# 页面显示的文字方向（向量） -> 使文字正立需要追加的顺时针角度
+_TEXT_DIRECTIONS = {(1, 0): 0, (0, 1): 270, (-1, 0): 180, (0, -1): 90}
+
+# 工作进程内已打开的文档 {(路径, 修改时间): fitz文档}
+_worker_documents = {}
+
+
+def _open_document(path, stamp):
+    key = (path, stamp)
+    document = _worker_documents.get(key)
+    if document is None:
+        for old_document in _worker_documents.values():
+            old_document.close()
+        _worker_documents.clear()
+        document = _worker_documents[key] = fitz.open(path)
+    return document
+
+
+def render_gray(page, size):
+    """把页面拉伸渲染为 size（宽, 高）的灰度图，返回 (高, 宽) 的 uint8 数组"""
+    import numpy as np
+
+    width, height = size
+    rect = page.rect
+    matrix = fitz.Matrix(width / rect.width, height / rect.height)
+    pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY, alpha=False)
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    # 坐标取整可能多出或少一行像素
+    raster = np.full((height, width), 255, dtype=np.uint8)
+    rows, cols = min(height, pix.height), min(width, pix.width)
+    raster[:rows, :cols] = pixels[:rows, :cols]
+    return raster
+
+
+def render_batch(document, page_numbers, size):
+    """渲染一组页面，返回 (页数, 高, 宽) 的数组"""
+    import numpy as np
+
+    return np.stack([render_gray(document[page_num], size) for page_num in page_numbers])
+
+
+def ink_coverage(batch):
+    """计算每页的墨迹覆盖率（0~1）
+
+    背景亮度取页面内第90百分位的灰度，纸张发黄或偏灰的扫描件同样适用；
+    整页偏暗（例如黑色封面）时背景低于128，视为全部有墨迹。
+    """
+    import numpy as np
+
+    count, height, width = batch.shape
+    top, left = int(height * BLANK_MARGIN), int(width * BLANK_MARGIN)
+    inner = batch[:, top:height - top, left:width - left]
+    background = np.percentile(inner.reshape(count, -1), 90, axis=1)
+    ink = inner < (background - INK_CONTRAST)[:, None, None]
+    coverage = ink.mean(axis=(1, 2))
+    return np.where(background < 128, 1.0, coverage)
+
+
+def _dct_matrix(size):
+    """DCT-II 变换矩阵（未归一化，只比较大小时不影响结果）"""
+    import numpy as np
+
+    frequency = np.arange(size)[:, None]
+    position = np.arange(size)[None, :]
+    return np.cos(np.pi * (2 * position + 1) * frequency / (2 * size))
+
+
+def perceptual_hashes(batch):
+    """计算每页的感知哈希，返回 HASH_BITS 位的整数列表"""
+    import numpy as np
+
+    count, height, width = batch.shape
+    coefficients = _dct_matrix(height) @ batch.astype(np.float64) @ _dct_matrix(width).T
+    low = coefficients[:, :HASH_FREQUENCIES, :HASH_FREQUENCIES].reshape(count, -1)[:, 1:]
+    bits = low > np.median(low, axis=1)[:, None]
+    return [int.from_bytes(np.packbits(row).tobytes(), "big") for row in bits]
+
+
+def text_orientation(page):
+    """按文字层判断方向，返回 (顺时针角度, 置信度)，没有文字时返回 None
+
+    各行文字按字符数加权投票，置信度为得票最多的方向所占比例。
+    """
+    votes = dict.fromkeys(_TEXT_DIRECTIONS.values(), 0)
+    matrix = page.rotation_matrix  # 未旋转的页面坐标 -> 显示坐标
+    for block in page.get_text("dict", flags=0)["blocks"]:
+        for line in block.get("lines", ()):
+            dx, dy = line["dir"]
+            shown = (round(dx * matrix.a + dy * matrix.c), round(dx * matrix.b + dy * matrix.d))
+            angle = _TEXT_DIRECTIONS.get(shown)
+            if angle is not None:
+                votes[angle] += sum(len(span["text"].strip()) for span in line["spans"])
+    total = sum(votes.values())
+    if not total:
+        return None
+    angle = max(votes, key=votes.get)
+    return angle, votes[angle] / total
+
+
+def raster_orientations(batch):
+    """按投影轮廓判断每页文字横排还是竖排，返回 [(顺时针角度, 置信度)]
+
+    角度只有 0 和 90，置信度是横竖判断本身的置信度；页面是否上下颠倒无法判断。
+    """
+    import numpy as np
+
+    background = np.percentile(batch.reshape(len(batch), -1), 90, axis=1)
+    ink = batch < (background - INK_CONTRAST)[:, None, None]
+    rows = ink.mean(axis=2)
+    columns = ink.mean(axis=1)
+    # 文字行所在方向的投影在行与行间隙之间剧烈变化
+    row_energy = (np.diff(rows, axis=1) ** 2).mean(axis=1)
+    column_energy = (np.diff(columns, axis=1) ** 2).mean(axis=1)
+
+    results = []
+    for index in range(len(batch)):
+        energy = row_energy[index] + column_energy[index]
+        if energy <= 0:
+            results.append((0, 0.0))
+            continue
+        confidence = abs(row_energy[index] - column_energy[index]) / energy
+        # 文字竖排时转90°，顺时针还是逆时针无法区分，统一按顺时针处理
+        angle = 90 if row_energy[index] < column_energy[index] else 0
+        results.append((angle, float(confidence)))
+    return results
+
+
+def _orientations(document, page_numbers):
+    results = {}
+    scanned = []
+    for page_num in page_numbers:
+        found = text_orientation(document[page_num])
+        if found is None:
+            scanned.append(page_num)
+        else:
+            results[page_num] = found + ('text',)
+    if scanned:
+        batch = render_batch(document, scanned, ORIENT_RASTER)
+        for page_num, found in zip(scanned, raster_orientations(batch)):
+            results[page_num] = found + ('image',)
+    return [results[page_num] for page_num in page_numbers]
+
+
+def _blank_scores(document, page_numbers):
+    return ink_coverage(render_batch(document, page_numbers, BLANK_RASTER)).tolist()
+
+
+def _page_hashes(document, page_numbers):
+    return perceptual_hashes(render_batch(document, page_numbers, HASH_RASTER))
+
+
+# 分析方法 {名称: 函数(fitz文档, 页码列表) -> 与页码一一对应的结果列表}
+ANALYSES = {
+    'blank': _blank_scores,
+    'phash': _page_hashes,
+    'orient': _orientations,  # (顺时针角度, 置信度, 'text' 或 'image')
+}
+
+
+def _analyze_chunk(path, stamp, page_numbers, analysis):
+    """分析一块页面（在工作进程中执行）"""
+    return ANALYSES[analysis](_open_document(path, stamp), page_numbers)
+
+
+def analyze_pages(path, stamp, page_numbers, analysis, task=None, max_workers=None):
+    """在进程池中分析 page_numbers 中的页面，返回 {页码: 结果}
+
+    analysis 为 ANALYSES 中的名称；stamp 为文件修改时间（PDFSession.stamp），
+    用于在工作进程中区分同一路径的不同版本。
+    """
+    results = analyze_documents([(path, stamp, page_numbers)], analysis, task, max_workers)
+    return {page_num: result for (_, page_num), result in results.items()}
+
+
+def analyze_documents(documents, analysis, task=None, max_workers=None):
+    """在同一个进程池中分析多个文件，返回 {(文件序号, 页码): 结果}
+
+    documents 为 [(路径, 修改时间, 页码列表)]。同一文件的页面按顺序分块提交，
+    工作进程依次处理同一文件的各块，不必反复打开文件。max_workers 为0时在当前
+    进程中依次分析（例如在批量处理的工作进程中，不能再创建子进程）。
+    """
+    task = task or NullTask()
+    chunks = []
+    for index, (path, stamp, page_numbers) in enumerate(documents):
+        page_numbers = list(page_numbers)
+        for start in range(0, len(page_numbers), CHUNK_PAGES):
+            chunks.append((index, path, stamp, page_numbers[start:start + CHUNK_PAGES]))
+    total = sum(len(chunk[3]) for chunk in chunks)
+    if not total:
+        return {}
+    # 各页在工作进程中分析，这里记录的是整体耗时
+    with stage(f"analyze-{analysis}"):
+        return _run_chunks(chunks, total, analysis, task, max_workers)
+
+
+def _run_chunks(chunks, total, analysis, task, max_workers):
+    results = {}
+    if max_workers == 0:
+        for index, path, stamp, page_numbers in chunks:
+            task.check_cancelled()
+            results.update(zip(((index, page_num) for page_num in page_numbers),
+                               _analyze_chunk(path, stamp, page_numbers, analysis)))
+            task.report(len(results) / total, f"正在分析页面 {len(results)}/{total}")
+        return results
+
+    max_workers = max_workers or max(1, min(len(chunks), os.cpu_count() or 1))
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {executor.submit(_analyze_chunk, path, stamp, page_numbers, analysis):
+                   (index, page_numbers)
+                   for index, path, stamp, page_numbers in chunks}
+        for future in as_completed(futures):
+            task.check_cancelled()
+            index, page_numbers = futures[future]
+            results.update(zip(((index, page_num) for page_num in page_numbers), future.result()))
+            task.report(len(results) / total, f"正在分析页面 {len(results)}/{total}")
+    finally:
+        # 取消时不等待尚未开始的块
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def find_blank_pages(scores, threshold=BLANK_THRESHOLD):
+    """按墨迹覆盖率 {页码: 覆盖率} 返回空白页页码列表（升序）"""
+    return sorted(page_num for page_num, coverage in scores.items() if coverage < threshold)
+
+
+def find_duplicates(hashes, max_distance=DUPLICATE_DISTANCE):
+    """按顺序查找重复页
+
+    hashes 为按顺序排列的 [(键, 感知哈希)]，键可以是页码或 (文件序号, 页码)。
+    每页与之前保留的页面比较，重复时记录为 {重复页的键: 保留页的键}（距离最近
+    者，距离相同时取靠前者），第一次出现的页面保留。
+
+    使用位采样的局部敏感哈希：每张表取哈希中固定的 LSH_BITS 个位作为桶键，只有
+    至少在一张表中同桶的页面才计算汉明距离。距离在阈值附近的重复页约有3%的
+    概率漏检，距离较近的重复页和不相关的页面几乎不受影响；耗时与页数近似成线性
+    关系。
+    """
+    import numpy as np
+
+    hashes = list(hashes)
+    if not hashes:
+        return {}
+    keys = [key for key, _ in hashes]
+    values = [page_hash for _, page_hash in hashes]
+    data = b"".join(page_hash.to_bytes(HASH_BITS // 8, "big") for page_hash in values)
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8).reshape(len(values), -1), axis=1)
+
+    # 采样位置固定，同样的输入总是得到同样的结果；最低位恒为0，不参与采样
+    rng = np.random.default_rng(LSH_SEED)
+    weights = 1 << np.arange(LSH_BITS, dtype=np.int64)
+    table_keys = np.stack([bits[:, rng.choice(HASH_BITS - 1, LSH_BITS, replace=False)] @ weights
+                           for _ in range(LSH_TABLES)], axis=1).tolist()
+
+    tables = [{} for _ in range(LSH_TABLES)]  # [{桶键: [保留页序号]}]
+    duplicates = {}
+    for index, page_hash in enumerate(values):
+        best = None
+        seen = set()
+        for table, bucket_key in zip(tables, table_keys[index]):
+            for other in table.get(bucket_key, ()):
+                if other in seen:
+                    continue
+                seen.add(other)
+                distance = (page_hash ^ values[other]).bit_count()
+                if distance <= max_distance and (best is None or (distance, other) < best):
+                    best = (distance, other)
+        if best is None:
+            for table, bucket_key in zip(tables, table_keys[index]):
+                table.setdefault(bucket_key, []).append(index)
+        else:
+            duplicates[keys[index]] = keys[best[1]]
+    return duplicates
+
+
+def detect_rotations(session, rotations, min_confidence=ORIENT_MIN_CONFIDENCE, task=None,
+                     max_workers=None):
+    """检测会话中所有页面的方向并写入 rotations，返回需要人工检查的页码列表"""
+    orientations = analyze_pages(session.path, session.stamp, range(session.page_count),
+                                 'orient', task, max_workers)
+    return orientation_rotations(orientations, rotations, min_confidence)
+
+
+def needs_review(found, min_confidence=ORIENT_MIN_CONFIDENCE):
+    """方向检测结果 (角度, 置信度, 来源) 是否需要人工检查、不能自动应用
+
+    除置信度不足的结果外，扫描件判断为竖排（90°）的结果也需要检查：
+    旋转方向可能相反，也可能是本来就竖排的中日文页面。
+    """
+    angle, confidence, source = found
+    return confidence < min_confidence or (source == 'image' and angle == 90)
+
+
+def orientation_rotations(orientations, rotations, min_confidence=ORIENT_MIN_CONFIDENCE):
+    """把方向检测结果 {页码: (角度, 置信度, 来源)} 写入 RotationModel
+
+    只设置不需要人工检查的页面（见 needs_review），返回需要检查、未设置的页码列表。
+    """
+    by_angle = {}
+    uncertain = []
+    for page_num, found in sorted(orientations.items()):
+        if needs_review(found, min_confidence):
+            uncertain.append(page_num)
+        else:
+            by_angle.setdefault(found[0], []).append(page_num)
+    for angle, pages in by_angle.items():
+        rotations.set_pages(pages, angle)
+    return uncertain
@@ -0,0 +1,374 @@
+"""批量处理
+
+把同一种删除、旋转或合并操作应用到大量文件。任务分发到与CPU核数相同的常驻
+工作进程中执行，每个进程通过独立的管道接收任务，超时的任务所在进程会被终止并
+重新启动，不影响其它任务；解析失败（文件损坏）的任务先用 PyMuPDF 修复输入文件
+再重试。全部完成后输出包含每个文件耗时和失败原因的 JSON 汇总；每个任务还记录
+各阶段（解析、复制页面、写出等）的指标，可用 BatchLog 在任务结束时逐行写入
+结构化日志。
+
+任务是字典，例如：
+    {"op": "remove", "input": "a.pdf", "pages": "1-3", "output": "out/a.pdf"}
+    {"op": "rotate", "input": "a.pdf", "rotate": "1-3:90;5:180", "output": "out/a.pdf",
+     "incremental": true}
+    {"op": "rotate", "input": "scan.pdf", "auto_rotate": true, "output": "out/scan.pdf"}
+    {"op": "merge", "inputs": ["a.pdf", "b.pdf"], "output": "out/ab.pdf", "dedup": true}
+    {"op": "remove", "input": "a.pdf", "pages": "1", "output": "out/a.pdf", "compress": true}
+    {"op": "edit", "plan": "plan.json", "inputs": ["c.pdf", "d.pdf"], "output": "out/cd.pdf"}
+
+编辑任务执行 pdf_plan 的编辑计划，plan 可以是计划文件路径或计划字典，inputs 可选，
+提供时代替计划中的输入文件。各种任务都可以指定 compress（对象流和交叉引用流）、
+flate（重新压缩未压缩的流）、linearize（线性化，快速 Web 视图）和 image_dpi（重新
+采样超过此分辨率的图像，结果中的 images 为各图像的节省情况），见 pdf_core。
+"""
+import gc
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from pdf_core import PageRangeError, merge_pdfs, parse_page_ranges, parse_rotations, remove_pages, rotate_pages
+from pdf_metrics import merge_stage_reports, reset_stages, stage_report
+from pdf_plan import EditPlan
+from pdf_rotation import RotationModel
+from pdf_session import PDFSession
+from pdf_tasks import atomic_output
+
+DEFAULT_TIMEOUT = 300  # 每个任务的超时时间（秒）
+DEFAULT_RETRIES = 1  # 文件损坏或工作进程崩溃时的重试次数
+MAX_JOBS_PER_WORKER = 500  # 工作进程处理这么多任务后重启，避免内存碎片累积
+
+OPERATIONS = ("remove", "rotate", "merge", "edit")
+
+# 修复输入文件也无法解决的错误（任务参数有误、文件不存在或无权限），不重试；
+# 其它异常大多是 PyPDF2 解析损坏文件时抛出的，用修复后的文件重试
+PERMANENT_ERRORS = (PageRangeError, OSError)
+
+
+def validate_job(job):
+    """检查任务字典的必填字段，缺少时抛出 ValueError"""
+    op = job.get("op")
+    if op not in OPERATIONS:
+        raise ValueError(f"未知的操作: {op}（可用: {', '.join(OPERATIONS)}）")
+    required = {"remove": ("input", "pages"), "rotate": ("input",),
+                "merge": ("inputs",), "edit": ("plan",)}[op]
+    for key in required + ("output",):
+        if not job.get(key):
+            raise ValueError(f"{op} 任务缺少字段 {key}: {job}")
+    if op == "rotate" and not job.get("rotate") and not job.get("auto_rotate"):
+        raise ValueError(f"rotate 任务缺少字段 rotate 或 auto_rotate: {job}")
+    if op == "merge" and len(job["inputs"]) < 2:
+        raise ValueError(f"合并任务至少需要2个输入文件: {job}")
+
+
+def load_jobs(path, expand_inputs=None):
+    """读取任务文件：JSON 数组，或每行一个 JSON 对象（JSON Lines）
+
+    expand_inputs 可选，用于展开合并任务输入列表中的通配符等。
+    """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        jobs = json.loads(text)
+    else:
+        jobs = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for job in jobs:
+        if expand_inputs is not None and job.get("op") in ("merge", "edit") and job.get("inputs"):
+            job["inputs"] = expand_inputs(job["inputs"])
+        validate_job(job)
+    return jobs
+
+
+def job_inputs(job):
+    if job["op"] == "edit":
+        return job_plan(job).inputs
+    return list(job["inputs"]) if job["op"] == "merge" else [job["input"]]
+
+
+def job_plan(job):
+    """编辑任务的编辑计划，任务中的 inputs 代替计划中的输入文件"""
+    plan = job["plan"]
+    plan = EditPlan.from_dict(plan) if isinstance(plan, dict) else EditPlan.load(plan)
+    return plan.with_inputs(job["inputs"]) if job.get("inputs") else plan
+
+
+def execute_job(job, repair=False):
+    """在当前进程中执行一个任务，返回结果信息；repair 为 True 时先修复输入文件"""
+    inputs = job_inputs(job)
+    repair_dir = None
+    if repair:
+        repair_dir = tempfile.mkdtemp(prefix="pdf-repair-")
+        inputs = [repair_copy(path, repair_dir) for path in inputs]
+
+    try:
+        output = job["output"]
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        options = {'compress': job.get("compress", False), 'flate': job.get("flate", False),
+                   'linearize': job.get("linearize", False), 'image_dpi': job.get("image_dpi")}
+        if job["op"] == "merge":
+            stats = merge_pdfs(inputs, output, streaming=job.get("streaming", True),
+                               dedup=job.get("dedup", False), **options)
+            return {key: stats[key] for key in ('pages', 'output_bytes', 'images') if key in stats}
+        if job["op"] == "edit":
+            stats = job_plan(job).with_inputs(inputs).execute(output, dedup=job.get("dedup", False),
+                                                              **options)
+            return {key: stats[key] for key in ('pages', 'output_bytes', 'images') if key in stats}
+
+        with PDFSession(inputs[0]) as session:
+            if job["op"] == "remove":
+                pages = parse_page_ranges(job["pages"], session.page_count)
+                if len(pages) == session.page_count:
+                    raise PageRangeError("不能删除全部页面")
+                result = remove_pages(session, pages, output, **options)
+            else:
+                rotations = RotationModel(session.page_count)
+                if job.get("auto_rotate"):
+                    from pdf_analysis import ORIENT_MIN_CONFIDENCE, detect_rotations
+                    # 工作进程不能再创建子进程，在本进程中逐页检测
+                    detect_rotations(session, rotations,
+                                     job.get("min_confidence", ORIENT_MIN_CONFIDENCE), max_workers=0)
+                rotations = parse_rotations(job.get("rotate") or [], session.page_count, rotations)
+                result = rotate_pages(session, rotations, output,
+                                      incremental=job.get("incremental", False), **options)
+        result['output_bytes'] = os.path.getsize(output)
+        return result
+    finally:
+        if repair_dir is not None:
+            shutil.rmtree(repair_dir, ignore_errors=True)
+
+
+def repair_copy(path, directory):
+    """用 PyMuPDF 打开（会重建损坏的交叉引用表）并另存一份，返回副本路径"""
+    import fitz
+
+    output = os.path.join(directory, f"{len(os.listdir(directory))}-{os.path.basename(path)}")
+    with fitz.open(path) as doc:
+        if doc.needs_pass:
+            raise ValueError("文件已加密，无法修复")
+        doc.save(output, garbage=1)
+    return output
+
+
+def _worker_main(conn):
+    """工作进程：逐个接收 (任务, 是否修复)，执行后回送结果，收到 None 时退出"""
+    # Ctrl+C 由主进程统一处理
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        job, repair = message
+        reset_stages()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            result = execute_job(job, repair)
+        except Exception as e:
+            reply = {'status': 'failed', 'error': f"{type(e).__name__}: {e}",
+                     'corrupt': not isinstance(e, PERMANENT_ERRORS)}
+        else:
+            reply = {'status': 'ok'}
+            reply.update(result)
+        reply['seconds'] = time.perf_counter() - start
+        reply['cpu_seconds'] = time.process_time() - cpu_start
+        reply['stages'] = stage_report()
+        conn.send(reply)
+        gc.collect()
+    conn.close()
+
+
+class _Worker:
+    """一个常驻工作进程及其管道"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.entry = None  # 正在执行的任务 (序号, 第几次尝试, 是否修复)
+        self.deadline = None
+        self.jobs_done = 0
+
+    def assign(self, entry, job, timeout):
+        self.entry = entry
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.conn.send((job, entry[2]))
+
+    def receive(self):
+        """取回结果，进程已退出时返回None"""
+        try:
+            reply = self.conn.recv()
+        except (EOFError, OSError):
+            return None
+        self.entry = None
+        self.jobs_done += 1
+        return reply
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def run_batch(jobs, workers=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+              on_result=None):
+    """并行执行任务列表，返回汇总字典
+
+    workers 默认为CPU核数；timeout 为单个任务的超时秒数（0 表示不限）；文件损坏
+    或工作进程崩溃的任务最多重试 retries 次，损坏的输入先修复再重试，超时的任务
+    不重试。on_result(序号, 结果) 在每个任务结束时调用。
+    """
+    for job in jobs:
+        validate_job(job)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs) or 1))
+    context = multiprocessing.get_context()
+
+    results = [None] * len(jobs)
+    pending = deque((index, 1, False) for index in range(len(jobs)))
+    pool = []
+    start = time.perf_counter()
+
+    def finish(entry, reply):
+        index, attempt, repair = entry
+        reply.update(attempts=attempt, repaired=repair)
+        # 文件损坏时修复后重试，进程崩溃时原样重试
+        retry = reply['status'] in ('failed', 'crashed') and attempt <= retries
+        if reply['status'] == 'failed' and not reply.pop('corrupt', False):
+            retry = False
+        if retry:
+            pending.appendleft((index, attempt + 1, repair or reply['status'] == 'failed'))
+            return
+        reply.pop('corrupt', None)
+        job = jobs[index]
+        results[index] = dict(op=job['op'], inputs=job_inputs(job), output=job['output'], **reply)
+        if on_result is not None:
+            on_result(index, results[index])
+
+    try:
+        while pending or any(worker.entry for worker in pool):
+            # 补足工作进程并分配任务
+            pool = [worker for worker in pool if worker.process.is_alive() or worker.entry]
+            while len(pool) < workers and pending:
+                pool.append(_Worker(context))
+            for worker in pool:
+                if worker.entry is None and pending:
+                    entry = pending.popleft()
+                    worker.assign(entry, jobs[entry[0]], timeout)
+
+            busy = [worker for worker in pool if worker.entry]
+            now = time.monotonic()
+            deadlines = [worker.deadline for worker in busy if worker.deadline]
+            wait_time = max(0.0, min(deadlines) - now) if deadlines else None
+            ready = wait([worker.conn for worker in busy] +
+                         [worker.process.sentinel for worker in busy], wait_time)
+
+            now = time.monotonic()
+            for worker in busy:
+                entry = worker.entry
+                if worker.conn in ready or worker.process.sentinel in ready:
+                    reply = worker.receive() if worker.conn.poll() else None
+                    if reply is None:
+                        # 进程意外退出（例如解析时崩溃）
+                        worker.kill()
+                        worker.entry = None
+                        finish(entry, {'status': 'crashed', 'seconds': 0.0,
+                                       'error': f"工作进程退出，代码 {worker.process.exitcode}"})
+                        continue
+                    finish(entry, reply)
+                    if worker.jobs_done >= MAX_JOBS_PER_WORKER:
+                        worker.stop()
+                elif worker.deadline and now >= worker.deadline:
+                    worker.kill()
+                    worker.entry = None
+                    _remove_partial_output(jobs[entry[0]]['output'])
+                    finish(entry, {'status': 'timeout', 'seconds': float(timeout),
+                                   'error': f"超过 {timeout} 秒未完成"})
+    finally:
+        for worker in pool:
+            if worker.entry:
+                worker.kill()
+                _remove_partial_output(jobs[worker.entry[0]]['output'])
+            elif worker.process.is_alive():
+                worker.stop()
+
+    elapsed = time.perf_counter() - start
+    done = [result for result in results if result is not None]
+    succeeded = sum(1 for result in done if result['status'] == 'ok')
+    return {
+        'jobs': len(jobs),
+        'succeeded': succeeded,
+        'failed': len(done) - succeeded,
+        'workers': workers,
+        'seconds': elapsed,
+        'job_seconds': sum(result['seconds'] for result in done),
+        'files_per_second': len(done) / elapsed if elapsed > 0 else 0.0,
+        'stages': merge_stage_reports(result.get('stages', {}) for result in done),
+        'results': results,
+    }
+
+
+def write_summary(summary, path):
+    """把汇总写成 JSON 文件"""
+    with atomic_output(path) as f:
+        f.write(json.dumps(summary, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+class BatchLog:
+    """批处理的结构化日志（JSON Lines）
+
+    每个任务结束时追加一行，包含时间、任务序号、输入输出、状态、耗时和各阶段指标；
+    最后一行为不含 results 的汇总。批处理中断时已写入的记录仍然保留。
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, index, result):
+        self._write({"event": "job", "index": index, **result})
+
+    def write_summary(self, summary):
+        self._write({"event": "summary", **{key: value for key, value in summary.items()
+                                             if key != 'results'}})
+
+    def _write(self, record):
+        record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), **record}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _remove_partial_output(output):
+    # 被终止的进程来不及删除 atomic_output 的临时文件
+    directory = os.path.dirname(os.path.abspath(output))
+    pattern = os.path.join(glob.escape(directory), f".{glob.escape(os.path.basename(output))}.*.tmp")
+    for path in glob.glob(pattern):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,279 @@
+"""性能基准测试
+
+在本地生成一组固定的合成PDF（纯文本、扫描图像、大量小文件、一个超大文件），
+测量加载、缩略图渲染、删除/旋转保存和合并的耗时、峰值内存和输出大小，结果写入
+JSON，并与保存的基准结果比较，超出容差的项目视为性能退化（退出码为1）。
+
+    python pdf_benchmark.py                       运行并与 benchmark_baseline.json 比较
+    python pdf_benchmark.py --save-baseline       运行并把结果保存为新的基准
+    python pdf_benchmark.py --scale 0.2 -k merge  缩小数据规模，只运行名称含 merge 的项目
+
+每个项目在独立的进程中运行，峰值内存只包含该项目本身；耗时取多次运行的最小值。
+合成文件由固定的随机种子生成，同样的参数在任何机器上得到同样的文件。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 合成文件的生成方式变化时加一，使旧的缓存文件失效
+CORPUS_VERSION = 1
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "pdf-tools-benchmark")
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+# 与基准比较时允许的相对误差（PyPDF2 PdfWriter 每次写出的大小有几个百分点的波动）
+DEFAULT_TOLERANCE = {'seconds': 0.25, 'peak_rss': 0.20, 'output_bytes': 0.05}
+
+# 合成文件 {名称: (类型, 页数, 文件数)}，页数和文件数乘以 --scale
+CORPUS = {
+    'text': ("text", 200, 1),
+    'scans': ("scan", 40, 1),
+    'small': ("text", 2, 200),
+    'huge': ("mixed", 3000, 1),
+}
+
+_WORDS = ("PDF", "merge", "page", "rotate", "scan", "report", "invoice", "table",
+          "文档", "页面", "合并", "旋转", "数据", "报告")
+
+
+def corpus_files(name, scale, corpus_dir):
+    """返回某组合成文件的路径列表，文件不存在时生成"""
+    kind, pages, count = CORPUS[name]
+    pages = max(1, int(pages * scale))
+    count = max(2, int(count * scale)) if count > 1 else 1
+    directory = os.path.join(corpus_dir, f"v{CORPUS_VERSION}-{name}-{kind}-{pages}p")
+    paths = [os.path.join(directory, f"{name}-{index:04d}.pdf") for index in range(count)]
+    for index, path in enumerate(paths):
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            _generate(path, kind, pages, seed=f"{name}-{index}")
+    return paths
+
+
+def _generate(path, kind, pages, seed):
+    """按固定随机种子生成一个PDF文件"""
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_num in range(pages):
+        width, height = rng.choice(((595, 842), (842, 595), (612, 792)))
+        page = doc.new_page(width=width, height=height)
+        if kind == "scan" or (kind == "mixed" and page_num % 50 == 0):
+            # 接近扫描件的图像：灰度渐变叠加噪声，压缩率与真实扫描件相近
+            side = 600 if kind == "scan" else 300
+            noise = rng.randbytes(side * side)
+            samples = bytes((x // 3 + noise[x] // 4) & 0xFF for x in range(side * side))
+            pix = fitz.Pixmap(fitz.csGRAY, side, side, samples, False)
+            page.insert_image(page.rect, pixmap=pix)
+        else:
+            y = 50
+            while y < height - 50:
+                line = " ".join(rng.choice(_WORDS[:8]) for _ in range(rng.randint(4, 12)))
+                page.insert_text((40, y), line, fontsize=10)
+                y += 14
+        page.set_rotation(rng.choice((0, 0, 0, 90)))
+    doc.save(path, garbage=1, deflate=True)
+    doc.close()
+
+
+def _timed(func, repeat):
+    """重复执行 func，返回 (最短耗时, 最后一次的返回值)"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_load(paths, output_dir, repeat):
+    from pdf_session import PDFSession
+
+    def run():
+        with PDFSession(paths[0]) as session:
+            return session.page_count
+    return _timed(run, repeat)[0], None
+
+
+def bench_thumbnails(paths, output_dir, repeat, pages=48):
+    """在进程池中渲染前 pages 页的缩略图（不使用磁盘缓存）"""
+    from pdf_preview import render_thumbnail
+    from pdf_session import PDFSession
+
+    with PDFSession(paths[0]) as session:
+        count, stamp = min(pages, session.page_count), session.stamp
+    workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+    def run():
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(render_thumbnail, paths[0], stamp, page_num)
+                       for page_num in range(count)]
+            return sum(len(future.result()[0][3]) for future in futures)
+    return _timed(run, repeat)[0], None
+
+
+def bench_remove(paths, output_dir, repeat, passthrough=True):
+    from pdf_core import remove_pages
+    from pdf_session import PDFSession
+
+    output = os.path.join(output_dir, "removed.pdf")
+
+    def run():
+        with PDFSession(paths[0]) as session:
+            remove_pages(session, set(range(0, session.page_count, 2)), output, passthrough=passthrough)
+    return _timed(run, repeat)[0], output
+
+
+def bench_rotate(paths, output_dir, repeat):
+    from pdf_core import rotate_pages
+    from pdf_session import PDFSession
+
+    output = os.path.join(output_dir, "rotated.pdf")
+
+    def run():
+        with PDFSession(paths[0]) as session:
+            rotate_pages(session, dict.fromkeys(range(session.page_count), 90), output)
+    return _timed(run, repeat)[0], output
+
+
+def _bench_merge(streaming, dedup, copies=1):
+    """合并文件组中的所有文件；copies 大于1时把文件组重复多次（用于单个文件）"""
+    def bench(paths, output_dir, repeat):
+        from pdf_core import merge_pdfs
+
+        inputs = paths * copies
+        output = os.path.join(output_dir, "merged.pdf")
+        return _timed(lambda: merge_pdfs(inputs, output, streaming=streaming, dedup=dedup),
+                      repeat)[0], output
+    return bench
+
+
+# 基准项目 {名称: (合成文件组, 测量函数)}
+CASES = {
+    'load-huge': ("huge", bench_load),
+    'thumbnails-text': ("text", bench_thumbnails),
+    'thumbnails-scans': ("scans", bench_thumbnails),
+    'remove-text': ("text", bench_remove),
+    'remove-huge': ("huge", bench_remove),
+    'remove-huge-classic': ("huge", lambda *args: bench_remove(*args, passthrough=False)),
+    'rotate-scans': ("scans", bench_rotate),
+    'rotate-huge': ("huge", bench_rotate),
+    'merge-small': ("small", _bench_merge(streaming=True, dedup=False)),
+    'merge-small-classic': ("small", _bench_merge(streaming=False, dedup=False)),
+    'merge-small-dedup': ("small", _bench_merge(streaming=True, dedup=True)),
+    'merge-scans': ("scans", _bench_merge(streaming=True, dedup=False, copies=4)),
+}
+
+
+def _run_case(name, paths, repeat):
+    """在独立进程中执行一个基准项目"""
+    from pdf_metrics import peak_rss
+
+    bench = CASES[name][1]
+    with tempfile.TemporaryDirectory(prefix="pdf-bench-") as output_dir:
+        seconds, output = bench(paths, output_dir, repeat)
+        return {
+            'seconds': seconds,
+            'peak_rss': peak_rss(),
+            'output_bytes': os.path.getsize(output) if output else None,
+            'input_bytes': sum(os.path.getsize(path) for path in paths),
+        }
+
+
+def run_benchmarks(names, scale=1.0, repeat=3, corpus_dir=DEFAULT_CORPUS_DIR, log=print):
+    """运行基准项目，返回结果字典"""
+    import fitz
+    import PyPDF2
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        paths = corpus_files(CASES[name][0], scale, corpus_dir)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[name] = executor.submit(_run_case, name, paths, repeat).result()
+        log(f"{name:<22} {results[name]['seconds']:8.3f} 秒  "
+            f"{results[name]['peak_rss'] / 1048576:7.1f} MB")
+
+    return {
+        'meta': {
+            'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'PyPDF2': PyPDF2.__version__,
+            'PyMuPDF': fitz.VersionBind,
+            'corpus_version': CORPUS_VERSION,
+            'scale': scale,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """与基准比较，返回退化项目列表 [(项目, 指标, 基准值, 当前值)]"""
+    regressions = []
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        for metric, allowed in tolerance.items():
+            old, new = base.get(metric), result.get(metric)
+            if old and new is not None and new > old * (1 + allowed):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF工具性能基准测试")
+    parser.add_argument("-k", "--filter", help="只运行名称包含该字符串的项目")
+    parser.add_argument("--scale", type=float, default=1.0, help="数据规模倍数（默认 1）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个项目运行次数，取最短耗时")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR, help="合成文件缓存目录")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="结果文件")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基准结果文件")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基准")
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES if not args.filter or args.filter in name]
+    if not names:
+        parser.error(f"没有名称包含 {args.filter} 的项目")
+
+    current = run_benchmarks(names, args.scale, args.repeat, args.corpus_dir)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"已保存基准: {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except OSError:
+        print(f"没有基准文件 {args.baseline}，跳过比较（可用 --save-baseline 生成）")
+        return 0
+
+    if baseline['meta'].get('scale') != args.scale:
+        print(f"警告: 基准的数据规模为 {baseline['meta'].get('scale')}，与本次不同")
+    regressions = compare(current, baseline)
+    for name, metric, old, new in regressions:
+        print(f"性能退化: {name} {metric} {old:.4g} -> {new:.4g}（{(new / old - 1) * 100:+.0f}%）")
+    if not regressions:
+        print("与基准相比没有性能退化")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+"""PDF工具命令行入口
+
+不需要图形界面，可在服务器上批量处理：
+
+    python pdf_cli.py merge "scans/*.pdf" extra.pdf -o merged.pdf
+    python pdf_cli.py merge @list.txt -o merged.pdf --dedup --compress
+    python pdf_cli.py remove input.pdf -p "1-3,7,10-" -o output.pdf
+    python pdf_cli.py rotate input.pdf -r "1-3:90" -r "5:180" -o output.pdf
+    python pdf_cli.py rotate scan.pdf --auto --incremental
+    python pdf_cli.py edit a.pdf b.pdf --remove each/1 --rotate landscape:90 -o out.pdf --save-plan plan.json
+    python pdf_cli.py edit --plan plan.json c.pdf d.pdf -o out2.pdf
+    python pdf_cli.py batch "in/*.pdf" --remove 1 --out-dir out -j 8
+    python pdf_cli.py batch --jobs jobs.jsonl --summary summary.json --log batch.jsonl
+    python pdf_cli.py --stages --profile merge.folded merge a.pdf b.pdf -o ab.pdf
+
+合并的输入可以是文件、通配符或以 @ 开头的清单文件（每行一个路径或通配符，
+忽略空行和 # 开头的注释行，相对路径相对于清单文件所在目录）。
+
+--stages 在命令结束后输出各阶段（解析、复制页面、写出等）的耗时、CPU时间、读写
+字节数和峰值内存；--profile 在运行期间采样调用栈，写成可生成火焰图的折叠调用栈。
+
+写出文件的命令都支持 --compress（对象流和交叉引用流，PDF 1.5）和 --flate（重新
+压缩未压缩的流），输出更小，阅读器解析更快；--linearize 写出线性化文件（快速 Web
+视图），浏览器边下载边显示，下载完开头部分即可显示第一页；--image-dpi 把有效分辨率
+超过目标（默认 150dpi）的图像重新采样，并输出每个图像节省的字节数。
+"""
+import argparse
+import glob
+import os
+import sys
+from pdf_batch import BatchLog, DEFAULT_RETRIES, DEFAULT_TIMEOUT, load_jobs, run_batch, write_summary
+from pdf_core import merge_pdfs, parse_page_ranges, parse_rotations, remove_pages, rotate_pages
+from pdf_metrics import SamplingProfiler, format_bytes, format_stage_report, stage_report
+from pdf_plan import EditPlan
+from pdf_rotation import RotationModel
+from pdf_selection import PageSelection
+from pdf_session import PDFSession
+
+
+class CommandError(Exception):
+    """命令行参数或输入文件有误"""
+
+
+def expand_inputs(items):
+    """展开通配符和 @清单文件，按给出的顺序返回输入文件列表"""
+    paths = []
+    for item in items:
+        if item.startswith("@"):
+            paths.extend(_read_manifest(item[1:]))
+        else:
+            paths.extend(_expand_pattern(item))
+    return paths
+
+
+def _read_manifest(manifest):
+    try:
+        with open(manifest, "r", encoding="utf-8-sig") as f:
+            lines = f.read().splitlines()
+    except OSError as e:
+        raise CommandError(f"无法读取清单文件 {manifest}: {e.strerror}") from None
+
+    base = os.path.dirname(os.path.abspath(manifest))
+    paths = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        paths.extend(_expand_pattern(os.path.join(base, os.path.expanduser(line))))
+    return paths
+
+
+def _expand_pattern(pattern):
+    if not glob.has_magic(pattern):
+        if not os.path.isfile(pattern):
+            raise CommandError(f"文件不存在: {pattern}")
+        return [pattern]
+
+    # 通配符匹配结果按文件名排序，保证每次合并顺序一致
+    matches = sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+    if not matches:
+        raise CommandError(f"没有匹配的文件: {pattern}")
+    return matches
+
+
+def default_output(input_path, suffix):
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(os.path.dirname(input_path), base_name + suffix)
+
+
+def check_output(output_path, input_paths):
+    # 输入文件在处理期间保持打开，不能直接覆盖
+    output = os.path.abspath(output_path)
+    if any(os.path.abspath(path) == output for path in input_paths):
+        raise CommandError(f"输出文件不能与输入文件相同: {output_path}")
+
+
+def cmd_merge(args):
+    paths = expand_inputs(args.inputs)
+    if len(paths) < 2:
+        raise CommandError("请至少指定2个PDF文件进行合并")
+    output = args.output or default_output(paths[0], "_merged.pdf")
+    check_output(output, paths)
+
+    stats = merge_pdfs(paths, output, streaming=not args.classic, dedup=args.dedup,
+                       compress=args.compress, flate=args.flate, linearize=args.linearize,
+                       image_dpi=args.image_dpi)
+    print(f"已合并 {stats['files']} 个文件，共 {stats['pages']} 页: {output}")
+    print(f"耗时: {stats['seconds']:.1f} 秒，速度: {format_bytes(stats['throughput'])}/秒，"
+          f"峰值内存: {format_bytes(stats['peak_rss'])}")
+    if stats['dedup_objects']:
+        print(f"去重: 合并了 {stats['dedup_objects']} 个相同对象，"
+              f"节省 {format_bytes(stats['bytes_saved'])}")
+    print_image_report(stats)
+
+
+def cmd_remove(args):
+    from pdf_prune import format_prune_report
+
+    output = args.output or default_output(args.input, "_deleted.pdf")
+    check_output(output, [args.input])
+    with PDFSession(args.input) as session:
+        pages_to_delete = parse_page_ranges(args.pages, session.page_count)
+        if len(pages_to_delete) == session.page_count:
+            raise CommandError("不能删除全部页面")
+        result = remove_pages(session, pages_to_delete, output, compress=args.compress,
+                              flate=args.flate, linearize=args.linearize, image_dpi=args.image_dpi)
+    print(f"已删除 {result['removed']} 页，剩余 {result['pages']} 页: {output}")
+    for line in format_prune_report(result):
+        print(line)
+    print_image_report(result)
+
+
+def cmd_rotate(args):
+    if args.in_place:
+        if args.output:
+            raise CommandError("--in-place 直接修改输入文件，不能同时指定 --output")
+        output = args.input
+    else:
+        output = args.output or default_output(args.input, "_rotated.pdf")
+        check_output(output, [args.input])
+    if not args.rotate and not args.auto:
+        raise CommandError("请用 -r 指定旋转设置，或使用 --auto 自动检测方向")
+    if args.in_place and (args.compress or args.flate):
+        raise CommandError("--in-place 只追加修改的页面，不能同时压缩输出")
+    if args.in_place and args.linearize:
+        raise CommandError("--in-place 只追加修改的页面，不能同时线性化输出")
+    if args.in_place and args.image_dpi is not None:
+        raise CommandError("--in-place 只追加修改的页面，不能同时重新采样图像")
+    with PDFSession(args.input) as session:
+        rotations = RotationModel(session.page_count)
+        if args.auto:
+            from pdf_analysis import detect_rotations
+            uncertain = detect_rotations(session, rotations, args.min_confidence)
+            if uncertain:
+                pages = PageSelection.from_pages(uncertain, session.page_count)
+                print(f"{len(uncertain)} 页方向需要人工检查，未旋转: {pages.to_expression()}")
+        # -r 的设置覆盖自动检测的结果
+        rotations = parse_rotations(args.rotate or [], session.page_count, rotations)
+        result = rotate_pages(session, rotations, output, incremental=args.incremental,
+                              in_place=args.in_place, compress=args.compress, flate=args.flate,
+                              linearize=args.linearize, image_dpi=args.image_dpi)
+    print(f"已旋转 {result['rotated']} 页，共 {result['pages']} 页: {output}")
+    print_image_report(result)
+
+
+def cmd_edit(args):
+    plan = EditPlan.load(args.plan) if args.plan else EditPlan()
+    if args.inputs:
+        # 命令行指定的输入文件代替计划中保存的输入文件
+        plan = plan.with_inputs(expand_inputs(args.inputs))
+    if not plan.inputs:
+        raise CommandError("请指定输入文件，或使用 --plan 指定包含输入文件的编辑计划")
+    for op, value in args.steps or ():
+        add_plan_step(plan, op, value)
+
+    output = args.output or default_output(plan.inputs[0], "_edited.pdf")
+    check_output(output, plan.inputs)
+    if args.save_plan:
+        plan.save(args.save_plan)
+
+    stats = plan.execute(output, dedup=args.dedup, compress=args.compress, flate=args.flate,
+                         linearize=args.linearize, image_dpi=args.image_dpi)
+    print(f"已处理 {stats['files']} 个文件，输出 {stats['pages']} 页: {output}")
+    print(f"耗时: {stats['seconds']:.1f} 秒，速度: {format_bytes(stats['throughput'])}/秒，"
+          f"峰值内存: {format_bytes(stats['peak_rss'])}")
+    print_image_report(stats)
+
+
+def print_image_report(result):
+    """输出重新采样图像的报告（指定了 --image-dpi 时）"""
+    if result.get('images'):
+        from pdf_images import format_image_report
+        for line in format_image_report(result['images']):
+            print(line)
+
+
+def add_plan_step(plan, op, value):
+    # 值形如 [范围/]页码范围[:角度]，范围为 each 或从1开始的文件序号，省略时为合并后的页码
+    scope = None
+    if "/" in value:
+        prefix, value = value.split("/", 1)
+        if prefix == "each":
+            scope = "each"
+        elif prefix.isdigit() and int(prefix) >= 1:
+            scope = int(prefix)
+        else:
+            raise CommandError(f"范围应为 each 或从1开始的文件序号，而不是 {prefix}")
+    if op == "remove":
+        plan.remove(value, scope)
+        return
+    for spec in value.split(";"):
+        if ":" not in spec:
+            raise CommandError(f"旋转设置应为 页码范围:角度，例如 landscape:90，而不是 {spec}")
+        pages, angle = spec.rsplit(":", 1)
+        try:
+            angle = int(angle)
+        except ValueError:
+            raise CommandError(f"无法识别的旋转角度: {angle}") from None
+        plan.rotate(pages, angle, scope)
+
+
+def cmd_batch(args):
+    if args.jobs:
+        if args.inputs or args.remove or args.rotate or args.auto_rotate:
+            raise CommandError("--jobs 不能与输入文件、--remove、--rotate、--auto-rotate 同时使用")
+        jobs = load_jobs(args.jobs, expand_inputs)
+    else:
+        jobs = build_jobs(args)
+
+    total = len(jobs)
+    done = [0]
+
+    log = BatchLog(args.log) if args.log else None
+
+    def report(index, result):
+        done[0] += 1
+        status = "完成" if result['status'] == 'ok' else f"失败（{result.get('error', result['status'])}）"
+        print(f"[{done[0]}/{total}] {result['inputs'][0]} {result['seconds']:.2f} 秒 {status}")
+        if log is not None:
+            log.write(index, result)
+
+    try:
+        summary = run_batch(jobs, workers=args.workers, timeout=args.timeout,
+                            retries=args.retries, on_result=report)
+        if log is not None:
+            log.write_summary(summary)
+    finally:
+        if log is not None:
+            log.close()
+    write_summary(summary, args.summary)
+    if args.stages:
+        # 各任务在工作进程中执行，阶段指标取自汇总
+        print("\n".join(format_stage_report(summary['stages'])))
+    print(f"共 {summary['jobs']} 个任务，成功 {summary['succeeded']} 个，失败 {summary['failed']} 个，"
+          f"耗时 {summary['seconds']:.1f} 秒（{summary['workers']} 个进程，"
+          f"{summary['files_per_second']:.1f} 个文件/秒），汇总: {args.summary}")
+    return 1 if summary['failed'] else 0
+
+
+def build_jobs(args):
+    # 对每个输入文件执行同一个删除或旋转操作，输出到 --out-dir 中的同名文件
+    rotate = bool(args.rotate or args.auto_rotate)
+    if bool(args.remove) == rotate:
+        raise CommandError("请指定 --remove 或 --rotate/--auto-rotate 之一，或使用 --jobs 任务文件")
+    if not args.out_dir:
+        raise CommandError("批量删除或旋转需要指定 --out-dir 输出目录")
+
+    jobs = []
+    outputs = set()
+    for path in expand_inputs(args.inputs):
+        output = os.path.join(args.out_dir, os.path.basename(path))
+        check_output(output, [path])
+        if output in outputs:
+            raise CommandError(f"多个输入文件同名，输出会相互覆盖: {os.path.basename(path)}")
+        outputs.add(output)
+        if args.remove:
+            job = {"op": "remove", "input": path, "pages": args.remove, "output": output}
+        else:
+            job = {"op": "rotate", "input": path, "rotate": args.rotate, "output": output,
+                   "incremental": args.incremental, "auto_rotate": args.auto_rotate}
+        job.update(compress=args.compress, flate=args.flate, linearize=args.linearize,
+                   image_dpi=args.image_dpi)
+        jobs.append(job)
+    if not jobs:
+        raise CommandError("没有指定输入文件")
+    return jobs
+
+
+def add_output_arguments(parser):
+    from pdf_images import DEFAULT_DPI
+
+    parser.add_argument("--compress", action="store_true",
+                        help="把非流对象压缩进对象流并写出交叉引用流（PDF 1.5），减小输出文件")
+    parser.add_argument("--flate", action="store_true", help="用 Flate 重新压缩未压缩的内容流和其它流")
+    parser.add_argument("--linearize", action="store_true",
+                        help="写出线性化文件（快速 Web 视图），与 --compress 同时指定时不使用对象流")
+    parser.add_argument("--image-dpi", type=int, nargs="?", const=DEFAULT_DPI, metavar="DPI",
+                        help=f"把有效分辨率超过 DPI（默认 {DEFAULT_DPI}）的图像重新采样并重新压缩")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pdf_cli", description="PDF合并、删除页面和旋转页面")
+    parser.add_argument("--stages", action="store_true",
+                        help="结束后输出各阶段的耗时、CPU时间、读写字节数和峰值内存")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="采样分析调用栈，结果写成折叠调用栈（可用 flamegraph.pl 生成火焰图）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    merge = subparsers.add_parser("merge", help="按顺序合并PDF文件")
+    merge.add_argument("inputs", nargs="+", help="输入文件、通配符或 @清单文件")
+    merge.add_argument("-o", "--output", help="输出文件（默认为 第一个文件名_merged.pdf）")
+    merge.add_argument("--dedup", action="store_true", help="合并相同的字体和图像，减小输出文件")
+    merge.add_argument("--classic", action="store_true",
+                       help="一次性读入所有文件后写出（默认使用低内存的流式合并）")
+    add_output_arguments(merge)
+    merge.set_defaults(func=cmd_merge)
+
+    remove = subparsers.add_parser("remove", help="删除页面")
+    remove.add_argument("input", help="输入文件")
+    remove.add_argument("-p", "--pages", required=True,
+                        help='要删除的页码范围，从1开始，例如 "1-3,7,10-"、"odd"、"even"')
+    remove.add_argument("-o", "--output", help="输出文件（默认为 文件名_deleted.pdf）")
+    add_output_arguments(remove)
+    remove.set_defaults(func=cmd_remove)
+
+    rotate = subparsers.add_parser("rotate", help="旋转页面")
+    rotate.add_argument("input", help="输入文件")
+    rotate.add_argument("-r", "--rotate", action="append",
+                        help='页码范围:顺时针角度，例如 "1-3:90"、"all:180"，可多次指定')
+    rotate.add_argument("--auto", action="store_true",
+                        help="按文字方向自动旋转（扫描件不自动旋转竖排和上下颠倒的页面），-r 的设置优先")
+    rotate.add_argument("--min-confidence", type=float, default=0.3,
+                        help="自动旋转只应用置信度不低于此值（0~1）的页面（默认 0.3）")
+    rotate.add_argument("-o", "--output", help="输出文件（默认为 文件名_rotated.pdf）")
+    rotate.add_argument("--incremental", action="store_true",
+                        help="增量更新：复制原文件并只追加修改的页面，耗时与文件大小无关")
+    rotate.add_argument("--in-place", action="store_true", help="以增量更新方式直接修改输入文件")
+    add_output_arguments(rotate)
+    rotate.set_defaults(func=cmd_rotate)
+
+    edit = subparsers.add_parser("edit", help="合并、删除和旋转一次完成，可保存为编辑计划")
+    edit.add_argument("inputs", nargs="*", help="输入文件、通配符或 @清单文件（代替计划中的输入文件）")
+    edit.add_argument("--plan", help="先执行已保存的编辑计划中的操作")
+    edit.add_argument("--remove", dest="steps", action="append", metavar="[范围/]页码",
+                      type=lambda value: ("remove", value),
+                      help='删除页面，例如 "each/1"（每个文件的第1页）、"2/3-4"、"70-"，可多次指定')
+    edit.add_argument("--rotate", dest="steps", action="append", metavar="[范围/]页码:角度",
+                      type=lambda value: ("rotate", value),
+                      help='旋转页面，例如 "landscape:90"、"each/1:180"，可多次指定')
+    edit.add_argument("-o", "--output", help="输出文件（默认为 第一个文件名_edited.pdf）")
+    edit.add_argument("--dedup", action="store_true", help="合并相同的字体和图像，减小输出文件")
+    edit.add_argument("--save-plan", help="把编辑计划保存为 JSON，之后可用 --plan 重新执行")
+    add_output_arguments(edit)
+    edit.set_defaults(func=cmd_edit)
+
+    batch = subparsers.add_parser("batch", help="多进程批量删除、旋转或合并")
+    batch.add_argument("inputs", nargs="*", help="输入文件、通配符或 @清单文件")
+    batch.add_argument("--remove", metavar="PAGES", help="对每个文件删除这些页面")
+    batch.add_argument("--rotate", action="append", metavar="SPEC",
+                       help="对每个文件按 页码范围:角度 旋转，可多次指定")
+    batch.add_argument("--auto-rotate", action="store_true", help="对每个文件自动检测方向并旋转")
+    batch.add_argument("--incremental", action="store_true", help="旋转时以增量更新方式保存")
+    add_output_arguments(batch)
+    batch.add_argument("--out-dir", help="输出目录，输出文件与输入文件同名")
+    batch.add_argument("--jobs", help="任务文件（JSON 数组或每行一个 JSON 对象），可包含合并任务")
+    batch.add_argument("-j", "--workers", type=int, help="工作进程数（默认为CPU核数）")
+    batch.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                       help=f"单个任务的超时秒数，0 表示不限（默认 {DEFAULT_TIMEOUT}）")
+    batch.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                       help=f"文件损坏或进程崩溃时的重试次数（默认 {DEFAULT_RETRIES}）")
+    batch.add_argument("--summary", default="batch_summary.json", help="JSON 汇总文件")
+    batch.add_argument("--log", help="结构化日志文件（JSON Lines，每个任务结束时追加一行）")
+    batch.set_defaults(func=cmd_batch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    profiler = SamplingProfiler().start() if args.profile else None
+    try:
+        code = args.func(args) or 0
+    except (CommandError, ValueError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+    except Exception as e:
+        print(f"处理失败: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.write_collapsed(args.profile)
+    if args.stages and args.command != "batch":
+        print("\n".join(format_stage_report(stage_report())))
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
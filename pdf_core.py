@@ -0,0 +1,324 @@
+"""PDF页面操作核心
+
+合并、删除页面和旋转页面的实现，不依赖 Tk，图形界面和命令行（pdf_cli.py）共用。
+所有操作都写入临时文件后原子替换输出文件；task 参数可选，提供
+report(进度, 消息) 和 check_cancelled()（例如 pdf_tasks.BackgroundTask）。
+删除和旋转默认原样复制未修改的对象（见 pdf_passthrough），文件不支持时
+（例如已加密）改用 PyPDF2 的 PdfWriter 重新序列化。
+各操作的 compress 参数把非流对象压缩进对象流并写出交叉引用流（PDF 1.5），flate
+参数用 Flate 重新压缩未压缩的流（见 pdf_stream_writer）；PdfWriter 不支持这两种
+输出，指定时改用流式写出。linearize 参数写出线性化文件（快速 Web 视图，见
+pdf_linearize），线性化文件不使用对象流，此时忽略 compress。image_dpi 参数把有效
+分辨率超过它的图像重新采样（见 pdf_images），结果中的 'images' 为图像统计信息。
+"""
+import os
+import time
+from pdf_metrics import peak_rss, stage
+from pdf_rotation import RotationModel
+from pdf_selection import PageRangeError, PageSelection
+from pdf_startup import lazy_import
+from pdf_tasks import NullTask, ProgressWriter, atomic_output
+
+PyPDF2 = lazy_import("PyPDF2")
+
+# 允许的旋转角度（顺时针）
+VALID_ANGLES = (0, 90, 180, 270)
+
+
+def parse_page_ranges(expression, page_count):
+    """解析页码范围表达式，返回 PageSelection（从0开始的页码集合）
+
+    页码从1开始，用逗号分隔，例如 "1-3,7,10-"：1到3页、第7页、第10页到最后一页；
+    "-5" 表示第1到5页，"odd"/"even" 表示奇数/偶数页，"all" 表示全部页面。
+    页码超出范围时抛出 PageRangeError。
+    """
+    return PageSelection.parse(expression, page_count)
+
+
+def parse_rotations(specs, page_count, rotations=None):
+    """解析旋转设置，返回 RotationModel（页码从0开始）
+
+    每项形如 "页码范围:角度"，例如 "1-3:90"、"all:180"，页码范围语法同
+    parse_page_ranges；多项用分号分隔或以列表传入，后面的设置覆盖前面的。
+    提供 rotations 时在其基础上继续设置（例如覆盖自动检测的结果）。
+    """
+    if isinstance(specs, str):
+        specs = [specs]
+
+    if rotations is None:
+        rotations = RotationModel(page_count)
+    for spec in (item for entry in specs for item in entry.split(";")):
+        spec = spec.strip()
+        if not spec:
+            continue
+        if ":" not in spec:
+            raise PageRangeError(f"旋转设置应为 页码范围:角度，例如 1-3:90，而不是 {spec}")
+        expression, angle = spec.rsplit(":", 1)
+        try:
+            angle = int(angle) % 360
+        except ValueError:
+            raise PageRangeError(f"无法识别的旋转角度: {angle}") from None
+        if angle not in VALID_ANGLES:
+            raise PageRangeError(f"旋转角度必须是90的倍数: {angle}")
+
+        rotations.set_pages(parse_page_ranges(expression, page_count), angle)
+    return rotations
+
+
+def remove_pages(session, pages_to_delete, output_path, task=None, passthrough=True, compress=False,
+                 flate=False, linearize=False, image_dpi=None):
+    """删除 pages_to_delete 中的页面（PageSelection 或从0开始的页码集合），结果写入 output_path
+
+    passthrough 为 False 时不原样复制对象，总是用 PdfWriter 重新序列化。返回
+    {'pages': 保留的页数, 'removed': 删除的页数, 'input_bytes': 原文件字节数,
+    'output_bytes': 输出字节数}；原样复制时另有 'pruned'（删除的书签、命名目标、
+    链接和表单域个数）和 'reclaimed'（按类型统计未写入的对象，见 pdf_prune）。
+    """
+    task = task or NullTask()
+    compress = compress and not linearize
+    images = {'dpi': image_dpi} if image_dpi is not None else None
+    session.check_unchanged()
+    reader = session.reader
+
+    total = len(reader.pages)
+    if not isinstance(pages_to_delete, PageSelection):
+        pages_to_delete = PageSelection.from_pages(pages_to_delete, total)
+    # 按区间遍历保留的页面，不逐页判断是否删除
+    pages_to_keep = pages_to_delete.copy()
+    pages_to_keep.page_count = total
+    pages_to_keep.invert()
+
+    kept = len(pages_to_keep)
+    result = {'pages': kept, 'removed': total - kept, 'input_bytes': session.size}
+    if images is not None:
+        result['images'] = images
+    pages = [(page_num, 0) for page_num in pages_to_keep]
+    stats = passthrough and _write_passthrough(session, pages, output_path, task, compress, flate,
+                                               linearize, images)
+    if stats:
+        result.update(output_bytes=stats['output_bytes'], pruned=stats['pruned'],
+                      reclaimed=stats['reclaimed'])
+        return result
+    if compress or flate:
+        result['output_bytes'] = _write_streaming(session, pages, output_path, task, compress, flate,
+                                                  linearize, images)
+        return result
+
+    writer = PyPDF2.PdfWriter()
+    with stage("copy-pages"):
+        for index, page_num in enumerate(pages_to_keep):
+            task.check_cancelled()
+            writer.add_page(reader.pages[page_num])
+            task.report(0.2 * (index + 1) / kept, f"正在处理页面 {page_num + 1}/{total}")
+
+    expected_bytes = session.size * kept // max(total, 1)
+    output = open_output(output_path, task, linearize, images, compress, flate)
+    with output as output_file, stage("write") as record:
+        progress = ProgressWriter(output_file, task, expected_bytes, start=0.2)
+        writer.write(progress)
+        record.bytes_written = progress.written
+    result['output_bytes'] = os.path.getsize(output_path) if linearize or images else progress.written
+    return result
+
+
+def rotate_pages(session, rotations, output_path, task=None, incremental=False, in_place=False,
+                 passthrough=True, compress=False, flate=False, linearize=False, image_dpi=None):
+    """按 rotations（RotationModel 或 {从0开始的页码: 顺时针角度}）旋转页面，结果写入 output_path
+
+    incremental 为 True 时以增量更新方式保存（见 pdf_incremental），文件不支持
+    增量更新时改为完整重写；in_place 为 True 时直接追加到原文件。完整重写时
+    passthrough 为 False 则不原样复制对象。增量更新只追加修改的页面，指定 compress、
+    flate、linearize 或 image_dpi 时忽略 incremental（in_place 仍然追加）。返回
+    {'pages': 总页数, 'rotated': 旋转的页数}，完整重写时另有 'input_bytes' 和
+    'output_bytes'，增量更新时另有 'appended_bytes'（见 pdf_incremental）。
+    """
+    task = task or NullTask()
+    compress = compress and not linearize
+    images = {'dpi': image_dpi} if image_dpi is not None else None
+    if incremental and (compress or flate or linearize or images):
+        incremental = False
+    if incremental or in_place:
+        from pdf_incremental import IncrementalUpdateError, check_incremental, rotate_incremental
+        try:
+            check_incremental(session)
+        except IncrementalUpdateError:
+            if in_place:
+                raise
+        else:
+            return rotate_incremental(session, rotations, output_path, task, in_place=in_place)
+
+    session.check_unchanged()
+    reader = session.reader
+
+    total = len(reader.pages)
+    result = {'pages': total, 'rotated': sum(1 for _, angle in rotations.items() if angle % 360),
+              'input_bytes': session.size}
+    if images is not None:
+        result['images'] = images
+    pages = [(page_num, rotations.get(page_num, 0)) for page_num in range(total)]
+    stats = passthrough and _write_passthrough(session, pages, output_path, task, compress, flate,
+                                               linearize, images)
+    if stats:
+        result['output_bytes'] = stats['output_bytes']
+        return result
+    if compress or flate:
+        result['output_bytes'] = _write_streaming(session, pages, output_path, task, compress, flate,
+                                                  linearize, images)
+        return result
+
+    writer = PyPDF2.PdfWriter()
+    with stage("copy-pages"):
+        for page_num in range(total):
+            task.check_cancelled()
+            # add_page 返回写入器中的页面副本，旋转副本不会影响会话中的原页面
+            page = writer.add_page(reader.pages[page_num])
+
+            # 应用旋转（如果有的话）
+            angle = rotations.get(page_num, 0)
+            if angle % 360:
+                page.rotate(angle)
+                # PyPDF2 直接累加角度，例如 90 + 270 得到 360，规范到 0~270
+                page[PyPDF2.generic.NameObject("/Rotate")] = PyPDF2.generic.NumberObject(page.rotation % 360)
+            task.report(0.2 * (page_num + 1) / total, f"正在处理页面 {page_num + 1}/{total}")
+
+    output = open_output(output_path, task, linearize, images, compress, flate)
+    with output as output_file, stage("write") as record:
+        progress = ProgressWriter(output_file, task, session.size, start=0.2)
+        writer.write(progress)
+        record.bytes_written = progress.written
+    result['output_bytes'] = os.path.getsize(output_path) if linearize or images else progress.written
+    return result
+
+
+def _write_passthrough(session, pages, output_path, task, compress=False, flate=False, linearize=False,
+                       images=None):
+    """原样复制未修改的对象写出 pages（[(页码, 追加的角度)]），返回 passthrough_copy 的统计
+
+    文件不支持原样复制时返回 None。
+    """
+    from pdf_passthrough import PassthroughError, check_passthrough, passthrough_copy
+
+    try:
+        check_passthrough(session)
+    except PassthroughError:
+        return None
+    output = open_output(output_path, task, linearize, images, compress, flate)
+    with output as output_file, stage("passthrough") as record:
+        stats = passthrough_copy(session, pages, output_file, task, compress, flate)
+        record.bytes_read = stats['raw_bytes']
+        record.bytes_written = stats['output_bytes']
+    if linearize or images:
+        stats['output_bytes'] = os.path.getsize(output_path)
+    return stats
+
+
+def _write_streaming(session, pages, output_path, task, compress=False, flate=False, linearize=False,
+                     images=None):
+    """用 StreamingPdfWriter 重新序列化写出 pages（[(页码, 追加的角度)]），返回输出字节数"""
+    from pdf_stream_writer import StreamingPdfWriter
+
+    pages = list(pages)
+    output = open_output(output_path, task, linearize, images, compress, flate)
+    with output as output_file, stage("write") as record:
+        writer = StreamingPdfWriter(output_file, compress=compress, flate=flate)
+        importer = writer.add_source(session.reader)
+        for done, (page_num, rotate) in enumerate(pages, 1):
+            task.check_cancelled()
+            importer.import_page(page_num, rotate)
+            task.report(0.95 * done / len(pages), f"正在处理页面 {page_num + 1}/{session.page_count}")
+        importer.finish()
+        writer.close()
+        record.bytes_written = writer.position
+    return os.path.getsize(output_path) if linearize or images else writer.position
+
+
+def open_output(output_path, task=None, linearize=False, images=None, compress=False, flate=False):
+    """返回写出 output_path 的上下文（写入临时文件，正常结束时原子替换）
+
+    images 为 {'dpi': 目标分辨率} 时写完后先重新采样图像，图像统计信息写入该字典；
+    linearize 为 True 时最后线性化。compress 和 flate 用于重新采样图像后的输出。
+    """
+    final_output = atomic_output
+    if linearize:
+        from pdf_linearize import linearized_output
+
+        def final_output(path):
+            return linearized_output(path, task)
+    if images is not None:
+        from pdf_images import optimized_output
+        return optimized_output(output_path, images['dpi'], task, images, final_output, compress, flate)
+    return final_output(output_path)
+
+
+def merge_pdfs(paths, output_path, task=None, streaming=True, dedup=False, skip=None, compress=False,
+               flate=False, linearize=False, image_dpi=None):
+    """按顺序合并 paths 中的PDF文件，返回统计信息
+
+    streaming 为 True 时使用流式合并（内存占用约为单个输入文件大小），去重和压缩
+    输出只有流式合并支持。skip 为 {文件序号: 不合并的页码集合（从0开始）}，例如检测出的
+    重复页。统计信息包括耗时、吞吐量（输入字节/秒）和进程峰值内存。
+    """
+    task = task or NullTask()
+    skip = skip or {}
+    compress = compress and not linearize
+    images = {'dpi': image_dpi} if image_dpi is not None else None
+    if streaming or dedup or compress or flate:
+        from pdf_stream_writer import stream_merge
+
+        def pages_for(index, session):
+            skipped = skip.get(index, ())
+            return [(page, 0) for page in range(session.page_count) if page not in skipped]
+
+        with open_output(output_path, task, linearize, images, compress, flate) as out:
+            stats = stream_merge(paths, out, task, dedup=dedup, pages_for=pages_for if skip else None,
+                                 compress=compress, flate=flate)
+        if linearize or images:
+            stats['output_bytes'] = os.path.getsize(output_path)
+        if images is not None:
+            stats['images'] = images
+        return stats
+
+    start = time.perf_counter()
+    pdf_writer = PyPDF2.PdfWriter()
+    page_total = 0
+
+    for index, file in enumerate(paths):
+        with stage("parse", bytes_read=os.path.getsize(file)):
+            pdf_reader = PyPDF2.PdfReader(file)
+            page_count = len(pdf_reader.pages)
+        skipped = skip.get(index, ())
+        with stage("copy-pages"):
+            for page in range(page_count):
+                task.check_cancelled()
+                if page in skipped:
+                    continue
+                pdf_writer.add_page(pdf_reader.pages[page])
+                page_total += 1
+                task.report(
+                    0.2 * (index + (page + 1) / page_count) / len(paths),
+                    f"正在读取第 {index + 1}/{len(paths)} 个文件，第 {page + 1}/{page_count} 页"
+                )
+
+    # 先写入临时文件，完成后再替换目标文件，取消或出错时不留下不完整的文件
+    expected_bytes = sum(os.path.getsize(file) for file in paths)
+    output = open_output(output_path, task, linearize, images, compress, flate)
+    with output as out, stage("write") as record:
+        progress = ProgressWriter(out, task, expected_bytes, start=0.2)
+        pdf_writer.write(progress)
+        record.bytes_written = progress.written
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'files': len(paths),
+        'pages': page_total,
+        'input_bytes': expected_bytes,
+        'output_bytes': os.path.getsize(output_path) if linearize or images else progress.written,
+        'seconds': elapsed,
+        'throughput': expected_bytes / elapsed if elapsed > 0 else 0.0,
+        'peak_rss': peak_rss(),
+        'dedup_objects': 0,
+        'bytes_saved': 0,
+    }
+    if images is not None:
+        stats['images'] = images
+    return stats
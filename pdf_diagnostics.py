@@ -0,0 +1,144 @@
+"""诊断面板
+
+三个图形界面共用的运行指标窗口（按 F12 或点击“诊断”打开）：按阶段显示解析、
+渲染、图像转换、写出、创建预览控件等的调用次数、耗时、CPU时间、读写字节数和
+峰值内存，可以开启采样分析器，并把结果保存为 JSON 报告供容量评估使用。
+"""
+import json
+import os
+import time
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+from pdf_metrics import (SamplingProfiler, format_bytes, peak_rss, reset_stages,
+                         stage_report)
+
+# 表格的列 (指标, 标题, 宽度)
+COLUMNS = (
+    ("calls", "次数", 60),
+    ("seconds", "耗时(秒)", 80),
+    ("cpu_seconds", "CPU(秒)", 80),
+    ("bytes_read", "读取", 90),
+    ("bytes_written", "写出", 90),
+    ("peak_rss", "峰值内存", 90),
+)
+
+
+class DiagnosticsWindow:
+    """运行指标窗口，打开期间每秒刷新一次"""
+
+    REFRESH_INTERVAL = 1000  # 毫秒
+
+    def __init__(self, root):
+        self.root = root
+        self.profiler = None
+        self._refresh_id = None
+
+        self.window = tk.Toplevel(root)
+        self.window.title("诊断")
+        self.window.geometry("680x360")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.tree = ttk.Treeview(self.window, columns=[column[0] for column in COLUMNS], height=10)
+        self.tree.heading("#0", text="阶段")
+        self.tree.column("#0", width=130)
+        for name, title, width in COLUMNS:
+            self.tree.heading(name, text=title)
+            self.tree.column(name, width=width, anchor="e")
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+
+        self.summary_label = tk.Label(self.window, anchor="w", fg="#495057")
+        self.summary_label.pack(fill=tk.X, padx=10)
+
+        btn_frame = tk.Frame(self.window)
+        btn_frame.pack(fill=tk.X, padx=10, pady=10)
+        tk.Button(btn_frame, text="清零", command=self.reset).pack(side=tk.LEFT, padx=(0, 5))
+        self.profile_btn = tk.Button(btn_frame, text="开始采样分析", command=self.toggle_profiler)
+        self.profile_btn.pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="保存报告...", command=self.save_report).pack(side=tk.RIGHT)
+
+        self.refresh()
+
+    def refresh(self):
+        """重新读取各阶段指标"""
+        self._refresh_id = None
+        self.tree.delete(*self.tree.get_children())
+        for name, entry in stage_report().items():
+            self.tree.insert("", tk.END, text=name, values=(
+                entry["calls"],
+                f"{entry['seconds']:.3f}",
+                f"{entry['cpu_seconds']:.3f}",
+                format_bytes(entry["bytes_read"]),
+                format_bytes(entry["bytes_written"]),
+                format_bytes(entry["peak_rss"] or None),
+            ))
+
+        text = f"进程峰值内存: {format_bytes(peak_rss())}"
+        if self.profiler is not None:
+            state = "采样中" if self.profiler.running else "已停止"
+            text += f"    采样分析: {state}，{self.profiler.sample_count} 次采样"
+        self.summary_label.config(text=text)
+        self._refresh_id = self.window.after(self.REFRESH_INTERVAL, self.refresh)
+
+    def reset(self):
+        reset_stages()
+        self.tree.delete(*self.tree.get_children())
+
+    def toggle_profiler(self):
+        """开始或停止采样分析"""
+        if self.profiler is not None and self.profiler.running:
+            self.profiler.stop()
+            self.profile_btn.config(text="开始采样分析")
+        else:
+            self.profiler = SamplingProfiler().start()
+            self.profile_btn.config(text="停止采样分析")
+
+    def save_report(self):
+        """保存 JSON 报告；有采样结果时另存折叠调用栈（.folded，可生成火焰图）"""
+        path = filedialog.asksaveasfilename(
+            parent=self.window,
+            title="保存诊断报告",
+            initialfile=time.strftime("pdf_diagnostics_%Y%m%d_%H%M%S.json"),
+            defaultextension=".json",
+            filetypes=[("JSON文件", "*.json"), ("所有文件", "*.*")]
+        )
+        if not path:
+            return
+
+        report = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "peak_rss": peak_rss(),
+                  "stages": stage_report()}
+        folded = None
+        try:
+            if self.profiler is not None and self.profiler.samples:
+                report["profile"] = [
+                    {"function": name, "samples": count, "fraction": fraction}
+                    for name, count, fraction in self.profiler.top(50)
+                ]
+                folded = os.path.splitext(path)[0] + ".folded"
+                self.profiler.write_collapsed(folded)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            messagebox.showerror("错误", f"无法保存诊断报告:\n{e}", parent=self.window)
+            return
+
+        message = f"诊断报告已保存: {path}"
+        if folded:
+            message += f"\n调用栈: {folded}"
+        messagebox.showinfo("完成", message, parent=self.window)
+
+    def close(self):
+        if self._refresh_id is not None:
+            self.window.after_cancel(self._refresh_id)
+        if self.profiler is not None:
+            self.profiler.stop()
+        self.window.destroy()
+
+
+def show_diagnostics(root):
+    """打开诊断面板；已打开时把窗口提到最前"""
+    window = getattr(root, "_diagnostics_window", None)
+    if window is not None and window.window.winfo_exists():
+        window.window.lift()
+        return window
+    window = root._diagnostics_window = DiagnosticsWindow(root)
+    return window
@@ -0,0 +1,350 @@
+"""图像重新采样
+
+扫描件中的图像通常是 300~600dpi，远超屏幕阅读和普通打印的需要，是输出文件大小
+和写出时间的主要部分。optimize_images 按每个图像在页面上的显示尺寸计算有效
+分辨率，超过目标分辨率的图像重新采样后重新编码：原来是有损压缩（JPEG、JPEG 2000）
+的图像编码为 JPEG，无损的图像用 Flate（PNG 预测器）压缩，保持原来的画质类型。
+
+同一图像对象被多个页面或表单XObject使用时只处理一次，按其中显示尺寸最大（有效
+分辨率最低）的位置计算目标尺寸，写出的仍是同一个对象，各页继续共用。颜色空间、
+软蒙版等条目原样保留；颜色键蒙版、自定义 /Decode、非8位和CMYK等图像不处理。
+
+解码和编码在进程池中进行（每个图像一个任务，工作进程自己打开文件读取图像），
+其余对象原样复制（见 pdf_passthrough）。
+"""
+import io
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pdf_metrics import format_bytes, stage
+from pdf_session import PDFSession
+from pdf_startup import lazy_import
+from pdf_tasks import NullTask, atomic_output
+
+fitz = lazy_import("fitz")  # pymupdf
+PyPDF2 = lazy_import("PyPDF2")
+
+DEFAULT_DPI = 150  # 默认目标分辨率
+# 有效分辨率超过目标的这个倍数才重新采样，略高于目标的图像重新编码得不偿失
+DPI_THRESHOLD = 1.5
+JPEG_QUALITY = 80
+MIN_PIXELS = 64 * 64  # 更小的图像不处理
+REPORT_IMAGES = 10  # 报告中逐个列出的图像数
+
+_LOSSY_FILTERS = ("/DCTDecode", "/JPXDecode")
+# 可以处理的颜色空间及其分量数（ICC 颜色空间按 /N）
+_COLOR_SPACES = {"/DeviceGray": 1, "/DeviceRGB": 3, "/CalGray": 1, "/CalRGB": 3}
+# 重新编码后由新值代替的条目
+_REPLACED_KEYS = ("/Length", "/Filter", "/DecodeParms", "/Width", "/Height", "/BitsPerComponent")
+_FILTER_NAMES = {"/DCTDecode": "JPEG", "/FlateDecode": "Flate"}
+
+
+@contextmanager
+def optimized_output(path, dpi=DEFAULT_DPI, task=None, stats=None, open_output=atomic_output,
+                     compress=False, flate=False):
+    """写出PDF的上下文：内容先写入临时文件，正常结束时重新采样图像后写入 open_output(path)
+
+    optimize_images 的统计信息写入 stats 字典（如果提供）。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        # 会话在替换目标文件之前关闭（Windows 不能替换仍被映射的文件）
+        with open_output(path) as out:
+            with PDFSession(tmp_path) as session:
+                result = optimize_images(session, out, dpi, task, compress, flate)
+        if stats is not None:
+            stats.update(result)
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def optimize_images(session, output_stream, dpi=DEFAULT_DPI, task=None, compress=False, flate=False,
+                    max_workers=None):
+    """把会话中的文档写入 output_stream，有效分辨率超过 dpi 的图像重新采样，返回统计信息
+
+    {'dpi': 目标分辨率, 'images': [每个重新采样的图像 {'object': 对象号, 'pages': 使用它的页码（从1开始）,
+    'dpi': 原有效分辨率, 'width', 'height', 'new_width', 'new_height', 'filter': 新过滤器,
+    'before': 原字节数, 'after': 新字节数}]（按节省的字节数降序）, 'candidates': 超过
+    目标分辨率的图像数, 'bytes_saved': 节省的字节数, 'output_bytes': 输出字节数,
+    'seconds': 耗时}。重新编码后没有变小的图像保持原样。max_workers 为0时在当前进程中
+    依次处理；在守护进程（批量处理的工作进程）中不能再创建子进程，总是如此。
+    """
+    from pdf_passthrough import passthrough_copy
+
+    task = task or NullTask()
+    start = time.perf_counter()
+    reader = session.reader
+    document = fitz.open(session.path)
+    try:
+        with stage("find-images"):
+            candidates = find_images(document, reader, dpi)
+        if multiprocessing.current_process().daemon:
+            max_workers = 0
+        with stage("resample-images") as record:
+            # 图像在工作进程中处理，这里记录的是整体耗时
+            encoded = _resample_all(session, document, candidates, task, max_workers)
+            record.bytes_read = sum(image['before'] for image in candidates)
+            record.bytes_written = sum(len(data) for data, _ in encoded.values())
+    finally:
+        document.close()
+
+    overrides = {}
+    images = []
+    for image in candidates:
+        data, filter_name = encoded.get(image['object'], (None, None))
+        if data is None or len(data) >= image['before']:
+            continue
+        key = (image['object'], image['generation'])
+        original = reader.get_object(PyPDF2.generic.IndirectObject(*key, reader))
+        overrides[key] = _replacement(original, data, filter_name, image)
+        images.append(dict(image, filter=filter_name, after=len(data)))
+    images.sort(key=lambda image: image['after'] - image['before'])
+
+    pages = [(page_num, 0) for page_num in range(session.page_count)]
+    copied = passthrough_copy(session, pages, output_stream, task, compress, flate, overrides=overrides)
+    return {
+        'dpi': dpi,
+        'images': images,
+        'candidates': len(candidates),
+        'bytes_saved': sum(image['before'] - image['after'] for image in images),
+        'output_bytes': copied['output_bytes'],
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def find_images(document, reader, dpi=DEFAULT_DPI):
+    """返回有效分辨率超过 dpi 的图像（fitz 文档和 PyPDF2 读取器打开的是同一文件）
+
+    每个图像为 {'object', 'generation', 'pages', 'dpi', 'width', 'height', 'new_width',
+    'new_height', 'encoding': 'jpeg' 或 'flate', 'components': 颜色分量数, 'before': 字节数}。
+    """
+    if dpi <= 0:
+        raise ValueError(f"目标分辨率必须大于0: {dpi}")
+    placements = {}  # {对象号: [最低有效分辨率, 页码集合]}
+    for page in document:
+        for info in page.get_image_info(xrefs=True):
+            num = info['xref']
+            if not num:
+                # 内嵌图像（BI ... EI）在内容流中，不能单独替换
+                continue
+            a, b, c, d = info['transform'][:4]
+            shown_width, shown_height = math.hypot(a, b), math.hypot(c, d)
+            if not shown_width or not shown_height:
+                continue
+            effective = min(info['width'] * 72 / shown_width, info['height'] * 72 / shown_height)
+            entry = placements.setdefault(num, [effective, set()])
+            entry[0] = min(entry[0], effective)
+            entry[1].add(page.number + 1)
+
+    images = []
+    for num, (effective, pages) in sorted(placements.items()):
+        if effective <= dpi * DPI_THRESHOLD:
+            continue
+        generation = _generation(reader, num)
+        obj = reader.get_object(PyPDF2.generic.IndirectObject(num, generation, reader))
+        image = _describe(obj)
+        if image is None:
+            continue
+        width, height = image['width'], image['height']
+        scale = dpi / effective
+        image.update(
+            object=num,
+            generation=generation,
+            pages=sorted(pages),
+            dpi=round(effective),
+            new_width=max(1, round(width * scale)),
+            new_height=max(1, round(height * scale)),
+        )
+        images.append(image)
+    return images
+
+
+def format_image_report(stats):
+    """把 optimize_images 的统计信息格式化为报告的文本行"""
+    images = stats['images']
+    if not stats['candidates']:
+        return [f"图像: 没有有效分辨率超过 {stats['dpi']}dpi 的图像"]
+    lines = [f"图像: 重新采样 {len(images)}/{stats['candidates']} 个，"
+             f"节省 {format_bytes(stats['bytes_saved'])}，耗时 {stats['seconds']:.1f} 秒"]
+    for image in images[:REPORT_IMAGES]:
+        lines.append(
+            f"  对象 {image['object']}（{_page_list(image['pages'])}）: "
+            f"{image['width']}×{image['height']} {image['dpi']}dpi → "
+            f"{image['new_width']}×{image['new_height']} {_FILTER_NAMES[image['filter']]}，"
+            f"{format_bytes(image['before'])} → {format_bytes(image['after'])}"
+        )
+    if len(images) > REPORT_IMAGES:
+        lines.append(f"  …… 另有 {len(images) - REPORT_IMAGES} 个图像")
+    return lines
+
+
+def _page_list(pages):
+    if len(pages) > 3:
+        return f"第 {pages[0]} 页等 {len(pages)} 页"
+    return "第 " + "、".join(str(page) for page in pages) + " 页"
+
+
+def _describe(obj):
+    """返回可以重新采样的图像的基本信息，不能处理时返回 None"""
+    if not isinstance(obj, PyPDF2.generic.StreamObject) or _value(obj, "/Subtype") != "/Image":
+        return None
+    if _value(obj, "/ImageMask") or "/Decode" in obj or _value(obj, "/BitsPerComponent") != 8:
+        return None
+    if isinstance(_value(obj, "/Mask"), PyPDF2.generic.ArrayObject):
+        # 颜色键蒙版按原始颜色值匹配，有损压缩后不再准确
+        return None
+    components = _components(_value(obj, "/ColorSpace"))
+    if components is None:
+        return None
+    width, height = int(_value(obj, "/Width", 0)), int(_value(obj, "/Height", 0))
+    if width * height < MIN_PIXELS:
+        return None
+    filters = _value(obj, "/Filter", ())
+    if not isinstance(filters, PyPDF2.generic.ArrayObject):
+        filters = (filters,)
+    lossy = any(name in _LOSSY_FILTERS for name in filters)
+    return {
+        'width': width,
+        'height': height,
+        'encoding': "jpeg" if lossy else "flate",
+        'components': components,
+        'before': len(obj._data),
+    }
+
+
+def _components(color_space):
+    """颜色空间的分量数，只处理灰度和RGB（含 ICC 颜色空间）"""
+    if isinstance(color_space, PyPDF2.generic.ArrayObject):
+        if not color_space:
+            return None
+        family = color_space[0].get_object()
+        if family == "/ICCBased" and len(color_space) > 1:
+            components = _value(color_space[1].get_object(), "/N")
+            return components if components in (1, 3) else None
+        return _COLOR_SPACES.get(family)
+    return _COLOR_SPACES.get(color_space)
+
+
+def _value(dictionary, key, default=None):
+    """字典中的值，间接对象解析为被引用的对象"""
+    value = dict.get(dictionary, key)
+    return default if value is None else value.get_object()
+
+
+def _generation(reader, num):
+    for generation, table in reader.xref.items():
+        if num in table:
+            return generation
+    return 0
+
+
+def _resample_all(session, document, images, task, max_workers):
+    """重新采样 images 中的图像，返回 {对象号: (编码后的数据, 过滤器名)}"""
+    results = {}
+    if not images:
+        return results
+    total = len(images)
+
+    def collect(done, image, result):
+        if result is not None and result[2] == image['components']:
+            results[image['object']] = result[:2]
+        task.report(done / total, f"正在处理图像 {done}/{total}")
+
+    if max_workers == 0:
+        for done, image in enumerate(images, 1):
+            task.check_cancelled()
+            collect(done, image, _resample(document, image['object'], _size(image), image['encoding']))
+        return results
+
+    max_workers = max_workers or max(1, min(total, os.cpu_count() or 1))
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {executor.submit(_resample_in_worker, session.path, session.stamp, image['object'],
+                                   _size(image), image['encoding']): image
+                   for image in images}
+        for done, future in enumerate(as_completed(futures), 1):
+            task.check_cancelled()
+            collect(done, futures[future], future.result())
+        # 工作进程中打开的文件关闭后才能删除临时文件（Windows）
+        executor.shutdown()
+    finally:
+        # 取消时不等待尚未开始的图像
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def _size(image):
+    return image['new_width'], image['new_height']
+
+
+def _resample_in_worker(path, stamp, num, size, encoding):
+    """重新采样一个图像（在工作进程中执行）"""
+    from pdf_analysis import _open_document
+
+    return _resample(_open_document(path, stamp), num, size, encoding)
+
+
+def _resample(document, num, size, encoding):
+    """解码图像对象 num，缩放到 size 后编码，返回 (数据, 过滤器名, 颜色分量数)"""
+    from PIL import Image
+
+    pixmap = fitz.Pixmap(document, num)
+    if pixmap.alpha:
+        pixmap = fitz.Pixmap(pixmap, 0)
+    mode = {1: "L", 3: "RGB"}.get(pixmap.n)
+    if mode is None:
+        return None
+    image = Image.frombytes(mode, (pixmap.width, pixmap.height), pixmap.samples)
+    image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    if encoding == "jpeg":
+        buf = io.BytesIO()
+        image.save(buf, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        return buf.getvalue(), "/DCTDecode", pixmap.n
+    return _png_up(image), "/FlateDecode", pixmap.n
+
+
+def _png_up(image):
+    """按 PNG Up 预测器（每行减去上一行）处理后 Flate 压缩，扫描件压缩率明显更高"""
+    import numpy as np
+    from pdf_stream_writer import FLATE_LEVEL
+
+    rows = np.asarray(image).reshape(image.height, -1)
+    predicted = np.empty((rows.shape[0], rows.shape[1] + 1), np.uint8)
+    predicted[:, 0] = 2  # 每行开头的预测器类型：Up
+    predicted[0, 1:] = rows[0]
+    np.subtract(rows[1:], rows[:-1], out=predicted[1:, 1:])
+    return zlib.compress(predicted.tobytes(), FLATE_LEVEL)
+
+
+def _replacement(original, data, filter_name, image):
+    """用重新编码的数据代替原图像的数据，其余条目（颜色空间、软蒙版等）保留"""
+    generic = PyPDF2.generic
+    stream = generic.StreamObject()
+    for key, value in dict.items(original):
+        if key not in _REPLACED_KEYS:
+            stream[generic.NameObject(key)] = value
+    width, height = _size(image)
+    stream[generic.NameObject("/Width")] = generic.NumberObject(width)
+    stream[generic.NameObject("/Height")] = generic.NumberObject(height)
+    stream[generic.NameObject("/BitsPerComponent")] = generic.NumberObject(8)
+    stream[generic.NameObject("/Filter")] = generic.NameObject(filter_name)
+    if filter_name == "/FlateDecode":
+        parms = generic.DictionaryObject()
+        parms[generic.NameObject("/Predictor")] = generic.NumberObject(12)
+        parms[generic.NameObject("/Colors")] = generic.NumberObject(image['components'])
+        parms[generic.NameObject("/BitsPerComponent")] = generic.NumberObject(8)
+        parms[generic.NameObject("/Columns")] = generic.NumberObject(width)
+        stream[generic.NameObject("/DecodeParms")] = parms
+    stream._data = data
+    return stream
@@ -0,0 +1,213 @@
+"""增量更新保存
+
+旋转只改变页面字典中的 /Rotate。增量更新保留原文件的全部字节，只在文件末尾追加
+修改过的页面字典和一个新的交叉引用段（/Prev 指向原交叉引用段），保存耗时只与
+修改的页数有关，与文件大小无关。可以输出为原文件的副本加追加部分，也可以直接
+追加到原文件。
+"""
+import hashlib
+import io
+import os
+import time
+from PyPDF2.generic import DictionaryObject, NameObject, NumberObject
+from pdf_metrics import stage
+from pdf_stream_writer import SourceImporter, serialize
+from pdf_tasks import NullTask, atomic_output
+
+COPY_CHUNK = 4 * 1024 * 1024
+
+
+class IncrementalUpdateError(Exception):
+    """文件不支持增量更新（例如已加密）"""
+
+
+def check_incremental(session):
+    """检查会话中的文件能否增量更新，不能时抛出 IncrementalUpdateError"""
+    if session.reader.is_encrypted:
+        raise IncrementalUpdateError("加密的PDF不支持增量更新")
+    _last_xref(session)
+
+
+def rotate_incremental(session, rotations, output_path, task=None, in_place=False):
+    """以增量更新方式旋转页面
+
+    rotations 为 {从0开始的页码: 在原有 /Rotate 基础上追加的顺时针角度}。
+    in_place 为 True 时直接追加到原文件（output_path 被忽略），写入失败时把原文件
+    截断回原来的长度；否则先复制原文件再追加，原子替换 output_path。
+    返回 {'pages': 总页数, 'rotated': 修改的页数, 'appended_bytes': 追加的字节数}。
+    """
+    task = task or NullTask()
+    session.check_unchanged()
+    check_incremental(session)
+
+    changed = {}
+    total = session.page_count
+    for page_num, angle in sorted(rotations.items()):
+        task.check_cancelled()
+        if angle % 360 == 0:
+            continue
+        page = session.pages[page_num]
+        ref = page.indirect_reference
+        changed[(ref.idnum, ref.generation)] = _rotated_page(page, angle)
+    task.report(0.05, f"已准备 {len(changed)} 个页面")
+
+    with stage("write") as record:
+        if in_place:
+            appended = _append_in_place(session, changed, task)
+            record.bytes_written = appended
+        else:
+            with atomic_output(output_path) as output_file:
+                _copy_original(session, output_file, task)
+                appended = _write_update(session, changed, output_file, session.size)
+            record.bytes_written = session.size + appended
+    return {'pages': total, 'rotated': len(changed), 'appended_bytes': appended}
+
+
+def _rotated_page(page, angle):
+    """返回修改 /Rotate 后的页面字典，其余内容（包括间接引用）保持原样"""
+    page_dict = DictionaryObject()
+    for key, value in page.items():
+        page_dict[NameObject(key)] = value
+
+    # /Rotate 可能继承自页面树父节点，写入页面本身后以页面中的值为准
+    current = page_dict.get("/Rotate")
+    if current is None:
+        current = SourceImporter._inherited(page, "/Rotate") or 0
+    page_dict[NameObject("/Rotate")] = NumberObject((int(current) + angle) % 360)
+    return page_dict
+
+
+def _append_in_place(session, changed, task):
+    task.check_cancelled()
+    with open(session.path, "r+b") as f:
+        f.seek(0, os.SEEK_END)
+        original_size = f.tell()
+        try:
+            appended = _write_update(session, changed, f, original_size)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            # 追加不完整时恢复原文件
+            f.truncate(original_size)
+            raise
+    return appended
+
+
+def _copy_original(session, output_file, task):
+    """把原文件逐块复制到输出（直接读取内存映射，不经过解析）"""
+    data = session._map
+    for start in range(0, session.size, COPY_CHUNK):
+        task.check_cancelled()
+        output_file.write(data[start:start + COPY_CHUNK])
+        task.report(0.05 + 0.9 * min(start + COPY_CHUNK, session.size) / session.size,
+                    f"正在复制原文件... {min(start + COPY_CHUNK, session.size) // 1024} KB")
+
+
+def _write_update(session, changed, output_file, base_offset):
+    """在 base_offset 处写出增量更新段，返回写出的字节数"""
+    prev_offset, is_stream = _last_xref(session)
+    trailer = session.reader.trailer
+    size = _xref_size(session.reader)
+
+    out = io.BytesIO()
+    # 原文件可能不以换行结尾
+    out.write(b"\n")
+    offsets = {}
+    for (num, generation), page_dict in sorted(changed.items()):
+        offsets[num] = (base_offset + out.tell(), generation)
+        out.write(b"%d %d obj\n" % (num, generation))
+        out.write(serialize(page_dict, lambda ind: (ind.idnum, ind.generation)))
+        out.write(b"\nendobj\n")
+
+    entries = [b"/Root " + _ref_bytes(trailer, "/Root")]
+    if "/Info" in trailer:
+        entries.append(b"/Info " + _ref_bytes(trailer, "/Info"))
+    entries.append(b"/ID [" + _file_id(trailer, offsets) + b"]")
+    entries.append(b"/Prev %d" % prev_offset)
+
+    xref_offset = base_offset + out.tell()
+    if is_stream:
+        # 原文件使用交叉引用流时，更新段也使用交叉引用流，新占用一个对象号
+        offsets[size] = (xref_offset, 0)
+        out.write(_xref_stream(size, offsets, entries))
+    else:
+        out.write(_xref_table(offsets))
+        out.write(b"trailer\n<</Size %d " % size + b" ".join(entries) + b">>\n")
+    out.write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+
+    data = out.getvalue()
+    output_file.write(data)
+    return len(data)
+
+
+def _xref_table(offsets):
+    """按对象号连续的段写出交叉引用表"""
+    lines = [b"xref\n"]
+    nums = sorted(offsets)
+    start = 0
+    while start < len(nums):
+        end = start
+        while end + 1 < len(nums) and nums[end + 1] == nums[end] + 1:
+            end += 1
+        lines.append(b"%d %d\n" % (nums[start], end - start + 1))
+        for num in nums[start:end + 1]:
+            offset, generation = offsets[num]
+            lines.append(b"%010d %05d n\r\n" % (offset, generation))
+        start = end + 1
+    return b"".join(lines)
+
+
+def _xref_stream(xref_num, offsets, entries):
+    nums = sorted(offsets)
+    width = max(4, (max(offset for offset, _ in offsets.values()).bit_length() + 7) // 8)
+    rows = b"".join(
+        b"\x01" + offsets[num][0].to_bytes(width, "big") + offsets[num][1].to_bytes(2, "big")
+        for num in nums
+    )
+    index = b" ".join(b"%d 1" % num for num in nums)
+    header = (b"<</Type /XRef /Size %d /Index [%s] /W [1 %d 2] /Length %d "
+              % (xref_num + 1, index, width, len(rows)))
+    return (b"%d 0 obj\n" % xref_num + header + b" ".join(entries) + b">>\nstream\n"
+            + rows + b"\nendstream\nendobj\n")
+
+
+def _last_xref(session):
+    """返回原文件最后一个交叉引用段的偏移量和它是否为交叉引用流"""
+    data = session._map
+    tail_start = max(0, session.size - 2048)
+    position = data.rfind(b"startxref", tail_start)
+    if position < 0:
+        raise IncrementalUpdateError("找不到 startxref，文件可能已损坏")
+    try:
+        offset = int(data[position + 9:position + 40].split()[0])
+    except (ValueError, IndexError):
+        raise IncrementalUpdateError("startxref 无效，文件可能已损坏") from None
+    if not 0 < offset < session.size:
+        raise IncrementalUpdateError("startxref 超出文件范围，文件可能已损坏")
+    return offset, not data[offset:offset + 32].lstrip().startswith(b"xref")
+
+
+def _xref_size(reader):
+    """原文件的对象号上限（/Size）
+
+    PyPDF2 读取交叉引用流时不保留 /Size，按交叉引用表中出现的最大对象号计算。
+    """
+    size = int(dict.get(reader.trailer, "/Size", 0))
+    nums = [num for table in reader.xref.values() for num in table]
+    nums.extend(reader.xref_objStm)
+    return max([size] + [num + 1 for num in nums])
+
+
+def _ref_bytes(trailer, key):
+    ref = dict.__getitem__(trailer, key)
+    return b"%d %d R" % (ref.idnum, ref.generation)
+
+
+def _file_id(trailer, offsets):
+    """文件标识：第一部分保持不变，第二部分随每次更新变化"""
+    changed = hashlib.md5(repr((sorted(offsets.items()), time.time())).encode("ascii")).hexdigest()
+    file_id = trailer.get("/ID")
+    if file_id:
+        first = getattr(file_id[0], "original_bytes", None) or bytes(file_id[0], "latin-1")
+        return b"<%s> <%s>" % (first.hex().encode("ascii"), changed.encode("ascii"))
+    return b"<%s> <%s>" % (changed.encode("ascii"), changed.encode("ascii"))
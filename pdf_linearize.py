@@ -0,0 +1,511 @@
+"""线性化输出（快速 Web 视图）
+
+线性化的PDF把打开文档和显示第一页需要的对象放在文件开头，并附带提示表（hint
+stream）说明其余每页的对象在文件中的位置，支持按字节范围下载的阅读器下载完开头
+部分即可显示第一页，其它页面按需下载。
+
+linearize 读取一个普通PDF（本程序写出的文件），按对象的使用者重新排列并重新编号：
+
+1. 线性化参数字典、第一页交叉引用表和文件尾；
+2. 文档目录和打开文档需要的对象（OPEN_DOCUMENT_KEYS）；
+3. 主提示流：页面偏移提示表和共享对象提示表；
+4. 第一页：页面对象、只被第一页使用的对象和第一页与其它页面共用的对象；
+5. 其余各页：页面对象和只被该页使用的对象，每页的对象号连续；
+6. 多个页面共用的对象；
+7. 其它对象（页面树、文档信息、书签等）和主交叉引用表。
+
+对象号和偏移量在写出前全部确定，对象序列化两次（一次计算长度，一次写出）。
+提示表中的偏移量按规范不计主提示流本身的长度。线性化输出不使用对象流。
+"""
+import os
+import re
+import tempfile
+import zlib
+from contextlib import contextmanager
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from pdf_metrics import stage
+from pdf_session import PDFSession
+from pdf_stream_writer import FLATE_LEVEL, serialize
+from pdf_tasks import NullTask, atomic_output
+
+# 文档目录中打开文档时就需要的条目，它们引用的对象放在第一页之前
+OPEN_DOCUMENT_KEYS = ("/ViewerPreferences", "/PageMode", "/Threads", "/OpenAction", "/AcroForm")
+
+# 线性化参数字典和第一页文件尾中的数值先按最大宽度预留，实际值不足时用空格补齐
+_PLACEHOLDER = 9999999999
+
+# 分析时在读取器缓存中保留的流数据上限，超过后流对象在写出时重新读取
+CACHE_BYTES = 64 << 20
+
+_VERSION = re.compile(rb"%PDF-\d\.\d")
+
+# 对象的位置
+_OPEN, _FIRST_PAGE, _PAGE, _SHARED, _OTHER = range(5)
+
+
+@contextmanager
+def linearized_output(path, task=None):
+    """写出PDF的上下文：内容先写入临时文件，正常结束时线性化后原子替换 path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        # 会话在替换目标文件之前关闭（Windows 不能替换仍被映射的文件）
+        with atomic_output(path) as out, stage("linearize") as record:
+            with PDFSession(tmp_path) as session:
+                record.bytes_read = session.size
+                record.bytes_written = linearize(session, out, task)['output_bytes']
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def linearize(session, output_stream, task=None):
+    """把会话中的文档线性化写入 output_stream，返回统计信息
+
+    {'pages': 页数, 'objects': 对象数, 'first_page_bytes': 显示第一页需要下载的字节数,
+    'output_bytes': 输出字节数}
+    """
+    task = task or NullTask()
+    layout = _Layout(session.reader, task)
+    version = _VERSION.match(session._map, 0, 1024)
+    return layout.write(output_stream, version.group(0) if version else b"%PDF-1.4")
+
+
+class _Layout:
+    """计算线性化文件中对象的位置、对象号和偏移量"""
+
+    def __init__(self, reader, task):
+        self.reader = reader
+        self.task = task
+        self.refs = {}  # {(对象号, 代号): 引用的对象}
+        # {(对象号, 代号): (引用按 "0 0 R" 序列化时的长度, 引用的对象)}，写出前据此计算对象长度
+        self.sizes = {}
+        self._cached = 0
+        trailer = reader.trailer
+        self.root = _key(dict.__getitem__(trailer, "/Root"))
+        info = dict.get(trailer, "/Info")
+        self.info = _key(info) if isinstance(info, IndirectObject) else None
+        self.pages = []
+        for page in reader.pages:
+            if page.indirect_reference is None:
+                raise ValueError("页面不是间接对象，无法线性化")
+            self.pages.append(_key(page.indirect_reference))
+        self.page_set = set(self.pages)
+        self._classify()
+        self._number()
+
+    def _classify(self):
+        """按使用者把对象分到各部分（与 qpdf 的分类规则一致）"""
+        users = {}  # {对象: [打开文档, 第一页, 其它页面集合, 其它使用者数]}
+
+        def use(key, kind, page=None):
+            entry = users.get(key)
+            if entry is None:
+                entry = users[key] = [False, False, set(), 0]
+            if kind == _OPEN:
+                entry[0] = True
+            elif kind == _FIRST_PAGE:
+                entry[1] = True
+            elif kind == _PAGE:
+                entry[2].add(page)
+            else:
+                entry[3] += 1
+
+        root = self._object(self.root)
+        self.page_objects = []  # 每页按遍历顺序使用的对象（不含页面本身）
+        for index, page in enumerate(self.pages):
+            self.task.check_cancelled()
+            found = self._walk(page, skip_parent=True)
+            self.page_objects.append(found)
+            for key in found:
+                use(key, _FIRST_PAGE if index == 0 else _PAGE, index)
+            self.task.report(0.3 * (index + 1) / len(self.pages), f"正在分析页面 {index + 1}/{len(self.pages)}")
+
+        # 文档目录和文档信息引用的对象按顺序记录，页面树节点随其它对象写出
+        walked = {}
+        outlines = []
+        for name, value in dict.items(root):
+            kind = _OPEN if name in OPEN_DOCUMENT_KEYS else _OTHER
+            found = self._page_tree(value) if name == "/Pages" else self._walk_value(value)
+            if name == "/Outlines":
+                outlines = found
+            for key in found:
+                use(key, kind)
+                walked[key] = True
+        if self.info is not None:
+            for key in [self.info] + self._walk(self.info):
+                use(key, _OTHER)
+                walked[key] = True
+
+        self.category = {}
+        for key, (is_open, first, pages, others) in users.items():
+            if key in self.page_set or key == self.root:
+                continue
+            if is_open:
+                self.category[key] = _OPEN
+            elif first:
+                self.category[key] = _FIRST_PAGE
+            elif len(pages) == 1 and others == 0:
+                self.category[key] = _PAGE
+            elif len(pages) > 1:
+                self.category[key] = _SHARED
+            else:
+                self.category[key] = _OTHER
+        self.open_objects = [self.root] + [key for key in walked if self.category.get(key) == _OPEN]
+        # 书签对象连续排在最后，提示流中的书签提示表给出它们的位置
+        self.outline_objects = [key for key in outlines if self.category.get(key) == _OTHER]
+        in_outlines = set(self.outline_objects)
+        self.other_objects = [key for key in walked if self.category.get(key) == _OTHER
+                              and key not in in_outlines] + self.outline_objects
+
+    def _number(self):
+        """确定对象顺序和新对象号：主交叉引用表部分从1开始，第一页部分排在最后"""
+        first_page = [self.pages[0]] + [key for key in self.page_objects[0]
+                                        if self.category.get(key) == _FIRST_PAGE]
+        self.page_parts = [first_page]
+        for index in range(1, len(self.pages)):
+            self.page_parts.append([self.pages[index]] + [
+                key for key in self.page_objects[index] if self.category.get(key) == _PAGE])
+        shared, seen = [], set()
+        for objects in self.page_objects[1:]:
+            for key in objects:
+                if self.category.get(key) == _SHARED and key not in seen:
+                    seen.add(key)
+                    shared.append(key)
+        self.shared = shared
+
+        main = [key for part in self.page_parts[1:] for key in part] + shared + self.other_objects
+        self.numbers = {}
+        for num, key in enumerate(main, 1):
+            self.numbers[key] = num
+        self.main_count = len(main) + 1  # 包括0号空闲对象
+        self.linearization_num = self.main_count
+        num = self.linearization_num + 1
+        for key in self.open_objects + first_page:
+            self.numbers[key] = num
+            num += 1
+        self.hint_num = num
+        self.size = num + 1
+
+        # 共享对象提示表中的序号：先是第一页部分的全部对象，然后是共享对象部分
+        self.shared_index = {key: index for index, key in enumerate(first_page)}
+        for index, key in enumerate(shared, len(first_page)):
+            self.shared_index[key] = index
+
+    def write(self, out, version):
+        """按位置写出全部对象，返回统计信息"""
+        reader = self.reader
+        lengths = {key: self._length(key) for key in self.numbers}
+
+        header = version + b"\n%\xe2\xe3\xcf\xd3\n"
+        first_xref_count = self.size - self.linearization_num
+        linearization_length = len(self._linearization_dict(*([_PLACEHOLDER] * 6)))
+        first_trailer_length = len(self._first_trailer(_PLACEHOLDER))
+
+        # 提示流按长度为0计算偏移量（规范要求提示表中的偏移量不计提示流）
+        position = len(header) + linearization_length
+        first_xref_offset = position
+        position += len(b"xref\n%d %d\n" % (self.linearization_num, first_xref_count))
+        position += 20 * first_xref_count + first_trailer_length
+        offsets = {}
+        for key in self.open_objects:
+            offsets[key] = position
+            position += lengths[key]
+        hint_offset = position
+        order = [key for part in self.page_parts for key in part] + self.shared + self.other_objects
+        for key in order:
+            offsets[key] = position
+            position += lengths[key]
+        end = position
+
+        hint = self._hint_stream(offsets, lengths, end)
+        hint_length = len(hint)
+        for key in order:
+            offsets[key] += hint_length
+        end += hint_length
+        # 第一页部分之后的第一个对象的位置
+        following = len(self.page_parts[0])
+        first_page_end = offsets[order[following]] if following < len(order) else end
+
+        main_xref = b"xref\n0 %d\n" % self.main_count
+        xref_zero = end + len(main_xref) - 1
+        main_xref += b"0000000000 65535 f\r\n"
+        entries = sorted((self.numbers[key], offsets[key]) for key in order[following:])
+        main_xref += b"".join(b"%010d 00000 n\r\n" % offset for _, offset in entries)
+        main_xref += b"trailer\n<</Size %d>>\nstartxref\n%d\n%%%%EOF\n" % (self.main_count, first_xref_offset)
+        file_length = end + len(main_xref)
+
+        # 第二次序列化：写出
+        self._write(out, header)
+        self._write(out, self._linearization_dict(
+            file_length, hint_offset, hint_length, first_page_end, len(self.pages), xref_zero,
+            pad=linearization_length))
+        first_xref = [b"xref\n%d %d\n" % (self.linearization_num, first_xref_count),
+                      b"%010d 00000 n\r\n" % len(header)]
+        first_numbered = sorted((self.numbers[key], offsets[key]) for key in self.open_objects + self.page_parts[0])
+        first_xref.extend(b"%010d 00000 n\r\n" % offset for _, offset in first_numbered)
+        first_xref.append(b"%010d 00000 n\r\n" % hint_offset)
+        self._write(out, b"".join(first_xref))
+        self._write(out, self._first_trailer(end, pad=first_trailer_length))
+        written = 0
+        for key in self.open_objects:
+            self._write(out, self._body(key))
+        self._write(out, hint)
+        for key in order:
+            written += 1
+            if written % 256 == 0:
+                self.task.check_cancelled()
+                self.task.report(0.3 + 0.7 * written / len(order), "正在线性化")
+            self._write(out, self._body(key))
+            _evict(reader, key)
+        self._write(out, main_xref)
+        return {
+            'pages': len(self.pages),
+            'objects': self.size - 1,
+            'first_page_bytes': first_page_end,
+            'output_bytes': file_length,
+        }
+
+    def _hint_stream(self, offsets, lengths, end):
+        """页面偏移提示表和共享对象提示表（PDF 参考 附录 F.4）"""
+        page_counts = [len(part) for part in self.page_parts]
+        page_starts = [offsets[part[0]] for part in self.page_parts]
+        page_lengths = [sum(lengths[key] for key in part) for part in self.page_parts]
+        page_shared = [[]]
+        for objects in self.page_objects[1:]:
+            page_shared.append(sorted({self.shared_index[key] for key in objects
+                                       if self.category.get(key) in (_FIRST_PAGE, _SHARED)}))
+        shared_keys = self.page_parts[0] + self.shared
+        shared_lengths = [lengths[key] for key in shared_keys]
+
+        bits = _BitWriter()
+        min_count, min_length = min(page_counts), min(page_lengths)
+        count_bits = (max(page_counts) - min_count).bit_length()
+        length_bits = (max(page_lengths) - min_length).bit_length()
+        shared_count_bits = max(len(refs) for refs in page_shared).bit_length()
+        shared_id_bits = max((max(refs) for refs in page_shared if refs), default=0).bit_length()
+        for value, width in ((min_count, 32), (page_starts[0], 32), (count_bits, 16), (min_length, 32),
+                             (length_bits, 16), (0, 32), (0, 16), (min_length, 32), (length_bits, 16),
+                             (shared_count_bits, 16), (shared_id_bits, 16), (0, 16), (4, 16)):
+            bits.write(value, width)
+        for values, width in (([count - min_count for count in page_counts], count_bits),
+                              ([length - min_length for length in page_lengths], length_bits),
+                              ([len(refs) for refs in page_shared], shared_count_bits),
+                              ([ref for refs in page_shared for ref in refs], shared_id_bits),
+                              ([0] * len(page_counts), 0),
+                              ([0] * len(page_counts), 0),
+                              ([length - min_length for length in page_lengths], length_bits)):
+            for value in values:
+                bits.write(value, width)
+            bits.flush()
+        shared_offset = len(bits.data)
+
+        min_shared = min(shared_lengths)
+        shared_bits = (max(shared_lengths) - min_shared).bit_length()
+        first_shared = self.numbers[self.shared[0]] if self.shared else 0
+        first_shared_offset = offsets[self.shared[0]] if self.shared else 0
+        for value, width in ((first_shared, 32), (first_shared_offset, 32), (len(self.page_parts[0]), 32),
+                             (len(shared_keys), 32), (0, 16), (min_shared, 32), (shared_bits, 16)):
+            bits.write(value, width)
+        for length in shared_lengths:
+            bits.write(length - min_shared, shared_bits)
+        bits.flush()
+        for _ in shared_lengths:
+            bits.write(0, 1)  # 没有 MD5 签名
+        bits.flush()
+
+        entries = b"/S %d" % shared_offset
+        if self.outline_objects:
+            # 书签提示表：第一个对象的对象号和位置、对象数和总长度
+            entries += b" /O %d" % len(bits.data)
+            first = self.outline_objects[0]
+            for value in (self.numbers[first], offsets[first], len(self.outline_objects),
+                          sum(lengths[key] for key in self.outline_objects)):
+                bits.write(value, 32)
+        data = zlib.compress(bytes(bits.data), FLATE_LEVEL)
+        return (b"%d 0 obj\n<<%s /Filter /FlateDecode /Length %d>>\nstream\n"
+                % (self.hint_num, entries, len(data)) + data + b"\nendstream\nendobj\n")
+
+    def _linearization_dict(self, length, hint_offset, hint_length, first_page_end, pages, xref_zero, pad=0):
+        body = (b"%d 0 obj\n<</Linearized 1 /L %d /H [%d %d] /O %d /E %d /N %d /T %d>>"
+                % (self.linearization_num, length, hint_offset, hint_length,
+                   self.numbers[self.pages[0]], first_page_end, pages, xref_zero))
+        return body + b" " * max(pad - len(body) - len(b"\nendobj\n"), 0) + b"\nendobj\n"
+
+    def _first_trailer(self, main_xref_offset, pad=0):
+        file_id = b""
+        ids = self.reader.trailer.get("/ID")
+        if ids and len(ids) == 2:
+            file_id = b" /ID [<%s> <%s>]" % tuple(_id_bytes(value).hex().encode("ascii") for value in ids)
+        entries = b"/Size %d /Root %d 0 R" % (self.size, self.numbers[self.root])
+        if self.info is not None and self.info in self.numbers:
+            entries += b" /Info %d 0 R" % self.numbers[self.info]
+        body = b"trailer\n<<" + entries + file_id + b" /Prev %d>>" % main_xref_offset
+        tail = b"\nstartxref\n0\n%%EOF\n"
+        return body + b" " * max(pad - len(body) - len(tail), 0) + tail
+
+    def _body(self, key):
+        obj = self._object(key)
+        return (b"%d 0 obj\n" % self.numbers[key] + serialize(obj, self._ref_for) + b"\nendobj\n")
+
+    def _measure(self, key, obj):
+        refs = []
+
+        def ref_for(ind):
+            refs.append(_key(ind))
+            return 0
+
+        self.sizes[key] = (len(serialize(obj, ref_for)), refs)
+
+    def _length(self, key):
+        """对象写出后的长度：引用 "0 0 R" 换为新对象号，不再写出的对象换为 null"""
+        if key not in self.sizes:
+            self._measure(key, self._object(key))
+        size, refs = self.sizes[key]
+        size += len(b"%d 0 obj\n\nendobj\n" % self.numbers[key])
+        for ref in refs:
+            num = self.numbers.get(ref)
+            size += len(b"%d" % num) - 1 if num is not None else -1
+        return size
+
+    def _ref_for(self, ind):
+        return self.numbers.get(_key(ind))
+
+    def _object(self, key):
+        return self.reader.get_object(IndirectObject(key[0], key[1], self.reader))
+
+    def _walk(self, start, skip_parent=False):
+        """返回从 start 出发可访问的对象（不含 start，遇到页面、页面树节点和文档目录即停止）"""
+        found, seen = [], {start}
+        stack = [self._references(start, skip_parent)]
+        while stack:
+            try:
+                key = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            if key in seen:
+                continue
+            seen.add(key)
+            if self._stop(key):
+                continue
+            found.append(key)
+            stack.append(self._references(key))
+        return found
+
+    def _walk_value(self, value):
+        """从文档目录的一个条目出发：条目本身是引用时包括被引用的对象"""
+        if isinstance(value, IndirectObject):
+            key = _key(value)
+            if self._stop(key):
+                return []
+            return [key] + self._walk(key)
+        found = []
+        for ind in _indirect_references(value):
+            key = _key(ind)
+            if key not in found and not self._stop(key):
+                found.append(key)
+                found.extend(item for item in self._walk(key) if item not in found)
+        return found
+
+    def _page_tree(self, value):
+        """页面树节点和它们引用的其它对象（例如继承的资源），不包括页面"""
+        found, nodes = [], [value] if isinstance(value, IndirectObject) else []
+        while nodes:
+            key = _key(nodes.pop())
+            if key in found or key in self.page_set:
+                continue
+            found.append(key)
+            node = self._object(key)
+            for name, item in dict.items(node):
+                if name == "/Kids":
+                    nodes.extend(kid for kid in item if isinstance(kid, IndirectObject))
+                elif name != "/Parent":
+                    found.extend(ref for ref in self._walk_value(item) if ref not in found)
+        return found
+
+    def _references(self, key, skip_parent=False):
+        refs = self.refs.get(key)
+        if refs is None:
+            obj = self._object(key)
+            if obj is None:
+                refs = []
+            elif skip_parent and isinstance(obj, DictionaryObject):
+                refs = [_key(ind) for name, value in dict.items(obj) if name != "/Parent"
+                        for ind in _indirect_references(value)]
+            else:
+                refs = [_key(ind) for ind in _indirect_references(obj)]
+            if not skip_parent:
+                self.refs[key] = refs
+            if obj is not None:
+                self._measure(key, obj)
+            if isinstance(obj, StreamObject):
+                self._cached += len(obj._data)
+                if self._cached > CACHE_BYTES:
+                    _evict(self.reader, key)
+        return iter(refs)
+
+    def _stop(self, key):
+        """遍历到页面、页面树节点、文档目录或不存在的对象时停止"""
+        if key in self.page_set or key == self.root:
+            return True
+        obj = self._object(key)
+        return obj is None or (isinstance(obj, DictionaryObject) and dict.get(obj, "/Type") == "/Pages")
+
+    @staticmethod
+    def _write(out, data):
+        out.write(data)
+
+
+class _BitWriter:
+    """按位写入，高位在前"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self._value = 0
+        self._bits = 0
+
+    def write(self, value, width):
+        if width == 0:
+            return
+        self._value = (self._value << width) | value
+        self._bits += width
+        while self._bits >= 8:
+            self._bits -= 8
+            self.data.append((self._value >> self._bits) & 0xFF)
+        self._value &= (1 << self._bits) - 1
+
+    def flush(self):
+        """补齐到字节边界"""
+        if self._bits:
+            self.write(0, 8 - self._bits)
+
+
+def _indirect_references(obj):
+    """递归列出对象中的间接引用（不解析被引用的对象）"""
+    if isinstance(obj, IndirectObject):
+        yield obj
+    elif isinstance(obj, DictionaryObject):
+        for value in dict.values(obj):
+            yield from _indirect_references(value)
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            yield from _indirect_references(item)
+
+
+def _id_bytes(value):
+    return getattr(value, "original_bytes", None) or bytes(value, "latin-1")
+
+
+def _key(ind):
+    return ind.idnum, ind.generation
+
+
+def _evict(reader, key):
+    # 大图像等流对象处理完即从读取器缓存中移除
+    cache = getattr(reader, "resolved_objects", {})
+    cache.pop((key[1], key[0]), None)
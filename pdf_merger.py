@@ -1,7 +1,14 @@
+from pdf_startup import finish_startup
 import tkinter as tk
-from tkinter import filedialog, messagebox, Listbox, MULTIPLE
-import PyPDF2
+from tkinter import filedialog, messagebox, Listbox, MULTIPLE, ttk
 import os
+from pdf_analysis import analyze_documents, find_duplicates
+from pdf_core import merge_pdfs
+from pdf_diagnostics import show_diagnostics
+from pdf_images import DEFAULT_DPI
+from pdf_metrics import format_bytes
+from pdf_session import PDFSession
+from pdf_tasks import BackgroundTask
 
 class PDFMergerGUI:
     def __init__(self, root):
@@ -10,9 +17,13 @@ class PDFMergerGUI:
         self.root.geometry("600x500")
         
         self.files = []
+        self.merge_task = None  # 正在进行的后台合并任务
+        self.scan_task = None  # 正在进行的重复页检测任务
+        self.skip_pages = {}  # 合并时跳过的重复页 {文件路径: 页码集合（从0开始）}
         
         # 创建界面元素
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
     
     def create_widgets(self):
         # 标题
@@ -42,6 +53,13 @@ class PDFMergerGUI:
         down_btn = tk.Button(btn_frame, text="下移", command=self.move_down)
         down_btn.grid(row=0, column=4, padx=5)
         
+        # 查找所有文件中的重复页，合并时跳过
+        duplicate_btn = tk.Button(btn_frame, text="查找重复页", command=self.find_duplicate_pages)
+        duplicate_btn.grid(row=0, column=5, padx=5)
+        
+        # 合并期间需要禁用的按钮
+        self.edit_buttons = [add_btn, remove_btn, clear_btn, up_btn, down_btn, duplicate_btn]
+        
         # 文件列表
         list_frame = tk.Frame(self.root)
         list_frame.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
@@ -54,10 +72,50 @@ class PDFMergerGUI:
         self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.config(command=self.listbox.yview)
         
+        # 合并选项：流式合并逐个读取并写出输入文件，内存占用约为单个文件大小
+        self.streaming_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(self.root, text="低内存模式（流式合并，适合大量大文件）",
+                       variable=self.streaming_var).pack()
+        
+        # 去重：同一模板生成的文件中相同的字体、图像等只保留一份（使用流式合并）
+        self.dedup_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.root, text="合并相同的字体和图像（减小输出文件）",
+                       variable=self.dedup_var).pack()
+        
+        # 压缩输出：对象流和交叉引用流（PDF 1.5），未压缩的流用 Flate 重新压缩（使用流式合并）
+        self.compress_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.root, text="压缩输出（文件更小）",
+                       variable=self.compress_var).pack()
+        
+        # 快速 Web 视图：线性化输出，浏览器下载完开头部分即可显示第一页
+        self.linearize_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.root, text="快速 Web 视图（线性化）",
+                       variable=self.linearize_var).pack()
+        
+        # 压缩图像：有效分辨率过高的扫描图像重新采样到 DEFAULT_DPI
+        self.images_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.root, text=f"压缩图像（重新采样到 {DEFAULT_DPI}dpi）",
+                       variable=self.images_var).pack()
+        
         # 合并按钮
-        merge_btn = tk.Button(self.root, text="合并PDF", command=self.merge_pdfs,
-                             bg="green", fg="white", font=("Arial", 12))
-        merge_btn.pack(pady=20)
+        self.merge_btn = tk.Button(self.root, text="合并PDF", command=self.merge_pdfs,
+                                   bg="green", fg="white", font=("Arial", 12))
+        self.merge_btn.pack(pady=(20, 5))
+        
+        # 合并进度和取消按钮
+        progress_frame = tk.Frame(self.root)
+        progress_frame.pack(fill=tk.X, padx=20)
+        
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate', maximum=100)
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        
+        self.cancel_btn = tk.Button(progress_frame, text="取消", command=self.cancel_merge,
+                                    state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.RIGHT)
+        
+        # 各阶段耗时和内存（F12）
+        tk.Button(progress_frame, text="诊断",
+                  command=lambda: show_diagnostics(self.root)).pack(side=tk.RIGHT, padx=(0, 5))
         
         # 状态标签
         self.status_label = tk.Label(self.root, text="等待操作...", fg="blue")
@@ -69,12 +127,15 @@ class PDFMergerGUI:
             filetypes=[("PDF文件", "*.pdf"), ("所有文件", "*.*")]
         )
         
+        count = len(self.files)
         for file in files:
             if file not in self.files:
                 self.files.append(file)
-                self.listbox.insert(tk.END, os.path.basename(file))
+                self.listbox.insert(tk.END, self.list_label(file))
         
         self.update_status()
+        if len(self.files) > count:
+            self.forget_duplicates()
     
     def remove_file(self):
         selected = self.listbox.curselection()
@@ -82,9 +143,12 @@ class PDFMergerGUI:
             self.files.pop(index)
             self.listbox.delete(index)
         self.update_status()
+        if selected:
+            self.forget_duplicates()
     
     def clear_list(self):
         self.files.clear()
+        self.skip_pages.clear()
         self.listbox.delete(0, tk.END)
         self.update_status()
     
@@ -97,6 +161,7 @@ class PDFMergerGUI:
             if pos > 0:
                 self.files[pos], self.files[pos-1] = self.files[pos-1], self.files[pos]
         
+        self.forget_duplicates()
         self.refresh_listbox()
         self.listbox.selection_set(selected[0]-1)
     
@@ -109,19 +174,114 @@ class PDFMergerGUI:
             if pos < len(self.files)-1:
                 self.files[pos], self.files[pos+1] = self.files[pos+1], self.files[pos]
         
+        self.forget_duplicates()
         self.refresh_listbox()
         self.listbox.selection_set(selected[0]+1)
     
+    def forget_duplicates(self):
+        """文件列表改变后清除要跳过的重复页
+
+        重复页保留哪一份是按查找时的列表顺序决定的，删除或移动文件后可能连保留的
+        那一份也不在合并结果中了，需要重新查找。
+        """
+        if not self.skip_pages:
+            return
+        self.skip_pages.clear()
+        self.refresh_listbox()
+        self.status_label.config(text="文件列表已改变，已取消跳过重复页，请重新查找", fg="blue")
+    
     def refresh_listbox(self):
         self.listbox.delete(0, tk.END)
         for file in self.files:
-            self.listbox.insert(tk.END, os.path.basename(file))
+            self.listbox.insert(tk.END, self.list_label(file))
+    
+    def list_label(self, file):
+        label = os.path.basename(file)
+        if self.skip_pages.get(file):
+            label += f"（跳过 {len(self.skip_pages[file])} 个重复页）"
+        return label
     
     def update_status(self):
         count = len(self.files)
         self.status_label.config(text=f"已选择 {count} 个PDF文件")
     
+    def find_duplicate_pages(self):
+        # 检测所有文件中的重复页（包括不同文件之间），第一次出现的页面保留
+        if self.busy:
+            return
+        if not self.files:
+            messagebox.showwarning("警告", "请先添加PDF文件！")
+            return
+        
+        files = list(self.files)
+        self.scan_task = BackgroundTask(
+            self.root,
+            lambda task: self.scan_duplicates(task, files),
+            on_progress=self.show_progress,
+            on_success=lambda duplicates: self.duplicates_found(files, duplicates),
+            on_error=self.scan_failed,
+            on_cancelled=self.scan_cancelled
+        )
+        self.set_busy(True)
+        self.scan_task.start()
+    
+    def scan_duplicates(self, task, files):
+        # 在后台线程中执行，返回 {(文件序号, 页码): (保留的文件序号, 页码)}
+        documents = []
+        for index, file in enumerate(files):
+            task.check_cancelled()
+            task.report(0, f"正在读取第 {index + 1}/{len(files)} 个文件...")
+            with PDFSession(file) as session:
+                documents.append((file, session.stamp, range(session.page_count)))
+        hashes = analyze_documents(documents, 'phash', task)
+        return find_duplicates(sorted(hashes.items()))
+    
+    def duplicates_found(self, files, duplicates):
+        self.set_busy(False)
+        if not duplicates:
+            self.skip_pages.clear()
+            self.refresh_listbox()
+            messagebox.showinfo("查找重复页", "没有发现重复页")
+            self.update_status()
+            return
+        
+        # 列出前几组重复页
+        lines = []
+        for (index, page_num), (kept_index, kept_page) in sorted(duplicates.items())[:10]:
+            lines.append(f"{os.path.basename(files[index])} 第 {page_num + 1} 页 = "
+                         f"{os.path.basename(files[kept_index])} 第 {kept_page + 1} 页")
+        if len(duplicates) > len(lines):
+            lines.append(f"……共 {len(duplicates)} 页")
+        
+        if not messagebox.askyesno("查找重复页",
+                                   f"发现 {len(duplicates)} 个重复页:\n" + "\n".join(lines) +
+                                   "\n\n合并时跳过这些页面吗？"):
+            self.update_status()
+            return
+        
+        self.skip_pages = {}
+        for index, page_num in duplicates:
+            self.skip_pages.setdefault(files[index], set()).add(page_num)
+        self.refresh_listbox()
+        self.status_label.config(text=f"合并时将跳过 {len(duplicates)} 个重复页", fg="blue")
+    
+    def scan_failed(self, error):
+        self.set_busy(False)
+        messagebox.showerror("错误", f"查找重复页失败：{str(error)}")
+        self.status_label.config(text="查找重复页失败！", fg="red")
+    
+    def scan_cancelled(self):
+        self.set_busy(False)
+        self.status_label.config(text="已取消查找重复页", fg="blue")
+    
+    @property
+    def busy(self):
+        return any(task is not None and task.running for task in (self.merge_task, self.scan_task))
+    
     def merge_pdfs(self):
+        if self.busy:
+            return
+        
         if len(self.files) < 2:
             messagebox.showwarning("警告", "请至少选择2个PDF文件进行合并！")
             return
@@ -144,29 +304,97 @@ class PDFMergerGUI:
         if not output_file:
             return
         
-        try:
-            pdf_writer = PyPDF2.PdfWriter()
-            
-            for file in self.files:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in range(len(pdf_reader.pages)):
-                    pdf_writer.add_page(pdf_reader.pages[page])
-            
-            with open(output_file, 'wb') as out:
-                pdf_writer.write(out)
-            
-            messagebox.showinfo("成功", f"PDF合并完成！\n保存至: {output_file}")
-            self.status_label.config(text="合并完成！", fg="green")
+        # 在后台线程中合并，使用文件列表的副本
+        files = list(self.files)
+        streaming = self.streaming_var.get()
+        dedup = self.dedup_var.get()
+        compress = self.compress_var.get()
+        linearize = self.linearize_var.get()
+        image_dpi = DEFAULT_DPI if self.images_var.get() else None
+        skip = {index: set(self.skip_pages[file])
+                for index, file in enumerate(files) if self.skip_pages.get(file)}
+        self.merge_task = BackgroundTask(
+            self.root,
+            lambda task: self.write_merged(task, files, output_file, streaming, dedup, skip, compress,
+                                           linearize, image_dpi),
+            on_progress=self.show_progress,
+            on_success=lambda stats: self.merge_finished(output_file, stats),
+            on_error=self.merge_failed,
+            on_cancelled=self.merge_cancelled
+        )
+        self.set_busy(True)
+        self.merge_task.start()
+    
+    def write_merged(self, task, files, output_file, streaming, dedup, skip=None, compress=False,
+                     linearize=False, image_dpi=None):
+        # 在后台线程中执行，返回合并统计信息
+        return merge_pdfs(files, output_file, task, streaming=streaming, dedup=dedup, skip=skip,
+                          compress=compress, flate=compress, linearize=linearize, image_dpi=image_dpi)
+    
+    def merge_finished(self, output_file, stats):
+        self.set_busy(False)
+        summary = (f"耗时: {stats['seconds']:.1f} 秒，"
+                   f"速度: {format_bytes(stats['throughput'])}/秒，"
+                   f"峰值内存: {format_bytes(stats['peak_rss'])}")
+        if stats.get('dedup_objects'):
+            summary += (f"\n去重: 合并了 {stats['dedup_objects']} 个相同对象，"
+                        f"节省 {format_bytes(stats['bytes_saved'])}")
+        report = ""
+        if stats.get('images'):
+            from pdf_images import format_image_report
+            report = "\n\n" + "\n".join(format_image_report(stats['images']))
+        messagebox.showinfo("成功", f"PDF合并完成！\n保存至: {output_file}\n{summary}{report}")
+        self.status_label.config(text=f"合并完成！{summary}", fg="green")
 
-            # 询问是否打开文件
-            if messagebox.askyesno("打开文件", "是否打开保存的PDF文件？"):
-                os.startfile(output_file)
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"合并失败：{str(e)}")
-            self.status_label.config(text="合并失败！", fg="red")
+        # 询问是否打开文件
+        if messagebox.askyesno("打开文件", "是否打开保存的PDF文件？"):
+            os.startfile(output_file)
+    
+    def merge_failed(self, error):
+        self.set_busy(False)
+        messagebox.showerror("错误", f"合并失败：{str(error)}")
+        self.status_label.config(text="合并失败！", fg="red")
+    
+    def merge_cancelled(self):
+        self.set_busy(False)
+        self.status_label.config(text="已取消合并，未生成输出文件", fg="blue")
+    
+    def cancel_merge(self):
+        if self.merge_task is not None and self.merge_task.running:
+            self.merge_task.cancel()
+            self.cancel_btn.config(state=tk.DISABLED)
+            self.status_label.config(text="正在取消合并...", fg="blue")
+        elif self.scan_task is not None and self.scan_task.running:
+            self.scan_task.cancel()
+            self.cancel_btn.config(state=tk.DISABLED)
+            self.status_label.config(text="正在取消查找重复页...", fg="blue")
+    
+    def set_busy(self, busy):
+        # 合并期间禁用文件列表操作和合并按钮
+        state = tk.DISABLED if busy else tk.NORMAL
+        for btn in self.edit_buttons + [self.merge_btn]:
+            btn.config(state=state)
+        self.cancel_btn.config(state=tk.NORMAL if busy else tk.DISABLED)
+        self.progress_bar['value'] = 0
+    
+    def show_progress(self, fraction, message):
+        self.progress_bar['value'] = fraction * 100
+        self.status_label.config(text=message, fg="blue")
+    
+    def on_close(self):
+        if self.merge_task is not None and self.merge_task.running:
+            if not messagebox.askyesno("确认", "正在合并文件，确定要取消合并并退出吗？"):
+                return
+            # 等待后台线程清理临时文件
+            self.merge_task.cancel()
+            self.merge_task.wait(10)
+        if self.scan_task is not None and self.scan_task.running:
+            self.scan_task.cancel()
+        self.root.destroy()
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = PDFMergerGUI(root)
+    # 窗口显示后再在后台加载PDF解析库
+    finish_startup(root, "pdf_merger", ("PyPDF2", "pdf_stream_writer"))
     root.mainloop()
\ No newline at end of file
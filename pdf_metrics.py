@@ -0,0 +1,243 @@
+"""运行指标
+
+进程峰值内存等指标的跨平台读取，供合并等耗时操作在结束时报告资源占用。
+
+分阶段测量：解析、渲染、图像转换、写出、创建预览控件等阶段用 stage(名称) 包裹，
+每个阶段累计调用次数、耗时、CPU时间、读写字节数和阶段结束时的进程峰值内存，
+stage_report() 取出结果供诊断面板显示或写入批处理日志。SamplingProfiler 是可选
+的采样分析器，定时记录各线程的调用栈，不需要修改被测代码。
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# 每个阶段记录的指标
+STAGE_FIELDS = ("calls", "seconds", "cpu_seconds", "bytes_read", "bytes_written", "peak_rss")
+
+# 各阶段的累计指标 {阶段名: {指标: 数值}}，按第一次出现的顺序排列
+_stages = {}
+_stages_lock = threading.Lock()
+
+
+def peak_rss():
+    """返回当前进程的峰值常驻内存（字节），无法获取时返回None"""
+    if sys.platform == "win32":
+        return _peak_rss_windows()
+    if sys.platform.startswith("linux"):
+        # ru_maxrss 在 execve 后保留父进程的值，/proc 中的 VmHWM 只统计本进程
+        peak = _read_proc_status("VmHWM")
+        if peak is not None:
+            return peak
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 单位为字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _read_proc_status(field):
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _peak_rss_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    try:
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        ok = ctypes.windll.psapi.GetProcessMemoryInfo(
+            handle, ctypes.byref(counters), counters.cb
+        )
+    except (AttributeError, OSError):
+        return None
+    return counters.PeakWorkingSetSize if ok else None
+
+
+def format_bytes(size):
+    """把字节数格式化为便于阅读的字符串"""
+    if size is None:
+        return "未知"
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+
+
+class StageRecord:
+    """一次阶段测量，读写的字节数由调用方在阶段内填写"""
+
+    def __init__(self, name, bytes_read=0, bytes_written=0):
+        self.name = name
+        self.bytes_read = bytes_read
+        self.bytes_written = bytes_written
+
+
+@contextmanager
+def stage(name, bytes_read=0, bytes_written=0):
+    """测量 with 块内的一个阶段
+
+    CPU时间只统计当前线程（后台任务在各自的线程中执行，不计入界面线程的开销）。
+    阶段可以嵌套，嵌套时内层的耗时同时计入外层。
+    """
+    record = StageRecord(name, bytes_read, bytes_written)
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield record
+    finally:
+        record_stage(name, time.perf_counter() - start, time.thread_time() - cpu_start,
+                     record.bytes_read, record.bytes_written)
+
+
+def record_stage(name, seconds, cpu_seconds=0.0, bytes_read=0, bytes_written=0, peak=None):
+    """累加一次阶段测量；在工作进程中测得的数值也由主进程通过此函数汇总"""
+    if peak is None:
+        peak = peak_rss()
+    with _stages_lock:
+        entry = _stages.get(name)
+        if entry is None:
+            entry = _stages[name] = dict.fromkeys(STAGE_FIELDS, 0)
+            entry["seconds"] = entry["cpu_seconds"] = 0.0
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        entry["cpu_seconds"] += cpu_seconds
+        entry["bytes_read"] += bytes_read
+        entry["bytes_written"] += bytes_written
+        entry["peak_rss"] = max(entry["peak_rss"], peak or 0)
+
+
+def stage_report():
+    """返回各阶段累计指标的副本 {阶段名: {指标: 数值}}"""
+    with _stages_lock:
+        return {name: dict(entry) for name, entry in _stages.items()}
+
+
+def reset_stages():
+    """清空已记录的阶段指标"""
+    with _stages_lock:
+        _stages.clear()
+
+
+def merge_stage_reports(reports):
+    """把多个 stage_report() 的结果相加（例如批处理中各任务的指标），峰值内存取最大值"""
+    merged = {}
+    for report in reports:
+        for name, entry in report.items():
+            total = merged.setdefault(name, dict.fromkeys(STAGE_FIELDS, 0))
+            for field in STAGE_FIELDS:
+                if field == "peak_rss":
+                    total[field] = max(total[field], entry.get(field) or 0)
+                else:
+                    total[field] += entry.get(field, 0)
+    return merged
+
+
+def format_stage_report(report):
+    """把阶段指标格式化为文本表格的各行"""
+    # 表头的中文字符占两列宽，数据列相应加宽
+    lines = [f"{'阶段':<16}{'次数':>8}{'耗时(秒)':>10}{'CPU(秒)':>10}"
+             f"{'读取':>12}{'写出':>12}{'峰值内存':>12}"]
+    for name, entry in report.items():
+        lines.append(
+            f"{name:<18}{entry['calls']:>10}{entry['seconds']:>13.3f}{entry['cpu_seconds']:>11.3f}"
+            f"{format_bytes(entry['bytes_read']):>14}{format_bytes(entry['bytes_written']):>14}"
+            f"{format_bytes(entry['peak_rss'] or None):>16}"
+        )
+    return lines
+
+
+class SamplingProfiler:
+    """采样分析器：后台线程每隔 interval 秒记录一次其它线程的调用栈
+
+    开销只取决于采样间隔，与被测代码的函数调用次数无关，可以在正常使用中开启。
+    结果可写成折叠调用栈格式（每行 "线程;函数;函数... 次数"），直接交给
+    flamegraph.pl 或 speedscope 生成火焰图。
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()  # {折叠调用栈: 采样次数}
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def top(self, limit=20):
+        """按自身采样次数（位于栈顶的次数）排序，返回 [(函数, 次数, 占比)]"""
+        own = Counter()
+        for stack, count in self.samples.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        total = sum(own.values()) or 1
+        return [(name, count, count / total) for name, count in own.most_common(limit)]
+
+    def write_collapsed(self, path):
+        """把采样结果写成折叠调用栈文本"""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
@@ -1,10 +1,15 @@
-import PyPDF2
+from pdf_startup import finish_startup
 import os
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk
-import io
-import fitz  # pymupdf
+from pdf_session import PDFSession
+from pdf_core import remove_pages
+from pdf_analysis import BLANK_THRESHOLD, analyze_pages, find_blank_pages, find_duplicates
+from pdf_selection import PageRangeError, PageSelection
+from pdf_tasks import BackgroundTask
+from pdf_diagnostics import show_diagnostics
+from pdf_images import DEFAULT_DPI
+from pdf_preview import ThumbnailRenderer, VirtualPageList
 
 class PDFPageDeleterApp:
     def __init__(self, root):
@@ -20,10 +25,17 @@ class PDFPageDeleterApp:
         
         # 变量初始化
         self.input_path = ""
-        self.pdf_reader = None
+        self.session = None  # 当前文件的文档会话
+        self.save_task = None  # 正在进行的后台保存任务
+        self.analysis_task = None  # 正在进行的页面分析任务（空白页、重复页检测）
+        self.analysis_results = {}  # 当前文件的分析结果 {分析名称: {页码: 结果}}，调整阈值时复用
         self.total_pages = 0
-        self.pages_to_delete = set()  # 存储要删除的页码
-        self.page_previews = []  # 存储页面预览
+        self.pages_to_delete = PageSelection()  # 要删除的页码（区间表示）
+        
+        # 后台缩略图渲染
+        self.thumbnail_renderer = ThumbnailRenderer(self.root)
+        self.thumbnail_renderer.on_idle = self.show_cache_stats
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # 设置样式
         self.setup_styles()
@@ -158,6 +170,71 @@ class PDFPageDeleterApp:
             )
             btn.pack(side='left', padx=2)
         
+        # 按页码范围选择，可选中预览列表中尚未滚动到的页面
+        tk.Label(batch_frame, text="按页码选择（如 1-10,15,20-、odd、even）:",
+                bg=self.bg_color, font=("微软雅黑", 9)).pack(anchor='w', pady=(10, 5))
+        
+        range_frame = tk.Frame(batch_frame, bg=self.bg_color)
+        range_frame.pack(fill='x')
+        
+        self.range_var = tk.StringVar()
+        range_entry = tk.Entry(range_frame, textvariable=self.range_var, font=("微软雅黑", 9), width=18)
+        range_entry.pack(side='left', fill='x', expand=True, padx=(0, 5))
+        range_entry.bind('<Return>', lambda e: self.select_range(True))
+        
+        for text, selected in (("选中", True), ("取消", False)):
+            tk.Button(
+                range_frame,
+                text=text,
+                command=lambda s=selected: self.select_range(s),
+                bg="#e9ecef",
+                fg="#495057",
+                font=("微软雅黑", 9),
+                relief="flat",
+                padx=8,
+                cursor="hand2"
+            ).pack(side='left', padx=2)
+        
+        # 自动选择空白页（扫描件中的空白分隔页）和重复页
+        tk.Label(batch_frame, text="自动选择（空白页：墨迹覆盖率低于阈值）:",
+                bg=self.bg_color, font=("微软雅黑", 9)).pack(anchor='w', pady=(10, 5))
+        
+        blank_frame = tk.Frame(batch_frame, bg=self.bg_color)
+        blank_frame.pack(fill='x')
+        
+        self.blank_threshold_var = tk.StringVar(value=f"{BLANK_THRESHOLD * 100:g}")
+        tk.Entry(blank_frame, textvariable=self.blank_threshold_var, font=("微软雅黑", 9),
+                 width=6).pack(side='left')
+        tk.Label(blank_frame, text="%", bg=self.bg_color,
+                font=("微软雅黑", 9)).pack(side='left', padx=(2, 5))
+        
+        self.blank_btn = tk.Button(
+            blank_frame,
+            text="选择空白页",
+            command=self.select_blank_pages,
+            bg="#e9ecef",
+            fg="#495057",
+            font=("微软雅黑", 9),
+            relief="flat",
+            padx=8,
+            cursor="hand2"
+        )
+        self.blank_btn.pack(side='left', padx=2)
+        
+        # 重复页：感知哈希相近的页面，保留第一次出现的一页
+        self.duplicate_btn = tk.Button(
+            blank_frame,
+            text="选择重复页",
+            command=self.select_duplicate_pages,
+            bg="#e9ecef",
+            fg="#495057",
+            font=("微软雅黑", 9),
+            relief="flat",
+            padx=8,
+            cursor="hand2"
+        )
+        self.duplicate_btn.pack(side='left', padx=2)
+        
         # 删除统计
         self.stats_frame = tk.Frame(left_frame, bg=self.bg_color)
         self.stats_frame.pack(fill='x', pady=(10, 0))
@@ -190,6 +267,73 @@ class PDFPageDeleterApp:
         )
         self.save_btn.pack(fill='x')
         
+        # 压缩输出：把对象压缩进对象流，未压缩的流用 Flate 重新压缩
+        self.compress_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            save_frame,
+            text="压缩输出（文件更小）",
+            variable=self.compress_var,
+            bg=self.bg_color,
+            font=("微软雅黑", 9),
+            anchor='w'
+        ).pack(fill='x', pady=(5, 0))
+        
+        # 快速 Web 视图：线性化输出，浏览器下载完开头部分即可显示第一页
+        self.linearize_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            save_frame,
+            text="快速 Web 视图（线性化）",
+            variable=self.linearize_var,
+            bg=self.bg_color,
+            font=("微软雅黑", 9),
+            anchor='w'
+        ).pack(fill='x')
+        
+        # 压缩图像：有效分辨率过高的扫描图像重新采样到 DEFAULT_DPI
+        self.images_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            save_frame,
+            text=f"压缩图像（重新采样到 {DEFAULT_DPI}dpi）",
+            variable=self.images_var,
+            bg=self.bg_color,
+            font=("微软雅黑", 9),
+            anchor='w'
+        ).pack(fill='x')
+        
+        # 保存进度和取消按钮
+        progress_frame = tk.Frame(save_frame, bg=self.bg_color)
+        progress_frame.pack(fill='x', pady=(10, 0))
+        
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate', maximum=100)
+        self.progress_bar.pack(side='left', fill='x', expand=True, padx=(0, 5))
+        
+        self.cancel_btn = tk.Button(
+            progress_frame,
+            text="取消",
+            command=self.cancel_save,
+            bg="#e9ecef",
+            fg="#495057",
+            font=("微软雅黑", 9),
+            relief="flat",
+            padx=10,
+            cursor="hand2",
+            state='disabled'
+        )
+        self.cancel_btn.pack(side='right')
+        
+        # 各阶段耗时和内存（F12）
+        tk.Button(
+            progress_frame,
+            text="诊断",
+            command=lambda: show_diagnostics(self.root),
+            bg="#e9ecef",
+            fg="#495057",
+            font=("微软雅黑", 9),
+            relief="flat",
+            padx=10,
+            cursor="hand2"
+        ).pack(side='right', padx=(0, 5))
+        
         # 右侧页面预览区域
         right_frame = tk.Frame(main_frame, bg=self.bg_color)
         right_frame.pack(side='right', fill='both', expand=True)
@@ -216,20 +360,17 @@ class PDFPageDeleterApp:
         
         # 创建Canvas和Scrollbar
         self.canvas = tk.Canvas(canvas_frame, bg=self.bg_color, highlightthickness=0)
-        scrollbar = tk.Scrollbar(canvas_frame, orient="vertical", command=self.canvas.yview)
-        
-        # 滚动区域内部框架
-        self.scrollable_frame = tk.Frame(self.canvas, bg=self.bg_color)
-        
-        # 配置Canvas
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        scrollbar = tk.Scrollbar(canvas_frame, orient="vertical")
+        
+        # 虚拟化预览列表：只为可视区域附近的页面创建控件
+        self.preview_list = VirtualPageList(
+            self.canvas,
+            scrollbar,
+            self.thumbnail_renderer,
+            self.build_preview_row,
+            self.bind_preview_row
         )
         
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=scrollbar.set)
-        
         # 鼠标滚轮绑定
         def _on_mousewheel(event):
             self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
@@ -268,114 +409,106 @@ class PDFPageDeleterApp:
     def load_pdf(self):
         """加载PDF文件"""
         try:
-            with open(self.input_path, 'rb') as file:
-                self.pdf_reader = PyPDF2.PdfReader(file)
-                self.total_pages = len(self.pdf_reader.pages)
-                
-                # 重置删除设置
-                self.pages_to_delete = set()
-                self.page_previews = []
-                
-                # 更新UI
-                self.file_info_label.config(
-                    text=f"文件: {os.path.basename(self.input_path)}\n"
-                         f"大小: {os.path.getsize(self.input_path) // 1024} KB\n"
-                         f"页数: {self.total_pages} 页"
-                )
-                
-                self.page_count_label.config(text=f"共 {self.total_pages} 页")
-                self.update_stats()
-                self.save_btn.config(state='normal')
-                self.update_status(f"已加载PDF文件: {os.path.basename(self.input_path)}")
-                
-                # 创建页面预览
-                self.create_page_previews()
-                
+            # 新文件只解析一次，预览和保存共用同一个会话
+            session = PDFSession(self.input_path)
+            if self.session is not None:
+                self.session.close()
+            self.session = session
+            self.total_pages = session.page_count
+            
+            # 重置删除设置
+            self.pages_to_delete = PageSelection(self.total_pages)
+            self.analysis_results = {}
+            
+            # 更新UI
+            self.file_info_label.config(
+                text=f"文件: {os.path.basename(self.input_path)}\n"
+                     f"大小: {self.session.size // 1024} KB\n"
+                     f"页数: {self.total_pages} 页"
+            )
+            
+            self.page_count_label.config(text=f"共 {self.total_pages} 页")
+            self.update_stats()
+            self.save_btn.config(state='normal')
+            self.update_status(f"已加载PDF文件: {os.path.basename(self.input_path)}")
+            
+            # 创建页面预览
+            self.create_page_previews()
+            
         except Exception as e:
             messagebox.showerror("错误", f"无法加载PDF文件:\n{str(e)}")
             self.update_status("加载PDF文件失败")
     
     def create_page_previews(self):
         """创建页面预览"""
-        # 清除旧的预览
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
+        # 丢弃上一个文件尚未完成的渲染任务，按新文件的页数重建预览列表
+        self.thumbnail_renderer.start(self.input_path, self.session.stamp)
+        self.preview_list.set_page_count(self.total_pages)
+    
+    def build_preview_row(self, parent):
+        """创建一个可复用的预览行（由预览列表按需调用）"""
+        # 创建页面框架
+        page_frame = tk.Frame(parent, bg="white", relief="solid", bd=1)
         
-        self.page_previews = []
+        # 页面标题和复选框
+        page_header = tk.Frame(page_frame, bg="#f8f9fa")
+        page_header.pack(fill='x', pady=(5, 0))
         
-        # 打开PDF文件
-        pdf_document = fitz.open(self.input_path)
+        row = {'frame': page_frame, 'page_num': None}
         
-        # 创建每个页面的预览项
-        for page_num in range(min(self.total_pages, 50)):  # 限制预览页数
-            # 获取页面缩略图
-            page = pdf_document[page_num]
-            pix = page.get_pixmap(matrix=fitz.Matrix(0.2, 0.2))  # 缩放因子0.2
-            
-            # 转换为PIL图像
-            img_data = pix.tobytes("ppm")
-            img = Image.open(io.BytesIO(img_data))
-            img = img.resize((150, 200))  # 调整大小
-            photo = ImageTk.PhotoImage(img)
-            
-            # 创建页面框架
-            page_frame = tk.Frame(self.scrollable_frame, bg="white", relief="solid", bd=1)
-            page_frame.pack(fill='x', pady=5, padx=5)
-            
-            # 页面标题和复选框
-            page_header = tk.Frame(page_frame, bg="#f8f9fa")
-            page_header.pack(fill='x', pady=(5, 0))
-            
-            # 复选框变量
-            var = tk.BooleanVar(value=(page_num in self.pages_to_delete))
-            
-            # 复选框
-            delete_checkbox = tk.Checkbutton(
-                page_header,
-                text=f"第 {page_num + 1} 页",
-                variable=var,
-                command=lambda pn=page_num, v=var: self.toggle_page_delete(pn, v),
-                font=("微软雅黑", 10, "bold"),
-                bg="#f8f9fa",
-                selectcolor=self.delete_color,
-                cursor="hand2"
-            )
-            delete_checkbox.pack(side='left', padx=10, pady=5)
-            
-            # 存储页面数据（包括图像引用）
-            page_data = {
-                'frame': page_frame,
-                'checkbox_var': var,
-                'checkbox': delete_checkbox,
-                'page_num': page_num,
-                'image': photo  # 保存图像引用防止被垃圾回收
-            }
-            self.page_previews.append(page_data)
-            
-            # 显示缩略图
-            img_label = tk.Label(
-                page_frame,
-                image=photo,
-                bg="white",
-                relief="groove",
-                bd=1
-            )
-            img_label.pack(padx=10, pady=10)
+        # 复选框变量
+        var = tk.BooleanVar(value=False)
+        
+        # 复选框
+        delete_checkbox = tk.Checkbutton(
+            page_header,
+            variable=var,
+            command=lambda: self.toggle_page_delete(row['page_num'], var),
+            font=("微软雅黑", 10, "bold"),
+            bg="#f8f9fa",
+            selectcolor=self.delete_color,
+            cursor="hand2"
+        )
+        delete_checkbox.pack(side='left', padx=10, pady=5)
         
-        pdf_document.close()
+        # 显示缩略图（渲染完成前为占位图）
+        img_label = tk.Label(
+            page_frame,
+            compound='center',
+            font=("微软雅黑", 9),
+            fg="#7f8c8d",
+            bg="white",
+            relief="groove",
+            bd=1
+        )
+        img_label.pack(padx=10, pady=10)
+        
+        row.update({
+            'checkbox_var': var,
+            'checkbox': delete_checkbox,
+            'image_label': img_label
+        })
+        return row
+    
+    def bind_preview_row(self, row):
+        """按页面的删除状态刷新预览行"""
+        page_num = row['page_num']
+        is_selected = page_num in self.pages_to_delete
+        row['checkbox'].config(text=f"第 {page_num + 1} 页")
+        row['checkbox_var'].set(is_selected)
+        row['frame'].configure(bg="#ffebee" if is_selected else "white")
     
     def toggle_page_delete(self, page_num, var):
         """切换页面删除状态"""
         if var.get():
             self.pages_to_delete.add(page_num)
-            # 高亮显示被选中的页面
-            if page_num < len(self.page_previews):
-                self.page_previews[page_num]['frame'].configure(bg="#ffebee")
         else:
             self.pages_to_delete.discard(page_num)
-            # 恢复原背景色
-            if page_num < len(self.page_previews):
-                self.page_previews[page_num]['frame'].configure(bg="white")
+        
+        # 高亮显示被选中的页面，或恢复原背景色
+        row = self.preview_list.row_for(page_num)
+        if row is not None:
+            self.bind_preview_row(row)
         
         self.update_stats()
         self.update_status(f"第 {page_num + 1} 页 {'标记为删除' if var.get() else '取消删除标记'}")
@@ -394,16 +527,14 @@ class PDFPageDeleterApp:
     
     def select_all_pages(self):
         """全选所有页面"""
-        if not self.pdf_reader:
+        if not self.session:
             messagebox.showwarning("警告", "请先选择PDF文件")
             return
         
-        self.pages_to_delete = set(range(self.total_pages))
+        self.pages_to_delete.select_all()
         
         # 更新所有复选框
-        for page_data in self.page_previews:
-            page_data['checkbox_var'].set(True)
-            page_data['frame'].configure(bg="#ffebee")
+        self.preview_list.refresh_rows()
         
         self.update_stats()
         self.update_status(f"已全选 {self.total_pages} 页")
@@ -413,42 +544,154 @@ class PDFPageDeleterApp:
         self.pages_to_delete.clear()
         
         # 更新所有复选框
-        for page_data in self.page_previews:
-            page_data['checkbox_var'].set(False)
-            page_data['frame'].configure(bg="white")
+        self.preview_list.refresh_rows()
         
         self.update_stats()
         self.update_status("已取消全选")
     
     def invert_selection(self):
         """反选"""
-        if not self.pdf_reader:
+        if not self.session:
             messagebox.showwarning("警告", "请先选择PDF文件")
             return
         
-        # 反选所有页面
-        for page_num in range(self.total_pages):
-            if page_num in self.pages_to_delete:
-                self.pages_to_delete.discard(page_num)
-            else:
-                self.pages_to_delete.add(page_num)
+        # 反选所有页面，只翻转区间端点
+        self.pages_to_delete.invert()
         
         # 更新所有复选框
-        for page_data in self.page_previews:
-            page_num = page_data['page_num']
-            is_selected = page_num in self.pages_to_delete
-            page_data['checkbox_var'].set(is_selected)
-            page_data['frame'].configure(bg="#ffebee" if is_selected else "white")
+        self.preview_list.refresh_rows()
         
         self.update_stats()
         self.update_status("已反选所有页面")
     
+    def select_range(self, selected):
+        """按输入的页码范围表达式选中或取消选中，并滚动到范围的第一页"""
+        if not self.session:
+            messagebox.showwarning("警告", "请先选择PDF文件")
+            return
+        
+        try:
+            pages = PageSelection.parse(self.range_var.get(), self.total_pages)
+        except PageRangeError as e:
+            messagebox.showwarning("页码范围有误", str(e))
+            return
+        if not pages:
+            return
+        
+        if selected:
+            self.pages_to_delete.update(pages)
+        else:
+            self.pages_to_delete.difference_update(pages)
+        
+        self.preview_list.see(pages.bounds[0])
+        self.preview_list.refresh_rows()
+        self.update_stats()
+        self.update_status(f"已{'选中' if selected else '取消选中'} {len(pages)} 页: {pages.to_expression()}")
+    
+    def select_blank_pages(self):
+        """检测空白页并加入删除列表"""
+        if not self.session:
+            messagebox.showwarning("警告", "请先选择PDF文件")
+            return
+        
+        try:
+            threshold = float(self.blank_threshold_var.get()) / 100
+        except ValueError:
+            messagebox.showwarning("阈值有误", "请输入墨迹覆盖率百分比，例如 0.02")
+            return
+        
+        self.run_analysis('blank', lambda scores: self.apply_blank_pages(scores, threshold))
+    
+    def select_duplicate_pages(self):
+        """检测重复页并加入删除列表（每组重复页保留第一页）"""
+        if not self.session:
+            messagebox.showwarning("警告", "请先选择PDF文件")
+            return
+        
+        self.run_analysis('phash', self.apply_duplicate_pages)
+    
+    def run_analysis(self, analysis, on_done):
+        """在后台分析所有页面，完成后以 {页码: 结果} 调用 on_done；同一文件只分析一次"""
+        results = self.analysis_results.get(analysis)
+        if results is not None:
+            on_done(results)
+            return
+        if self.busy:
+            return
+        
+        session = self.session
+        self.analysis_task = BackgroundTask(
+            self.root,
+            lambda task: analyze_pages(session.path, session.stamp,
+                                       range(session.page_count), analysis, task),
+            on_progress=self.show_progress,
+            on_success=lambda results: self.analysis_finished(session, analysis, results, on_done),
+            on_error=self.analysis_failed,
+            on_cancelled=self.analysis_cancelled
+        )
+        self.set_busy(True)
+        self.analysis_task.start()
+    
+    def analysis_finished(self, session, analysis, results, on_done):
+        """页面分析完成"""
+        self.set_busy(False)
+        # 分析期间换了文件时丢弃结果
+        if session is not self.session:
+            return
+        self.analysis_results[analysis] = results
+        on_done(results)
+    
+    def analysis_failed(self, error):
+        self.set_busy(False)
+        messagebox.showerror("错误", f"分析页面时出错:\n{str(error)}")
+        self.update_status("页面分析失败")
+    
+    def analysis_cancelled(self):
+        self.set_busy(False)
+        self.update_status("已取消页面分析")
+    
+    def apply_blank_pages(self, scores, threshold):
+        """按阈值把空白页加入删除列表"""
+        blank_pages = find_blank_pages(scores, threshold)
+        if not blank_pages:
+            self.update_status(f"没有墨迹覆盖率低于 {threshold * 100:g}% 的页面")
+            return
+        self.add_detected_pages(blank_pages, "空白页")
+    
+    def apply_duplicate_pages(self, hashes):
+        """把重复页加入删除列表"""
+        duplicates = find_duplicates(sorted(hashes.items()))
+        if not duplicates:
+            self.update_status("没有发现重复页")
+            return
+        self.add_detected_pages(sorted(duplicates), "重复页")
+    
+    def add_detected_pages(self, pages, kind):
+        """把检测到的页面（升序页码列表）加入删除列表并滚动到第一页"""
+        selection = PageSelection.from_pages(pages, self.total_pages)
+        self.pages_to_delete.update(selection)
+        
+        self.preview_list.see(pages[0])
+        self.preview_list.refresh_rows()
+        self.update_stats()
+        self.update_status(f"已选中 {len(pages)} 个{kind}: {selection.to_expression()}")
+    
     def save_pdf(self):
         """保存删除页面后的PDF"""
-        if not self.input_path or not self.pdf_reader:
+        if not self.input_path or not self.session:
             messagebox.showwarning("警告", "请先选择PDF文件")
             return
         
+        # 上一次保存或页面分析尚未完成
+        if self.busy:
+            return
+        
+        # 文件在加载之后被其它程序修改时，需要重新加载
+        if self.session.is_changed():
+            if messagebox.askyesno("文件已修改", "PDF文件在加载后已被修改，是否重新加载？"):
+                self.load_pdf()
+            return
+        
         # 检查是否选择了要删除的页面
         if not self.pages_to_delete:
             if not messagebox.askyesno("确认", "没有选择要删除的页面，确定要保存原文件吗？"):
@@ -466,52 +709,134 @@ class PDFPageDeleterApp:
         if not output_path:
             return
         
-        try:
-            # 执行删除操作
-            with open(self.input_path, 'rb') as input_file:
-                reader = PyPDF2.PdfReader(input_file)
-                writer = PyPDF2.PdfWriter()
-                
-                for page_num in range(len(reader.pages)):
-                    # 如果页面不在删除列表中，则添加到输出
-                    if page_num not in self.pages_to_delete:
-                        page = reader.pages[page_num]
-                        writer.add_page(page)
-                
-                # 保存文件
-                with open(output_path, 'wb') as output_file:
-                    writer.write(output_file)
-            
-            # 成功消息
-            remaining_pages = self.total_pages - len(self.pages_to_delete)
-            messagebox.showinfo(
-                "完成",
-                f"PDF已成功保存！\n"
-                f"文件: {os.path.basename(output_path)}\n"
-                f"原始页数: {self.total_pages} 页\n"
-                f"删除页数: {len(self.pages_to_delete)} 页\n"
-                f"保留页数: {remaining_pages} 页\n"
-                f"保存位置: {output_path}"
-            )
-            
-            self.update_status(f"PDF已保存: {os.path.basename(output_path)}")
-            
-            # 询问是否打开文件
-            if messagebox.askyesno("打开文件", "是否打开保存的PDF文件？"):
-                os.startfile(output_path)
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"保存PDF时出错:\n{str(e)}")
-            self.update_status("保存失败")
+        # 在后台线程中保存，使用删除列表的副本，保存期间的勾选不影响本次输出
+        pages_to_delete = self.pages_to_delete.copy()
+        compress = self.compress_var.get()
+        linearize = self.linearize_var.get()
+        image_dpi = DEFAULT_DPI if self.images_var.get() else None
+        self.save_task = BackgroundTask(
+            self.root,
+            lambda task: self.write_output(task, output_path, pages_to_delete, compress, linearize,
+                                           image_dpi),
+            on_progress=self.show_progress,
+            on_success=lambda result: self.save_finished(output_path, pages_to_delete, result),
+            on_error=self.save_failed,
+            on_cancelled=self.save_cancelled
+        )
+        self.set_busy(True)
+        self.save_task.start()
+    
+    def write_output(self, task, output_path, pages_to_delete, compress=False, linearize=False,
+                     image_dpi=None):
+        """执行删除操作并写入文件（在后台线程中执行）"""
+        # 直接使用加载时的解析结果
+        return remove_pages(self.session, pages_to_delete, output_path, task,
+                            compress=compress, flate=compress, linearize=linearize, image_dpi=image_dpi)
+    
+    def save_finished(self, output_path, pages_to_delete, result):
+        """保存完成"""
+        from pdf_images import format_image_report
+        from pdf_prune import format_prune_report
+
+        self.set_busy(False)
+        
+        # 成功消息，附输出大小报告和图像重新采样报告
+        remaining_pages = self.total_pages - len(pages_to_delete)
+        lines = format_prune_report(result)
+        if result.get('images'):
+            lines += format_image_report(result['images'])
+        report = "\n".join(lines)
+        messagebox.showinfo(
+            "完成",
+            f"PDF已成功保存！\n"
+            f"文件: {os.path.basename(output_path)}\n"
+            f"原始页数: {self.total_pages} 页\n"
+            f"删除页数: {len(pages_to_delete)} 页\n"
+            f"保留页数: {remaining_pages} 页\n"
+            f"保存位置: {output_path}"
+            + (f"\n\n{report}" if report else "")
+        )
+        
+        self.update_status(f"PDF已保存: {os.path.basename(output_path)}")
+        
+        # 询问是否打开文件
+        if messagebox.askyesno("打开文件", "是否打开保存的PDF文件？"):
+            os.startfile(output_path)
+    
+    def save_failed(self, error):
+        """保存出错"""
+        self.set_busy(False)
+        messagebox.showerror("错误", f"保存PDF时出错:\n{str(error)}")
+        self.update_status("保存失败")
+    
+    def save_cancelled(self):
+        """保存已取消"""
+        self.set_busy(False)
+        self.update_status("已取消保存，未生成输出文件")
+    
+    def cancel_save(self):
+        """取消正在进行的保存或页面分析"""
+        if self.save_task is not None and self.save_task.running:
+            self.save_task.cancel()
+            self.cancel_btn.config(state='disabled')
+            self.update_status("正在取消保存...")
+        elif self.analysis_task is not None and self.analysis_task.running:
+            self.analysis_task.cancel()
+            self.cancel_btn.config(state='disabled')
+            self.update_status("正在取消页面分析...")
+    
+    @property
+    def busy(self):
+        """是否有保存或页面分析正在进行"""
+        return any(task is not None and task.running for task in (self.save_task, self.analysis_task))
+    
+    def set_busy(self, busy):
+        """保存期间禁用保存和切换文件，避免重复保存或关闭正在使用的文件"""
+        self.save_btn.config(state='disabled' if busy else 'normal')
+        self.select_btn.config(state='disabled' if busy else 'normal')
+        self.blank_btn.config(state='disabled' if busy else 'normal')
+        self.duplicate_btn.config(state='disabled' if busy else 'normal')
+        self.cancel_btn.config(state='normal' if busy else 'disabled')
+        self.progress_bar['value'] = 0
+    
+    def show_progress(self, fraction, message):
+        """显示保存进度"""
+        self.progress_bar['value'] = fraction * 100
+        self.update_status(message)
     
     def update_status(self, message):
         """更新状态栏"""
         self.status_bar.config(text=f"状态: {message}")
-        self.root.update()
+        self.root.update_idletasks()
+    
+    def show_cache_stats(self):
+        """缩略图全部显示后，在状态栏显示缓存命中情况"""
+        stats = self.thumbnail_renderer.stats()
+        self.status_bar.config(
+            text=f"状态: 预览已就绪（缓存命中 {stats['hits']} 页，新渲染 {stats['misses']} 页）"
+        )
+    
+    def on_close(self):
+        """关闭窗口时停止后台渲染和保存"""
+        if self.save_task is not None and self.save_task.running:
+            if not messagebox.askyesno("确认", "正在保存文件，确定要取消保存并退出吗？"):
+                return
+            # 等待后台线程清理临时文件
+            self.save_task.cancel()
+            self.save_task.wait(10)
+        if self.analysis_task is not None and self.analysis_task.running:
+            self.analysis_task.cancel()
+        
+        self.thumbnail_renderer.shutdown()
+        if self.session is not None:
+            self.session.close()
+        self.root.destroy()
 
 def main():
     root = tk.Tk()
     app = PDFPageDeleterApp(root)
+    # 窗口显示后再在后台加载PDF解析和渲染库
+    finish_startup(root, "pdf_page_remover", ("PyPDF2", "fitz", "PIL.ImageTk"))
     root.mainloop()
 
 if __name__ == "__main__":
@@ -1,10 +1,16 @@
-import PyPDF2
+from pdf_startup import finish_startup
 import os
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk
-import io
-import fitz  # pymupdf
+from pdf_session import PDFSession
+from pdf_core import rotate_pages
+from pdf_analysis import analyze_pages, needs_review, orientation_rotations
+from pdf_tasks import BackgroundTask
+from pdf_diagnostics import show_diagnostics
+from pdf_images import DEFAULT_DPI
+from pdf_preview import ThumbnailRenderer, VirtualPageList
+from pdf_rotation import RotationModel
+from pdf_selection import PageRangeError, PageSelection
 
 class PDFRotatorApp:
     def __init__(self, root):
@@ -20,10 +26,17 @@ class PDFRotatorApp:
         
         # 变量初始化
         self.input_path = ""
-        self.pdf_reader = None
+        self.session = None  # 当前文件的文档会话
+        self.save_task = None  # 正在进行的后台保存任务
+        self.orient_task = None  # 正在进行的方向检测任务
+        self.orientations = {}  # 方向检测结果 {页码: (角度, 置信度, 来源)}
         self.total_pages = 0
-        self.rotations = {}  # 存储页码和旋转角度 {页码: 角度}
-        self.page_previews = []  # 存储页面预览
+        self.rotations = RotationModel()  # 各页面的旋转角度
+        
+        # 后台缩略图渲染
+        self.thumbnail_renderer = ThumbnailRenderer(self.root)
+        self.thumbnail_renderer.on_idle = self.show_cache_stats
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # 设置样式
         self.setup_styles()
@@ -139,7 +152,8 @@ class PDFRotatorApp:
         batch_buttons = [
             ("顺时针90°", 90),
             ("逆时针90°", 270),
-            ("旋转180°", 180)
+            ("旋转180°", 180),
+            ("全部重置", 0)
         ]
         
         for text, angle in batch_buttons:
@@ -156,6 +170,52 @@ class PDFRotatorApp:
             )
             btn.pack(side='left', padx=2, pady=5)
         
+        # 按页码范围旋转，可旋转预览列表中尚未滚动到的页面
+        tk.Label(batch_frame, text="按页码旋转（如 1-10,15,20-、odd、even）:",
+                bg=self.bg_color, font=("微软雅黑", 9)).pack(anchor='w', pady=(10, 5))
+        
+        self.range_var = tk.StringVar()
+        range_entry = tk.Entry(batch_frame, textvariable=self.range_var, font=("微软雅黑", 9))
+        range_entry.pack(fill='x')
+        range_entry.bind('<Return>', lambda e: self.rotate_range(90))
+        
+        range_btn_frame = tk.Frame(batch_frame, bg=self.bg_color)
+        range_btn_frame.pack(fill='x')
+        
+        range_buttons = [
+            ("↶ 逆90°", -90),
+            ("↷ 顺90°", 90),
+            ("↻ 180°", 180),
+            ("↺ 重置", 0)
+        ]
+        
+        for text, angle_change in range_buttons:
+            tk.Button(
+                range_btn_frame,
+                text=text,
+                command=lambda ac=angle_change: self.rotate_range(ac),
+                bg="#e9ecef",
+                fg="#495057",
+                font=("微软雅黑", 9),
+                relief="flat",
+                padx=8,
+                cursor="hand2"
+            ).pack(side='left', padx=2, pady=5)
+        
+        # 自动检测方向：有文字层时按文字方向，扫描件按文字行的投影轮廓
+        self.orient_btn = tk.Button(
+            batch_frame,
+            text="🧭 自动检测方向",
+            command=self.auto_orient,
+            bg="#e9ecef",
+            fg="#495057",
+            font=("微软雅黑", 9),
+            relief="flat",
+            padx=10,
+            cursor="hand2"
+        )
+        self.orient_btn.pack(anchor='w', pady=(10, 0))
+        
         # 保存按钮
         save_frame = tk.Frame(left_frame, bg=self.bg_color)
         save_frame.pack(fill='x', pady=(20, 0))
@@ -175,6 +235,62 @@ class PDFRotatorApp:
         )
         self.save_btn.pack(fill='x')
         
+        # 保存方式：增量更新只在原文件末尾追加修改过的页面，保存大文件时快得多；
+        # 压缩输出重写整个文件，把对象压缩进对象流；快速 Web 视图重写为线性化文件；
+        # 压缩图像把分辨率过高的图像重新采样
+        self.incremental_var = tk.BooleanVar(value=True)
+        self.in_place_var = tk.BooleanVar(value=False)
+        self.compress_var = tk.BooleanVar(value=False)
+        self.linearize_var = tk.BooleanVar(value=False)
+        self.images_var = tk.BooleanVar(value=False)
+        for text, var in (("快速保存（增量更新，只追加修改的页面）", self.incremental_var),
+                          ("直接修改原文件（不另存）", self.in_place_var),
+                          ("压缩输出（文件更小，不使用增量更新）", self.compress_var),
+                          ("快速 Web 视图（线性化，不使用增量更新）", self.linearize_var),
+                          (f"压缩图像（重新采样到 {DEFAULT_DPI}dpi，不使用增量更新）", self.images_var)):
+            tk.Checkbutton(
+                save_frame,
+                text=text,
+                variable=var,
+                bg=self.bg_color,
+                font=("微软雅黑", 9),
+                anchor='w'
+            ).pack(fill='x', pady=(5, 0))
+        
+        # 保存进度和取消按钮
+        progress_frame = tk.Frame(save_frame, bg=self.bg_color)
+        progress_frame.pack(fill='x', pady=(10, 0))
+        
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate', maximum=100)
+        self.progress_bar.pack(side='left', fill='x', expand=True, padx=(0, 5))
+        
+        self.cancel_btn = tk.Button(
+            progress_frame,
+            text="取消",
+            command=self.cancel_save,
+            bg="#e9ecef",
+            fg="#495057",
+            font=("微软雅黑", 9),
+            relief="flat",
+            padx=10,
+            cursor="hand2",
+            state='disabled'
+        )
+        self.cancel_btn.pack(side='right')
+        
+        # 各阶段耗时和内存（F12）
+        tk.Button(
+            progress_frame,
+            text="诊断",
+            command=lambda: show_diagnostics(self.root),
+            bg="#e9ecef",
+            fg="#495057",
+            font=("微软雅黑", 9),
+            relief="flat",
+            padx=10,
+            cursor="hand2"
+        ).pack(side='right', padx=(0, 5))
+        
         # 右侧页面预览区域
         right_frame = tk.Frame(main_frame, bg=self.bg_color)
         right_frame.pack(side='right', fill='both', expand=True)
@@ -201,20 +317,18 @@ class PDFRotatorApp:
         
         # 创建Canvas和Scrollbar
         self.canvas = tk.Canvas(canvas_frame, bg=self.bg_color, highlightthickness=0)
-        scrollbar = tk.Scrollbar(canvas_frame, orient="vertical", command=self.canvas.yview)
-        
-        # 滚动区域内部框架
-        self.scrollable_frame = tk.Frame(self.canvas, bg=self.bg_color)
-        
-        # 配置Canvas
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        scrollbar = tk.Scrollbar(canvas_frame, orient="vertical")
+        
+        # 虚拟化预览列表：只为可视区域附近的页面创建控件
+        self.preview_list = VirtualPageList(
+            self.canvas,
+            scrollbar,
+            self.thumbnail_renderer,
+            self.build_preview_row,
+            self.bind_preview_row,
+            rotation_for=lambda page_num: self.rotations.get(page_num, 0)
         )
         
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=scrollbar.set)
-        
         # 鼠标滚轮绑定
         def _on_mousewheel(event):
             self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
@@ -253,245 +367,430 @@ class PDFRotatorApp:
     def load_pdf(self):
         """加载PDF文件"""
         try:
-            with open(self.input_path, 'rb') as file:
-                self.pdf_reader = PyPDF2.PdfReader(file)
-                self.total_pages = len(self.pdf_reader.pages)
-                
-                # 重置旋转设置
-                self.rotations = {}
-                self.page_previews = []
-                
-                # 更新UI
-                self.file_info_label.config(
-                    text=f"文件: {os.path.basename(self.input_path)}\n"
-                         f"大小: {os.path.getsize(self.input_path) // 1024} KB\n"
-                         f"页数: {self.total_pages} 页"
-                )
-                
-                self.page_count_label.config(text=f"共 {self.total_pages} 页")
-                self.save_btn.config(state='normal')
-                self.update_status(f"已加载PDF文件: {os.path.basename(self.input_path)}")
-                
-                # 创建页面预览
-                self.create_page_previews()
-                
+            # 新文件只解析一次，预览和保存共用同一个会话
+            session = PDFSession(self.input_path)
+            if self.session is not None:
+                self.session.close()
+            self.session = session
+            self.total_pages = session.page_count
+            
+            # 重置旋转设置
+            self.rotations = RotationModel(self.total_pages)
+            self.orientations = {}
+            
+            # 更新UI
+            self.file_info_label.config(
+                text=f"文件: {os.path.basename(self.input_path)}\n"
+                     f"大小: {self.session.size // 1024} KB\n"
+                     f"页数: {self.total_pages} 页"
+            )
+            
+            self.page_count_label.config(text=f"共 {self.total_pages} 页")
+            self.save_btn.config(state='normal')
+            self.update_status(f"已加载PDF文件: {os.path.basename(self.input_path)}")
+            
+            # 创建页面预览
+            self.create_page_previews()
+            
         except Exception as e:
             messagebox.showerror("错误", f"无法加载PDF文件:\n{str(e)}")
             self.update_status("加载PDF文件失败")
     
     def create_page_previews(self):
         """创建页面预览"""
-        # 清除旧的预览
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
+        # 丢弃上一个文件尚未完成的渲染任务，按新文件的页数重建预览列表
+        self.thumbnail_renderer.start(self.input_path, self.session.stamp)
+        self.preview_list.set_page_count(self.total_pages)
+    
+    def build_preview_row(self, parent):
+        """创建一个可复用的预览行（由预览列表按需调用）"""
+        # 创建页面框架
+        page_frame = tk.Frame(parent, bg="white", relief="solid", bd=1)
         
-        self.page_previews = []
+        # 页面标题
+        page_header = tk.Frame(page_frame, bg="#f8f9fa")
+        page_header.pack(fill='x', pady=(5, 0))
         
-        # 打开PDF文件
-        pdf_document = fitz.open(self.input_path)
+        title_label = tk.Label(
+            page_header,
+            font=("微软雅黑", 10, "bold"),
+            bg="#f8f9fa"
+        )
+        title_label.pack(side='left', padx=10, pady=5)
         
-        # 创建每个页面的预览项
-        for page_num in range(min(self.total_pages, 50)):  # 限制预览页数
-            # 获取页面缩略图
-            page = pdf_document[page_num]
-            pix = page.get_pixmap(matrix=fitz.Matrix(0.2, 0.2))  # 缩放因子0.2
-            
-            # 转换为PIL图像
-            img_data = pix.tobytes("ppm")
-            img = Image.open(io.BytesIO(img_data))
-            img = img.resize((150, 200))  # 调整大小
-            photo = ImageTk.PhotoImage(img)
-            
-            # 创建页面框架
-            page_frame = tk.Frame(self.scrollable_frame, bg="white", relief="solid", bd=1)
-            page_frame.pack(fill='x', pady=5, padx=5)
-            
-            # 页面标题
-            page_header = tk.Frame(page_frame, bg="#f8f9fa")
-            page_header.pack(fill='x', pady=(5, 0))
-            
-            tk.Label(
-                page_header,
-                text=f"第 {page_num + 1} 页",
-                font=("微软雅黑", 10, "bold"),
-                bg="#f8f9fa"
-            ).pack(side='left', padx=10, pady=5)
-            
-            # 旋转控制
-            control_frame = tk.Frame(page_header, bg="#f8f9fa")
-            control_frame.pack(side='right', padx=10)
-            
-            # 旋转角度标签
-            angle_label = tk.Label(
-                control_frame,
-                text="旋转: 0°",
-                font=("微软雅黑", 9),
-                bg="#f8f9fa",
-                width=10
-            )
-            angle_label.pack(side='left', padx=5)
-            
-            # 旋转按钮
-            btn_frame = tk.Frame(control_frame, bg="#f8f9fa")
-            btn_frame.pack(side='left')
-            
-            # 存储页面数据（包括图像引用）
-            page_data = {
-                'frame': page_frame,
-                'angle_label': angle_label,
-                'page_num': page_num,
-                'current_angle': 0,
-                'image': photo  # 保存图像引用防止被垃圾回收
-            }
-            self.page_previews.append(page_data)
-            
-            # 创建旋转按钮
-            buttons = [
-                ("↶ 逆90°", -90),
-                ("↷ 顺90°", 90),
-                ("↻ 180°", 180),
-                ("↺ 重置", 0)
-            ]
-            
-            for text, angle_change in buttons:
-                btn = tk.Button(
-                    btn_frame,
-                    text=text,
-                    command=lambda pn=page_num, ac=angle_change: self.rotate_single_page(pn, ac),
-                    bg="#e9ecef",
-                    fg="#495057",
-                    font=("微软雅黑", 8),
-                    relief="flat",
-                    padx=5,
-                    cursor="hand2"
-                )
-                btn.pack(side='left', padx=2)
-            
-            # 显示缩略图
-            img_label = tk.Label(
-                page_frame,
-                image=photo,
-                bg="white",
-                relief="groove",
-                bd=1
-            )
-            img_label.pack(padx=10, pady=10)
+        # 自动检测的方向和置信度
+        detect_label = tk.Label(
+            page_header,
+            font=("微软雅黑", 8),
+            bg="#f8f9fa"
+        )
+        detect_label.pack(side='left')
         
-        pdf_document.close()
-    
-    def rotate_single_page(self, page_num, angle_change):
-        """旋转单个页面"""
-        if page_num not in self.rotations:
-            self.rotations[page_num] = 0
+        # 旋转控制
+        control_frame = tk.Frame(page_header, bg="#f8f9fa")
+        control_frame.pack(side='right', padx=10)
         
-        # 计算新的角度
-        new_angle = (self.rotations[page_num] + angle_change) % 360
-        self.rotations[page_num] = new_angle
+        # 旋转角度标签
+        angle_label = tk.Label(
+            control_frame,
+            text="旋转: 0°",
+            font=("微软雅黑", 9),
+            bg="#f8f9fa",
+            width=10
+        )
+        angle_label.pack(side='left', padx=5)
+        
+        # 旋转按钮
+        btn_frame = tk.Frame(control_frame, bg="#f8f9fa")
+        btn_frame.pack(side='left')
+        
+        row = {
+            'frame': page_frame,
+            'title_label': title_label,
+            'angle_label': angle_label,
+            'detect_label': detect_label,
+            'page_num': None
+        }
+        
+        # 创建旋转按钮
+        buttons = [
+            ("↶ 逆90°", -90),
+            ("↷ 顺90°", 90),
+            ("↻ 180°", 180),
+            ("↺ 重置", 0)
+        ]
         
-        # 更新UI
-        page_data = self.page_previews[page_num]
-        page_data['current_angle'] = new_angle
-        page_data['angle_label'].config(text=f"旋转: {new_angle}°")
+        for text, angle_change in buttons:
+            btn = tk.Button(
+                btn_frame,
+                text=text,
+                command=lambda ac=angle_change: self.rotate_single_page(row['page_num'], ac),
+                bg="#e9ecef",
+                fg="#495057",
+                font=("微软雅黑", 8),
+                relief="flat",
+                padx=5,
+                cursor="hand2"
+            )
+            btn.pack(side='left', padx=2)
         
-        # 高亮显示
-        page_data['frame'].configure(bg="#e3f2fd")
-        self.root.after(300, lambda: page_data['frame'].configure(bg="white"))
+        # 显示缩略图（渲染完成前为占位图）
+        img_label = tk.Label(
+            page_frame,
+            compound='center',
+            font=("微软雅黑", 9),
+            fg="#7f8c8d",
+            bg="white",
+            relief="groove",
+            bd=1
+        )
+        img_label.pack(padx=10, pady=10)
+        row['image_label'] = img_label
+        return row
+    
+    def bind_preview_row(self, row):
+        """按页面的旋转角度刷新预览行"""
+        page_num = row['page_num']
+        row['title_label'].config(text=f"第 {page_num + 1} 页")
+        row['angle_label'].config(text=f"旋转: {self.rotations.get(page_num, 0)}°")
+        
+        # 自动检测的结果和置信度，需要人工检查的页面标为橙色
+        detected = self.orientations.get(page_num)
+        if detected is not None:
+            angle, confidence, source = detected
+            # 扫描件只判断了横竖方向，是否上下颠倒需要人工检查
+            kind = "横竖方向" if source == 'image' else "检测"
+            row['detect_label'].config(
+                text=f"{kind}: {angle}°，置信度 {confidence:.0%}",
+                fg="#e67e22" if needs_review(detected) else "#7f8c8d"
+            )
+        else:
+            row['detect_label'].config(text="")
+        row['frame'].configure(bg="white")
+    
+    def rotate_single_page(self, page_num, angle_change):
+        """旋转单个页面，angle_change 为0时重置该页"""
+        if angle_change:
+            self.rotations.rotate(page_num, angle_change)
+        else:
+            self.rotations.set(page_num, 0)
+        new_angle = self.rotations.get(page_num)
+        
+        # 更新UI（页面不在可视区域时无需刷新）
+        row = self.preview_list.row_for(page_num)
+        if row is not None:
+            self.preview_list.refresh_page(page_num)
+            
+            # 高亮显示
+            row['frame'].configure(bg="#e3f2fd")
+            self.root.after(300, lambda: row['frame'].configure(bg="white"))
         
         self.update_status(f"第 {page_num + 1} 页设置为 {new_angle}° 旋转")
     
     def rotate_all_pages(self, angle):
-        """旋转所有页面到指定角度"""
-        if not self.pdf_reader:
+        """旋转所有页面到指定角度，angle 为0时重置所有页面"""
+        if not self.session:
             messagebox.showwarning("警告", "请先选择PDF文件")
             return
         
         # 确认操作
-        if not messagebox.askyesno("确认", f"确定要将所有 {self.total_pages} 页旋转 {angle} 度吗？"):
+        action = f"旋转 {angle} 度" if angle else "重置（取消旋转）"
+        if not messagebox.askyesno("确认", f"确定要将所有 {self.total_pages} 页{action}吗？"):
             return
         
-        # 设置所有页面的旋转角度
-        for page_num in range(self.total_pages):
-            self.rotations[page_num] = angle
-            
-            # 更新UI
-            if page_num < len(self.page_previews):
-                page_data = self.page_previews[page_num]
-                page_data['current_angle'] = angle
-                page_data['angle_label'].config(text=f"旋转: {angle}°")
+        # 设置所有页面的旋转角度，只需刷新可见的预览行
+        self.rotations.set_all(angle)
+        self.preview_list.refresh_rows()
+        
+        if angle:
+            self.update_status(f"所有页面已设置为 {angle}° 旋转")
+            messagebox.showinfo("完成", f"已设置所有页面旋转 {angle}°")
+        else:
+            self.update_status("所有页面已重置")
+            messagebox.showinfo("完成", "已重置所有页面的旋转")
+    
+    def rotate_range(self, angle_change):
+        """按输入的页码范围表达式旋转页面，angle_change 为0时重置这些页面"""
+        if not self.session:
+            messagebox.showwarning("警告", "请先选择PDF文件")
+            return
         
-        self.update_status(f"所有页面已设置为 {angle}° 旋转")
-        messagebox.showinfo("完成", f"已设置所有页面旋转 {angle}°")
+        try:
+            pages = PageSelection.parse(self.range_var.get(), self.total_pages)
+        except PageRangeError as e:
+            messagebox.showwarning("页码范围有误", str(e))
+            return
+        if not pages:
+            return
+        
+        if angle_change:
+            self.rotations.rotate_pages(pages, angle_change)
+        else:
+            self.rotations.set_pages(pages, 0)
+        
+        self.preview_list.see(pages.bounds[0])
+        self.preview_list.refresh_rows()
+        action = f"旋转 {angle_change % 360}°" if angle_change else "重置"
+        self.update_status(f"已{action} {len(pages)} 页: {pages.to_expression()}，"
+                           f"共 {self.rotations.rotated_count} 页有旋转")
+    
+    def auto_orient(self):
+        """在后台检测所有页面的方向，完成后按检测结果设置旋转"""
+        if not self.session:
+            messagebox.showwarning("警告", "请先选择PDF文件")
+            return
+        if self.busy:
+            return
+        
+        session = self.session
+        self.orient_task = BackgroundTask(
+            self.root,
+            lambda task: analyze_pages(session.path, session.stamp,
+                                       range(session.page_count), 'orient', task),
+            on_progress=self.show_progress,
+            on_success=lambda results: self.orient_finished(session, results),
+            on_error=self.orient_failed,
+            on_cancelled=self.orient_cancelled
+        )
+        self.set_busy(True)
+        self.orient_task.start()
+    
+    def orient_finished(self, session, orientations):
+        """方向检测完成，置信度足够的页面直接设置旋转"""
+        self.set_busy(False)
+        # 检测期间换了文件时丢弃结果
+        if session is not self.session:
+            return
+        
+        self.orientations = orientations
+        uncertain = orientation_rotations(orientations, self.rotations)
+        self.preview_list.refresh_rows()
+        
+        message = f"方向检测完成，{self.rotations.rotated_count} 页需要旋转"
+        if uncertain:
+            message += f"，{len(uncertain)} 页需要检查未设置（第 {uncertain[0] + 1} 页起，已标为橙色）"
+            self.preview_list.see(uncertain[0])
+        scanned = sum(1 for _, _, source in orientations.values() if source == 'image')
+        if scanned:
+            message += f"；{scanned} 页没有文字层，竖排的页面未自动旋转，上下颠倒的页面请手动旋转180°"
+        self.update_status(message)
+    
+    def orient_failed(self, error):
+        self.set_busy(False)
+        messagebox.showerror("错误", f"检测页面方向时出错:\n{str(error)}")
+        self.update_status("方向检测失败")
+    
+    def orient_cancelled(self):
+        self.set_busy(False)
+        self.update_status("已取消方向检测")
     
     def save_pdf(self):
         """保存旋转后的PDF"""
-        if not self.input_path or not self.pdf_reader:
+        if not self.input_path or not self.session:
             messagebox.showwarning("警告", "请先选择PDF文件")
             return
         
+        # 上一次保存或方向检测尚未完成
+        if self.busy:
+            return
+        
+        # 文件在加载之后被其它程序修改时，需要重新加载
+        if self.session.is_changed():
+            if messagebox.askyesno("文件已修改", "PDF文件在加载后已被修改，是否重新加载？"):
+                self.load_pdf()
+            return
+        
         # 检查是否有旋转设置
         if not self.rotations:
             if not messagebox.askyesno("确认", "没有设置任何旋转，确定要继续吗？"):
                 return
         
-        # 选择保存位置
-        default_name = os.path.splitext(os.path.basename(self.input_path))[0] + "_rotated.pdf"
-        output_path = filedialog.asksaveasfilename(
-            title="保存旋转后的PDF",
-            initialfile=default_name,
-            defaultextension=".pdf",
-            filetypes=[("PDF文件", "*.pdf"), ("所有文件", "*.*")]
+        in_place = self.in_place_var.get()
+        incremental = self.incremental_var.get()
+        compress = self.compress_var.get()
+        linearize = self.linearize_var.get()
+        image_dpi = DEFAULT_DPI if self.images_var.get() else None
+        if in_place:
+            if not messagebox.askyesno("确认", "将直接在原文件末尾追加旋转后的页面，确定要修改原文件吗？"):
+                return
+            output_path = self.input_path
+        else:
+            # 选择保存位置
+            default_name = os.path.splitext(os.path.basename(self.input_path))[0] + "_rotated.pdf"
+            output_path = filedialog.asksaveasfilename(
+                title="保存旋转后的PDF",
+                initialfile=default_name,
+                defaultextension=".pdf",
+                filetypes=[("PDF文件", "*.pdf"), ("所有文件", "*.*")]
+            )
+            
+            if not output_path:
+                return
+        
+        # 在后台线程中保存，使用旋转设置的副本，保存期间的修改不影响本次输出
+        rotations = self.rotations.copy()
+        self.save_task = BackgroundTask(
+            self.root,
+            lambda task: self.write_output(task, output_path, rotations, incremental, in_place, compress,
+                                           linearize, image_dpi),
+            on_progress=self.show_progress,
+            on_success=lambda result: self.save_finished(output_path, rotations, in_place, result),
+            on_error=self.save_failed,
+            on_cancelled=self.save_cancelled
         )
+        self.set_busy(True)
+        self.save_task.start()
+    
+    def write_output(self, task, output_path, rotations, incremental=False, in_place=False,
+                     compress=False, linearize=False, image_dpi=None):
+        """执行旋转并写入文件（在后台线程中执行）"""
+        # 直接使用加载时的解析结果
+        return rotate_pages(self.session, rotations, output_path, task,
+                            incremental=incremental, in_place=in_place,
+                            compress=compress, flate=compress, linearize=linearize, image_dpi=image_dpi)
+    
+    def save_finished(self, output_path, rotations, in_place=False, result=None):
+        """保存完成"""
+        self.set_busy(False)
         
-        if not output_path:
-            return
+        # 原文件已被修改，重新加载，旋转设置以文件中的新状态为准
+        if in_place:
+            self.load_pdf()
         
-        try:
-            # 执行旋转
-            with open(self.input_path, 'rb') as input_file:
-                reader = PyPDF2.PdfReader(input_file)
-                writer = PyPDF2.PdfWriter()
-                
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    
-                    # 应用旋转（如果有的话）
-                    if page_num in self.rotations and self.rotations[page_num] != 0:
-                        page.rotate(self.rotations[page_num])
-                    
-                    writer.add_page(page)
-                
-                # 保存文件
-                with open(output_path, 'wb') as output_file:
-                    writer.write(output_file)
-            
-            # 成功消息
-            rotation_count = sum(1 for angle in self.rotations.values() if angle != 0)
-            messagebox.showinfo(
-                "完成",
-                f"PDF已成功保存！\n"
-                f"文件: {os.path.basename(output_path)}\n"
-                f"已旋转页面: {rotation_count} 页\n"
-                f"保存位置: {output_path}"
-            )
-            
-            self.update_status(f"PDF已保存: {os.path.basename(output_path)}")
-            
-            # 询问是否打开文件
-            if messagebox.askyesno("打开文件", "是否打开保存的PDF文件？"):
-                os.startfile(output_path)
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"保存PDF时出错:\n{str(e)}")
-            self.update_status("保存失败")
+        # 成功消息
+        rotation_count = rotations.rotated_count
+        report = ""
+        if result and result.get('images'):
+            from pdf_images import format_image_report
+            report = "\n\n" + "\n".join(format_image_report(result['images']))
+        messagebox.showinfo(
+            "完成",
+            f"PDF已成功保存！\n"
+            f"文件: {os.path.basename(output_path)}\n"
+            f"已旋转页面: {rotation_count} 页\n"
+            f"保存位置: {output_path}"
+            + report
+        )
+        
+        self.update_status(f"PDF已保存: {os.path.basename(output_path)}")
+        
+        # 询问是否打开文件
+        if messagebox.askyesno("打开文件", "是否打开保存的PDF文件？"):
+            os.startfile(output_path)
+    
+    def save_failed(self, error):
+        """保存出错"""
+        self.set_busy(False)
+        messagebox.showerror("错误", f"保存PDF时出错:\n{str(error)}")
+        self.update_status("保存失败")
+    
+    def save_cancelled(self):
+        """保存已取消"""
+        self.set_busy(False)
+        self.update_status("已取消保存，未生成输出文件")
+    
+    def cancel_save(self):
+        """取消正在进行的保存或方向检测"""
+        if self.save_task is not None and self.save_task.running:
+            self.save_task.cancel()
+            self.cancel_btn.config(state='disabled')
+            self.update_status("正在取消保存...")
+        elif self.orient_task is not None and self.orient_task.running:
+            self.orient_task.cancel()
+            self.cancel_btn.config(state='disabled')
+            self.update_status("正在取消方向检测...")
+    
+    @property
+    def busy(self):
+        """是否有保存或方向检测正在进行"""
+        return any(task is not None and task.running for task in (self.save_task, self.orient_task))
+    
+    def set_busy(self, busy):
+        """保存期间禁用保存和切换文件，避免重复保存或关闭正在使用的文件"""
+        self.save_btn.config(state='disabled' if busy else 'normal')
+        self.select_btn.config(state='disabled' if busy else 'normal')
+        self.orient_btn.config(state='disabled' if busy else 'normal')
+        self.cancel_btn.config(state='normal' if busy else 'disabled')
+        self.progress_bar['value'] = 0
+    
+    def show_progress(self, fraction, message):
+        """显示保存进度"""
+        self.progress_bar['value'] = fraction * 100
+        self.update_status(message)
     
     def update_status(self, message):
         """更新状态栏"""
         self.status_bar.config(text=f"状态: {message}")
-        self.root.update()
+        self.root.update_idletasks()
+    
+    def show_cache_stats(self):
+        """缩略图全部显示后，在状态栏显示缓存命中情况"""
+        stats = self.thumbnail_renderer.stats()
+        self.status_bar.config(
+            text=f"状态: 预览已就绪（缓存命中 {stats['hits']} 页，新渲染 {stats['misses']} 页）"
+        )
+    
+    def on_close(self):
+        """关闭窗口时停止后台渲染和保存"""
+        if self.save_task is not None and self.save_task.running:
+            if not messagebox.askyesno("确认", "正在保存文件，确定要取消保存并退出吗？"):
+                return
+            # 等待后台线程清理临时文件
+            self.save_task.cancel()
+            self.save_task.wait(10)
+        if self.orient_task is not None and self.orient_task.running:
+            self.orient_task.cancel()
+        
+        self.thumbnail_renderer.shutdown()
+        if self.session is not None:
+            self.session.close()
+        self.root.destroy()
 
 def main():
     root = tk.Tk()
     app = PDFRotatorApp(root)
+    # 窗口显示后再在后台加载PDF解析和渲染库
+    finish_startup(root, "pdf_page_rotator", ("PyPDF2", "fitz", "PIL.ImageTk"))
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,294 @@
+"""原样复制未修改的对象
+
+删除页面和旋转页面时，保留页面的内容流、字体、图像等对象与原文件逐字节相同。
+passthrough_copy 按原文件交叉引用表中的偏移量，直接从会话的内存映射中把这些对象
+的原始字节复制到输出，保留原对象号，不解析、不重新序列化；只重建页面树、保留的
+页面字典（去掉 /Parent、写入继承的属性和新的 /Rotate）和交叉引用表。对象之间的
+引用通过扫描原始字节中的 "对象号 代号 R" 得到，只复制保留的页面、文档目录和文档
+信息能访问到的对象；指向已删除页面的引用对应的对象号保持空闲，阅读器按 null 处理。
+
+位于对象流（PDF 1.5 压缩对象）中的对象没有独立的原始字节，以及原始字节与交叉
+引用表对不上的对象，改为用 PyPDF2 解析后写出。加密文件不能原样复制。
+
+删除了页面时，先由 pdf_prune 去掉指向已删除页面的书签、命名目标、链接和表单域，
+再统计没有写入输出的对象按类型节省的字节数。
+
+压缩输出（compress=True）时，原样复制的非流对象去掉对象头后放入对象流；flate=True
+时没有过滤器的流改为解析后压缩写出。
+"""
+import re
+from PyPDF2.generic import DictionaryObject, IndirectObject, NameObject, NumberObject
+from pdf_incremental import _xref_size
+from pdf_prune import prune_plan, reclaimed_by_type
+from pdf_stream_writer import INHERITABLE_PAGE_KEYS, SourceImporter, StreamingPdfWriter, serialize
+from pdf_tasks import NullTask
+
+# 对象头，交叉引用表中的偏移量可能指向对象头之前的空白
+_OBJECT_HEADER = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+# 间接引用；字符串中偶尔出现的同样文字只会多复制一个对象
+_REFERENCE = re.compile(rb"(\d+)\s+(\d+)\s+R(?![^\s()<>\[\]{}/%])")
+# 流对象的字典结束和 stream 关键字，数据从其后的换行开始
+_STREAM_KEYWORD = re.compile(rb">>\s*stream\r?\n")
+_STREAM_LENGTH = re.compile(rb"/Length\s+(\d+)(?:\s+(\d+)\s+R)?")
+_STREAM_FILTER = re.compile(rb"/Filter\b")
+_STREAM_END = re.compile(rb"\s*endstream\s*endobj")
+_VERSION = re.compile(rb"%PDF-(\d\.\d)")
+
+
+class PassthroughError(Exception):
+    """文件不能原样复制对象（例如已加密），应改用 PdfWriter 重新序列化"""
+
+
+def check_passthrough(session):
+    """检查会话中的文件能否原样复制对象，不能时抛出 PassthroughError"""
+    reader = session.reader
+    if reader.is_encrypted:
+        raise PassthroughError("加密的PDF不能原样复制对象")
+    if not isinstance(dict.get(reader.trailer, "/Root"), IndirectObject):
+        raise PassthroughError("文档目录不是间接对象")
+
+
+def passthrough_copy(session, pages, output_stream, task=None, compress=False, flate=False,
+                     overrides=None):
+    """把 pages 中的页面复制到 output_stream，未修改的对象原样复制
+
+    pages 为 [(从0开始的页码, 追加的顺时针角度)]，每页最多出现一次；compress /
+    flate 见 pdf_stream_writer.StreamingPdfWriter；overrides 为 {(对象号, 代号):
+    代替原对象写出的对象}（例如重新采样的图像，见 pdf_images）。返回
+    {'pages': 页数, 'raw_objects': 原样复制的对象数, 'parsed_objects': 解析后写出的
+    对象数, 'raw_bytes': 原样复制的字节数, 'output_bytes': 输出字节数,
+    'pruned': 删除的书签、命名目标、链接和表单域个数, 'reclaimed': 按类型统计的
+    未写入对象（见 pdf_prune.reclaimed_by_type，没有删除页面时为空）}。
+    """
+    task = task or NullTask()
+    check_passthrough(session)
+    reader = session.reader
+    root = dict.__getitem__(reader.trailer, "/Root")
+    pages_root = dict.__getitem__(root.get_object(), "/Pages")
+
+    # 沿用原页面树根节点的对象号，文档目录中的 /Pages 因此可以原样复制
+    version = _VERSION.match(session._map, 0, 1024)
+    writer = StreamingPdfWriter(
+        output_stream,
+        version=version.group(1).decode("ascii") if version else "1.7",
+        first_num=_xref_size(reader),
+        pages_num=pages_root.idnum,
+        compress=compress,
+        flate=flate,
+    )
+    if pages_root.generation:
+        writer.generations[pages_root.idnum] = pages_root.generation
+
+    plan = None
+    if len(pages) < session.page_count:
+        kept = set()
+        for page_index, _ in pages:
+            ref = reader.pages[page_index].indirect_reference
+            if ref is not None:
+                kept.add((ref.idnum, ref.generation))
+        plan = prune_plan(reader, kept)
+
+    copier = RawObjectCopier(session, writer, task, plan, overrides)
+    copier.skip_page_tree(pages_root)
+    for done, (page_index, rotate) in enumerate(pages, 1):
+        task.check_cancelled()
+        copier.copy_page(page_index, rotate)
+        task.report(0.95 * done / len(pages), f"正在复制页面 {page_index + 1}/{session.page_count}")
+
+    copier.copy(root)
+    info = dict.get(reader.trailer, "/Info")
+    info = (info.idnum, info.generation) if isinstance(info, IndirectObject) else None
+    if info is not None:
+        copier.copy(IndirectObject(*info, reader))
+    writer.close(root=(root.idnum, root.generation), info_ref=info, first_id=_first_id(reader.trailer))
+
+    reclaimed = {}
+    if plan is not None:
+        written = {(num, writer.generations.get(num, 0)) for num in (*writer.offsets, *writer.packed)}
+        reclaimed = reclaimed_by_type(copier, written)
+    return {
+        'pages': len(writer.page_nums),
+        'raw_objects': copier.raw_objects,
+        'parsed_objects': copier.parsed_objects,
+        'raw_bytes': copier.raw_bytes,
+        'output_bytes': writer.position,
+        'pruned': plan.removed if plan is not None else {},
+        'reclaimed': reclaimed,
+    }
+
+
+class RawObjectCopier:
+    """按引用关系把一个文档中的对象原样复制到 StreamingPdfWriter，保留原对象号"""
+
+    def __init__(self, session, writer, task=None, plan=None, overrides=None):
+        self.reader = session.reader
+        self.data = session._map
+        self.writer = writer
+        self.task = task or NullTask()
+        self.plan = plan  # pdf_prune.PrunePlan
+        # 代替原始字节写出的对象：删除页面时修改过的对象和调用方指定的对象
+        self.overrides = dict(plan.overrides) if plan is not None else {}
+        self.overrides.update(overrides or {})
+        self.raw_objects = 0
+        self.parsed_objects = 0
+        self.raw_bytes = 0
+        self._seen = set()  # 已复制、已排队或不应复制的 (对象号, 代号)
+        self._queue = []
+
+    def skip_page_tree(self, pages_root):
+        """页面和页面树节点由 copy_page 和新页面树代替，不原样复制"""
+        nodes = [pages_root]
+        while nodes:
+            ref = nodes.pop()
+            key = (ref.idnum, ref.generation)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            for kid in ref.get_object().get("/Kids", ()):
+                if isinstance(kid, IndirectObject):
+                    nodes.append(kid)
+
+    def copy_page(self, page_index, rotate=0):
+        """写出修改后的页面字典，并复制它引用的所有对象"""
+        page = self.reader.pages[page_index]
+        ref = page.indirect_reference
+        if ref is None or self.writer.is_written(ref.idnum):
+            raise PassthroughError(f"第 {page_index + 1} 页不能原样复制")
+
+        page_dict = DictionaryObject()
+        for key, value in page.items():
+            if key != "/Parent":
+                page_dict[NameObject(key)] = value
+        if self.plan is not None and (ref.idnum, ref.generation) in self.plan.annots:
+            page_dict[NameObject("/Annots")] = self.plan.annots[(ref.idnum, ref.generation)]
+        # 中间的页面树节点不再保留，继承的属性写入页面本身
+        for key in INHERITABLE_PAGE_KEYS:
+            if key not in page_dict:
+                inherited = SourceImporter._inherited(page, key)
+                if inherited is not None:
+                    page_dict[NameObject(key)] = inherited
+        if rotate % 360:
+            current = int(page_dict.get("/Rotate", 0))
+            page_dict[NameObject("/Rotate")] = NumberObject((current + rotate) % 360)
+        page_dict[NameObject("/Parent")] = IndirectObject(self.writer.pages_num, 0, None)
+
+        if ref.generation:
+            self.writer.generations[ref.idnum] = ref.generation
+        self.writer.write_raw(ref.idnum, serialize(page_dict, self._ref_for))
+        self.writer.page_nums.append(ref.idnum)
+        self._drain()
+
+    def copy(self, ref):
+        """复制一个间接对象及其引用的所有对象"""
+        self._enqueue(ref.idnum, ref.generation)
+        self._drain()
+
+    def _ref_for(self, ind):
+        if ind.pdf is None:
+            # 新页面树
+            return ind.idnum, self.writer.generations.get(ind.idnum, 0)
+        self._enqueue(ind.idnum, ind.generation)
+        return ind.idnum, ind.generation
+
+    def _enqueue(self, num, generation):
+        key = (num, generation)
+        if key not in self._seen:
+            self._seen.add(key)
+            self._queue.append(key)
+
+    def _drain(self):
+        while self._queue:
+            num, generation = self._queue.pop()
+            if (self.raw_objects + self.parsed_objects) % 256 == 0:
+                self.task.check_cancelled()
+            self._copy_object(num, generation)
+
+    def _copy_object(self, num, generation):
+        reader = self.reader
+        if (num, generation) in self.overrides:
+            self._write_parsed(num, generation, self.overrides[(num, generation)])
+            return
+        if generation == 0 and num in reader.xref_objStm:
+            self._copy_parsed(num, generation)
+            return
+        offset = reader.xref.get(generation, {}).get(num)
+        if offset is None or reader.xref_free_entry.get(generation, {}).get(num):
+            # 不存在的对象：对象号保持空闲
+            return
+
+        extent = self._extent(num, generation, offset)
+        if extent is None:
+            self._copy_parsed(num, generation)
+            return
+        start, dictionary_end, end = extent
+        is_stream = dictionary_end != end - len(b"endobj")
+        if is_stream and self.writer.flate and not _STREAM_FILTER.search(self.data, start, dictionary_end):
+            # 未压缩的流重新压缩
+            self._copy_parsed(num, generation)
+            return
+        if self.writer.compress and not is_stream and generation == 0:
+            # 放入对象流的只是对象头和 endobj 之间的内容
+            body_start = _OBJECT_HEADER.match(self.data, start).end()
+            self.writer.write_raw(num, self.data[body_start:dictionary_end])
+        else:
+            self.writer.write_verbatim(num, generation, self.data[start:end])
+        self.raw_objects += 1
+        self.raw_bytes += end - start
+        # 流数据中不会有引用，只扫描字典部分
+        for match in _REFERENCE.finditer(self.data, start, dictionary_end):
+            self._enqueue(int(match.group(1)), int(match.group(2)))
+
+    def _extent(self, num, generation, offset):
+        """返回对象在原文件中的 (开始, 字典结束, 结束) 位置，与交叉引用表不符时返回 None"""
+        data = self.data
+        header = _OBJECT_HEADER.match(data, offset)
+        if header is None or (int(header.group(1)), int(header.group(2))) != (num, generation):
+            return None
+        start = header.start(1)
+        endobj = data.find(b"endobj", header.end())
+        if endobj < 0:
+            return None
+        stream = _STREAM_KEYWORD.search(data, header.end(), endobj)
+        if stream is None:
+            return start, endobj, endobj + len(b"endobj")
+
+        # 流数据中可能出现 endobj，按 /Length 跳过数据
+        length = self._stream_length(data[header.end():stream.start() + 2])
+        if length is None:
+            return None
+        end = _STREAM_END.match(data, stream.end() + length)
+        if end is None:
+            return None
+        return start, stream.start() + 2, end.end()
+
+    def _stream_length(self, dictionary):
+        match = _STREAM_LENGTH.search(dictionary)
+        if match is None:
+            return None
+        if match.group(2) is None:
+            return int(match.group(1))
+        length = self.reader.get_object(IndirectObject(int(match.group(1)), int(match.group(2)), self.reader))
+        try:
+            return int(length)
+        except (TypeError, ValueError):
+            return None
+
+    def _copy_parsed(self, num, generation):
+        obj = self.reader.get_object(IndirectObject(num, generation, self.reader))
+        if obj is not None:
+            self._write_parsed(num, generation, obj)
+
+    def _write_parsed(self, num, generation, obj):
+        if generation:
+            self.writer.generations[num] = generation
+        self.writer.write_raw(num, serialize(obj, self._ref_for, self.writer.flate))
+        self.parsed_objects += 1
+
+
+def _first_id(trailer):
+    """原文件标识的第一部分，输出沿用它，第二部分重新生成"""
+    file_id = trailer.get("/ID")
+    if not file_id:
+        return None
+    first = file_id[0]
+    return getattr(first, "original_bytes", None) or bytes(first, "latin-1")
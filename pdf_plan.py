@@ -0,0 +1,209 @@
+"""编辑计划
+
+EditPlan 按顺序记录对若干输入文件的页面操作（删除、旋转），执行时合并、删除和
+旋转在同一次流式写出中完成：每个输入文件只读取一次，输出只序列化一次，不产生
+中间文件。计划可以保存为 JSON，之后换一组输入文件重新执行。
+
+    {"version": 1,
+     "inputs": ["a.pdf", "b.pdf"],
+     "steps": [{"op": "remove", "pages": "1", "file": "each"},
+               {"op": "rotate", "pages": "landscape", "angle": 90},
+               {"op": "remove", "pages": "3-4", "file": 2}]}
+
+页码范围的语法同 pdf_selection，另外支持 landscape / portrait（按显示方向为横向或
+纵向的页面）。file 指定操作的范围：省略时页码指合并后的全部页面，"each" 表示对
+每个文件分别应用，数字表示第几个文件（从1开始）。页码总是指原始页面，与前面的
+删除无关；同一页面的多次旋转角度累加。
+"""
+import json
+import os
+from pdf_rotation import RotationModel
+from pdf_selection import PageRangeError, PageSelection
+from pdf_session import PDFSession
+from pdf_tasks import NullTask
+
+PLAN_VERSION = 1
+OPERATIONS = ("remove", "rotate")
+ORIENTATION_KEYWORDS = ("landscape", "portrait")
+
+
+class EditPlan:
+    """页面编辑计划：输入文件列表和按顺序执行的操作"""
+
+    def __init__(self, inputs=(), steps=()):
+        self.inputs = list(inputs)
+        self.steps = []
+        for step in steps:
+            self.add_step(step)
+
+    def add_step(self, step):
+        """添加一个操作字典，检查字段，有误时抛出 ValueError"""
+        op = step.get("op")
+        if op not in OPERATIONS:
+            raise ValueError(f"未知的操作: {op}（可用: {', '.join(OPERATIONS)}）")
+        if not step.get("pages"):
+            raise ValueError(f"{op} 操作缺少字段 pages: {step}")
+        scope = step.get("file")
+        if scope is not None and scope != "each" and not (isinstance(scope, int) and scope >= 1):
+            raise ValueError(f"file 应为从1开始的文件序号或 \"each\": {step}")
+        if op == "rotate" and (not isinstance(step.get("angle"), int) or step["angle"] % 90):
+            raise ValueError(f"旋转角度必须是90的倍数: {step}")
+        self.steps.append(dict(step))
+
+    def remove(self, pages, file=None):
+        """删除页面；file 为 None（合并后的页码）、"each" 或从1开始的文件序号"""
+        self.add_step(_step("remove", pages, file))
+
+    def rotate(self, pages, angle, file=None):
+        """在页面原有方向上追加顺时针旋转"""
+        step = _step("rotate", pages, file)
+        step["angle"] = angle
+        self.add_step(step)
+
+    def with_inputs(self, inputs):
+        """返回操作相同、输入文件不同的计划（重新执行保存的计划）"""
+        return EditPlan(inputs, self.steps)
+
+    def to_dict(self):
+        return {"version": PLAN_VERSION, "inputs": self.inputs, "steps": self.steps}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version", PLAN_VERSION) > PLAN_VERSION:
+            raise ValueError(f"编辑计划版本 {data['version']} 过新，请升级程序")
+        return cls(data.get("inputs", ()), data.get("steps", ()))
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8-sig") as f:
+            return cls.from_dict(json.load(f))
+
+    def resolve(self, index, session, offset, total):
+        """计算第 index 个文件（合并后从 offset 开始，全部共 total 页）要复制的页面
+
+        返回 [(页码, 追加的顺时针角度)]，页码从0开始。
+        """
+        count = session.page_count
+        removed = PageSelection(count)
+        rotations = RotationModel(count)
+        for step in self.steps:
+            scope = step.get("file")
+            if scope is None:
+                pages = _local(_select(step["pages"], session, offset, total), offset, count)
+            elif scope == "each" or scope == index + 1:
+                pages = _select(step["pages"], session, 0, count)
+            else:
+                continue
+            if step["op"] == "remove":
+                removed.update(pages)
+            else:
+                rotations.rotate_pages(pages, step["angle"])
+        removed.invert()
+        return [(page_num, rotations.get(page_num)) for page_num in removed]
+
+    def execute(self, output_path, task=None, dedup=False, compress=False, flate=False, linearize=False,
+                image_dpi=None):
+        """执行计划，结果写入 output_path，返回与 merge_pdfs 相同的统计信息
+
+        dedup、compress 和 flate 见 pdf_stream_writer.StreamingPdfWriter，linearize 和
+        image_dpi 见 pdf_core（线性化输出不使用对象流，忽略 compress）。
+        """
+        from pdf_core import open_output
+        from pdf_stream_writer import stream_merge
+
+        task = task or NullTask()
+        compress = compress and not linearize
+        images = {'dpi': image_dpi} if image_dpi is not None else None
+        if not self.inputs:
+            raise ValueError("编辑计划没有输入文件")
+        for index, step in enumerate(self.steps):
+            scope = step.get("file")
+            if isinstance(scope, int) and scope > len(self.inputs):
+                raise PageRangeError(f"第 {index + 1} 个操作指定了第 {scope} 个文件，"
+                                     f"但只有 {len(self.inputs)} 个输入文件")
+
+        # 合并后的页码需要知道每个文件的页数（只读取页面树根节点）
+        counts = []
+        if any(step.get("file") is None for step in self.steps):
+            for path in self.inputs:
+                with PDFSession(path) as session:
+                    counts.append(session.page_count)
+        offsets = [sum(counts[:index]) for index in range(len(counts))]
+        total = sum(counts)
+
+        def pages_for(index, session):
+            return self.resolve(index, session, offsets[index] if counts else 0, total)
+
+        with open_output(output_path, task, linearize, images, compress, flate) as out:
+            stats = stream_merge(self.inputs, out, task, dedup=dedup, pages_for=pages_for,
+                                 compress=compress, flate=flate)
+            if not stats['pages']:
+                # 在 with 块内抛出，不替换目标文件
+                raise PageRangeError("编辑计划删除了全部页面")
+        if linearize or images:
+            stats['output_bytes'] = os.path.getsize(output_path)
+        if images is not None:
+            stats['images'] = images
+        return stats
+
+
+def _step(op, pages, file):
+    step = {"op": op, "pages": pages}
+    if file is not None:
+        step["file"] = file
+    return step
+
+
+def _select(expression, session, offset, total):
+    """解析页码范围，返回共 total 页中的 PageSelection
+
+    当前文件的第一页在 total 页中的序号为 offset。数字范围和 odd/even/all 在全部
+    total 页中选择，landscape / portrait 只检查当前文件的页面。
+    """
+    selection = PageSelection(total)
+    parts = []
+    for part in expression.replace(" ", "").split(","):
+        keyword = part.lower()
+        if keyword in ORIENTATION_KEYWORDS:
+            landscape = keyword == "landscape"
+            pages = [offset + page_num for page_num, page in enumerate(session.pages)
+                     if _is_landscape(page) == landscape]
+            selection.update(PageSelection.from_pages(pages, total))
+        elif part:
+            parts.append(part)
+    if parts:
+        selection.update(PageSelection.parse(",".join(parts), total))
+    return selection
+
+
+def _local(selection, offset, count):
+    """取合并后页码 [offset, offset + count) 中的部分，换算为文件内的页码"""
+    local = PageSelection(count)
+    for start, stop in selection.ranges():
+        local.add_range(start - offset, stop - offset)
+    return local
+
+
+def _is_landscape(page):
+    """页面按显示方向（考虑 /Rotate）是否宽大于高"""
+    from pdf_stream_writer import SourceImporter
+
+    box = None
+    for key in ("/CropBox", "/MediaBox"):
+        box = page.get(key) or SourceImporter._inherited(page, key)
+        if box is not None:
+            break
+    if box is None:
+        return False
+    left, bottom, right, top = (float(value) for value in box.get_object())
+    rotate = page.get("/Rotate")
+    if rotate is None:
+        rotate = SourceImporter._inherited(page, "/Rotate") or 0
+    width, height = abs(right - left), abs(top - bottom)
+    if int(rotate) % 180:
+        width, height = height, width
+    return width > height
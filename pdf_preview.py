@@ -0,0 +1,455 @@
+"""页面缩略图后台渲染
+
+PDF页面删除工具和旋转工具共用的预览渲染模块。页面光栅化在进程池中进行
+（PyMuPDF 不支持多线程调用），渲染结果通过 root.after 轮询回送到 Tk 主线程，
+由主线程创建 PhotoImage 并显示。渲染过的缩略图保存在磁盘缓存中，
+再次打开同一文件时直接读取。
+"""
+import os
+import queue
+import threading
+import time
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pdf_metrics import record_stage, stage
+from pdf_startup import lazy_import
+from pdf_thumbcache import ThumbnailCache
+
+# 渲染库在第一次生成缩略图时才加载
+fitz = lazy_import("fitz")  # pymupdf
+Image = lazy_import("PIL.Image")
+ImageTk = lazy_import("PIL.ImageTk")
+
+# 缩略图最大尺寸（宽, 高），页面按原比例缩放到此范围内
+THUMB_SIZE = (150, 200)
+THUMB_BOX = f"{THUMB_SIZE[0]}x{THUMB_SIZE[1]}"  # 缓存键中的尺寸标识
+
+# 工作进程内已打开的文档 {(路径, 修改时间): fitz文档}
+_worker_documents = {}
+# 工作进程内的磁盘缓存 {缓存目录: ThumbnailCache}
+_worker_caches = {}
+
+
+def _open_document(path, stamp):
+    """在工作进程中打开文档，同一文件的后续页面复用已解析的文档"""
+    key = (path, stamp)
+    document = _worker_documents.get(key)
+    if document is None:
+        # 工作进程同一时间只服务一个文件，打开新文件前关闭旧文件
+        for old_document in _worker_documents.values():
+            old_document.close()
+        _worker_documents.clear()
+        document = fitz.open(path)
+        _worker_documents[key] = document
+    return document
+
+
+def thumbnail_matrix(page, rotation=0, box=THUMB_SIZE):
+    """计算渲染矩阵，使页面旋转后按原比例一次光栅化到 box 范围内"""
+    rect = page.rect  # 已考虑页面自身的 /Rotate
+    width, height = (rect.width, rect.height) if rotation % 180 == 0 else (rect.height, rect.width)
+    zoom = min(box[0] / width, box[1] / height)
+    return fitz.Matrix(zoom, zoom).prerotate(rotation)
+
+
+def render_thumbnail(path, stamp, page_num, rotation=0, cache_dir=None, file_key=None):
+    """渲染单页缩略图（在工作进程中执行）
+
+    返回 (原始缩略图, 是否来自缓存, (耗时, CPU时间))，原始缩略图为
+    (模式, 宽, 高, 像素数据)，由主线程直接交给 PIL/Tk，不再经过图像编码和二次缩放。
+    提供 cache_dir 和 file_key 时先查磁盘缓存，未命中再渲染并写入缓存。
+    """
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    cache = None
+    if cache_dir and file_key:
+        cache = _worker_caches.get(cache_dir)
+        if cache is None:
+            cache = _worker_caches[cache_dir] = ThumbnailCache(cache_dir)
+        thumb = cache.get(file_key, page_num, THUMB_BOX, rotation)
+        if thumb is not None:
+            return thumb, True, (time.perf_counter() - start, time.process_time() - cpu_start)
+
+    page = _open_document(path, stamp)[page_num]
+    pix = page.get_pixmap(matrix=thumbnail_matrix(page, rotation), alpha=False)
+    thumb = ("RGB", pix.width, pix.height, pix.samples)
+
+    if cache is not None:
+        cache.put(file_key, page_num, THUMB_BOX, rotation, thumb)
+    return thumb, False, (time.perf_counter() - start, time.process_time() - cpu_start)
+
+
+def thumbnail_to_photo(thumb):
+    """把原始缩略图转换为 PhotoImage（直接引用像素数据，不复制、不解码）"""
+    mode, width, height, samples = thumb
+    img = Image.frombuffer(mode, (width, height), samples, "raw", mode, 0, 1)
+    return ImageTk.PhotoImage(img)
+
+
+class ThumbnailRenderer:
+    """后台缩略图渲染器"""
+
+    POLL_INTERVAL = 30  # 轮询渲染结果的间隔（毫秒）
+    POLL_BUDGET = 0.015  # 每次轮询最多占用主线程的时间（秒）
+
+    def __init__(self, root, max_workers=None, cache=None):
+        self.root = root
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.cache = cache if cache is not None else ThumbnailCache()
+        self.on_idle = None  # 所有渲染任务完成后的回调
+
+        self.path = ""
+        self.stamp = 0
+        self.file_key = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._executor = None
+        self._results = queue.Queue()  # 工作线程 -> 主线程
+        self._generation = 0  # 每换一个文件加一，丢弃过期结果
+        self._pending = {}  # {页码: future}
+        self._unsaved = []  # 文件哈希算出前渲染、尚未写入缓存的缩略图 [(页码, 旋转角度, 缩略图)]
+        self._poll_id = None
+        self._placeholder = None
+
+    @property
+    def placeholder(self):
+        """渲染完成前显示的空白占位图"""
+        if self._placeholder is None:
+            self._placeholder = tk.PhotoImage(master=self.root, width=THUMB_SIZE[0], height=THUMB_SIZE[1])
+        return self._placeholder
+
+    def start(self, path, stamp=None):
+        """切换到新文件，丢弃旧文件尚未完成的渲染任务
+
+        stamp 为文件加载时的修改时间（见 PDFSession.stamp），工作进程据此区分
+        同一路径下文件的不同版本。
+        """
+        self.cancel()
+        self.path = path
+        self.stamp = os.stat(path).st_mtime_ns if stamp is None else stamp
+        self.cache_hits = 0
+        self.cache_misses = 0
+        try:
+            # 打开过的文件已记录哈希，可以立即查缓存
+            self.file_key = self.cache.known_file_key(path, self.stamp)
+        except OSError:
+            self.file_key = None
+
+        # 在后台线程中计算文件内容哈希并整理缓存，计算完成前的页面不查缓存直接渲染
+        generation = self._generation
+        threading.Thread(
+            target=self._prepare_cache, args=(generation, path, self.stamp), daemon=True
+        ).start()
+        self._schedule_poll()
+
+    def request(self, page_num, callback, rotation=0):
+        """提交一页的渲染任务，完成后在主线程调用 callback(page_num, photo)"""
+        if page_num in self._pending:
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        generation = self._generation
+        # 大文件的哈希要读完整个文件，不等它算完；未查缓存的结果在哈希得到后补写入缓存
+        cached = bool(self.file_key)
+        future = self._executor.submit(
+            render_thumbnail, self.path, self.stamp, page_num, rotation,
+            self.cache.directory if cached else None, self.file_key
+        )
+        self._pending[page_num] = future
+
+        # 完成回调在执行器的管理线程中运行，只能把结果放入队列，不能直接操作Tk
+        future.add_done_callback(
+            lambda f: self._results.put(
+                (generation, self._deliver, (page_num, rotation, cached, callback, f))
+            )
+        )
+        self._schedule_poll()
+
+    def discard(self, page_num):
+        """取消某一页尚未开始的渲染任务（该页已滚出可视区域）"""
+        future = self._pending.pop(page_num, None)
+        if future is not None:
+            future.cancel()
+
+    def cancel(self):
+        """取消所有尚未开始的渲染任务"""
+        self._generation += 1
+        self._unsaved.clear()
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+
+    def stats(self):
+        """返回当前文件的缓存命中/未命中次数"""
+        return {'hits': self.cache_hits, 'misses': self.cache_misses}
+
+    def shutdown(self):
+        """关闭进程池（窗口关闭时调用）"""
+        self.cancel()
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self.root.after(self.POLL_INTERVAL, self._poll)
+
+    def _prepare_cache(self, generation, path, stamp):
+        """计算文件哈希并按上限淘汰旧缓存（在后台线程中执行）"""
+        try:
+            file_key = self.cache.file_key(path, stamp)
+            self.cache.trim()
+        except OSError:
+            # 缓存不可用时直接渲染
+            file_key = ""
+        self._results.put((generation, self._cache_ready, (file_key,)))
+
+    def _cache_ready(self, file_key):
+        """文件哈希计算完成，把此前直接渲染的缩略图补写入缓存"""
+        self.file_key = file_key
+        unsaved, self._unsaved = self._unsaved, []
+        if file_key and unsaved:
+            self._store(unsaved)
+
+    def _store(self, thumbs):
+        """把缩略图 [(页码, 旋转角度, 缩略图)] 写入磁盘缓存（在后台线程中写文件）"""
+        file_key = self.file_key
+
+        def write():
+            for page_num, rotation, thumb in thumbs:
+                self.cache.put(file_key, page_num, THUMB_BOX, rotation, thumb)
+
+        threading.Thread(target=write, daemon=True).start()
+
+    def _deliver(self, page_num, rotation, cached, callback, future):
+        """显示一页渲染结果"""
+        if future.cancelled():
+            return
+        if self._pending.get(page_num) is future:
+            del self._pending[page_num]
+
+        try:
+            thumb, from_cache, (seconds, cpu_seconds) = future.result()
+        except Exception:
+            # 单页渲染失败时保留占位图
+            return
+
+        # 渲染在工作进程中完成，耗时由工作进程测得；峰值内存只统计本进程
+        if from_cache:
+            self.cache_hits += 1
+            record_stage("thumbnail-cache", seconds, cpu_seconds, bytes_read=len(thumb[3]))
+        else:
+            self.cache_misses += 1
+            record_stage("render", seconds, cpu_seconds)
+            if not cached:
+                # 哈希未算出时先暂存，缓存不可用（file_key 为空串）时不写入
+                if self.file_key is None:
+                    self._unsaved.append((page_num, rotation, thumb))
+                elif self.file_key:
+                    self._store([(page_num, rotation, thumb)])
+        with stage("photo", bytes_read=len(thumb[3])):
+            photo = thumbnail_to_photo(thumb)
+        callback(page_num, photo)
+
+    def _poll(self):
+        """在主线程中处理后台任务的结果"""
+        self._poll_id = None
+        deadline = time.perf_counter() + self.POLL_BUDGET
+
+        while time.perf_counter() < deadline:
+            try:
+                generation, handler, args = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            # 已切换文件的结果直接丢弃
+            if generation == self._generation:
+                handler(*args)
+
+        # 文件哈希尚未算出时继续轮询，以便收到结果后补写缓存
+        if self._pending or self.file_key is None or not self._results.empty():
+            self._schedule_poll()
+        elif self.on_idle is not None:
+            self.on_idle()
+
+
+class VirtualPageList:
+    """虚拟化的页面预览列表
+
+    只为可视区域附近的页面创建行控件，滚动时回收复用；解码后的缩略图也只保留
+    可视区域附近的若干页。行高固定，滚动区域高度 = 页数 × 行高，因此控件数量和
+    内存占用与文档页数无关。
+
+    build_row(parent) 创建一行控件并返回行字典（至少包含 'frame' 和
+    'image_label'），bind_row(row) 根据 row['page_num'] 刷新行的显示状态。
+    页面的选择状态由调用方保存，行控件只负责显示。可选的 rotation_for(page_num)
+    返回缩略图的显示角度。
+    """
+
+    ROW_HEIGHT = 280  # 每行占用的高度（像素）
+    ROW_GAP = 10  # 行间距
+    OVERSCAN = 2  # 可视区域上下额外创建的行数
+    IMAGE_CACHE_ROWS = 3  # 缓存的缩略图数量为可视行数的倍数
+
+    def __init__(self, canvas, scrollbar, renderer, build_row, bind_row, rotation_for=None):
+        self.canvas = canvas
+        self.scrollbar = scrollbar
+        self.renderer = renderer
+        self.build_row = build_row
+        self.bind_row = bind_row
+        self.rotation_for = rotation_for
+
+        self.page_count = 0
+        self.rows = {}  # 已显示的行 {页码: 行}
+        self._free_rows = []  # 可复用的行
+        self._images = OrderedDict()  # 最近使用的缩略图 {页码: (角度, PhotoImage)}
+        self._refresh_id = None
+
+        self.scrollbar.configure(command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_scroll)
+        self.canvas.bind("<Configure>", self._on_resize)
+
+    def set_page_count(self, page_count):
+        """切换文档后重建列表"""
+        for row in self.rows.values():
+            self._release(row)
+        self.rows.clear()
+        self._images.clear()
+
+        self.page_count = page_count
+        self._update_scrollregion()
+        self.canvas.yview_moveto(0)
+        self.refresh()
+
+    def refresh(self):
+        """根据当前滚动位置创建、回收行控件"""
+        self._refresh_id = None
+        top = self.canvas.canvasy(0)
+        height = max(self.canvas.winfo_height(), self.ROW_HEIGHT)
+        first = max(0, int(top // self.ROW_HEIGHT) - self.OVERSCAN)
+        last = min(self.page_count, int((top + height) // self.ROW_HEIGHT) + 1 + self.OVERSCAN)
+
+        # 回收滚出可视区域的行
+        for page_num in [p for p in self.rows if not first <= p < last]:
+            self._release(self.rows.pop(page_num))
+
+        for page_num in range(first, last):
+            if page_num not in self.rows:
+                self._attach(page_num)
+
+        self._trim_images()
+
+    def refresh_rows(self):
+        """页面状态批量变化后，刷新所有已显示的行"""
+        for row in self.rows.values():
+            self.bind_row(row)
+            self._bind_image(row)
+
+    def refresh_page(self, page_num):
+        """刷新单个页面的行（页面不在可视区域时不做任何事）"""
+        row = self.rows.get(page_num)
+        if row is not None:
+            self.bind_row(row)
+            self._bind_image(row)
+
+    def row_for(self, page_num):
+        """返回页面当前对应的行，不在可视区域时返回None"""
+        return self.rows.get(page_num)
+
+    def see(self, page_num):
+        """滚动到指定页面"""
+        if self.page_count:
+            self.canvas.yview_moveto(page_num / self.page_count)
+
+    def schedule_refresh(self):
+        if self._refresh_id is None:
+            self._refresh_id = self.canvas.after_idle(self.refresh)
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.schedule_refresh()
+
+    def _on_resize(self, event):
+        width = max(event.width - self.ROW_GAP, 1)
+        for row in list(self.rows.values()) + self._free_rows:
+            self.canvas.itemconfigure(row['item'], width=width)
+        self._update_scrollregion()
+        self.schedule_refresh()
+
+    def _update_scrollregion(self):
+        self.canvas.configure(
+            scrollregion=(0, 0, self.canvas.winfo_width(), self.page_count * self.ROW_HEIGHT)
+        )
+
+    def _new_row(self):
+        with stage("preview-widgets"):
+            row = self.build_row(self.canvas)
+            row['item'] = self.canvas.create_window(
+                self.ROW_GAP // 2, -self.ROW_HEIGHT * 2,
+                window=row['frame'],
+                anchor="nw",
+                width=max(self.canvas.winfo_width() - self.ROW_GAP, 1),
+                height=self.ROW_HEIGHT - self.ROW_GAP
+            )
+        return row
+
+    def _attach(self, page_num):
+        """把一个空闲行绑定到页面并移动到对应位置"""
+        row = self._free_rows.pop() if self._free_rows else self._new_row()
+        row['page_num'] = page_num
+        self.canvas.coords(row['item'], self.ROW_GAP // 2, page_num * self.ROW_HEIGHT + self.ROW_GAP // 2)
+        self.bind_row(row)
+        self._bind_image(row)
+        self.rows[page_num] = row
+
+    def _bind_image(self, row):
+        """显示行对应页面的缩略图，没有缓存时提交渲染"""
+        page_num = row['page_num']
+        rotation = self.rotation_for(page_num) if self.rotation_for else 0
+
+        cached = self._images.get(page_num)
+        if cached is not None and cached[0] == rotation:
+            self._images.move_to_end(page_num)
+            row['image_label'].config(image=cached[1], text="")
+            return
+
+        row['image_label'].config(image=self.renderer.placeholder, text="加载中...")
+        self.renderer.discard(page_num)
+        self.renderer.request(
+            page_num,
+            lambda pn, photo, r=rotation: self._show_thumbnail(pn, photo, r),
+            rotation
+        )
+
+    def _release(self, row):
+        """把行移出滚动区域并放回空闲列表"""
+        self.renderer.discard(row['page_num'])
+        self.canvas.coords(row['item'], self.ROW_GAP // 2, -self.ROW_HEIGHT * 2)
+        row['page_num'] = None
+        self._free_rows.append(row)
+
+    def _show_thumbnail(self, page_num, photo, rotation):
+        # 渲染期间角度又被修改时，丢弃过期的结果
+        if self.rotation_for and self.rotation_for(page_num) != rotation:
+            return
+        self._images[page_num] = (rotation, photo)
+        self._images.move_to_end(page_num)
+
+        row = self.rows.get(page_num)
+        if row is not None:
+            row['image_label'].config(image=photo, text="")
+        self._trim_images()
+
+    def _trim_images(self):
+        """只保留最近使用的缩略图，可视区域内的缩略图不会被淘汰"""
+        limit = max(len(self.rows) * self.IMAGE_CACHE_ROWS, 20)
+        for page_num in list(self._images):
+            if len(self._images) <= limit:
+                break
+            if page_num not in self.rows:
+                del self._images[page_num]
@@ -0,0 +1,394 @@
+"""删除页面后的清理
+
+原样复制对象（pdf_passthrough）时只复制保留页面、文档目录和文档信息能访问到的
+对象，只被已删除页面使用的字体、图像、表单 XObject 自然不会出现在输出中。但书签、
+命名目标、链接注释和表单域仍可能指向已删除的页面，使本应丢弃的对象保持可访问。
+prune_plan 在复制之前找出这些条目，给出修改后的对象（保留原对象号）：
+
+- 书签：目标为已删除页面的书签项被删除，它仍有保留的子项时只去掉跳转；
+- 命名目标：删除指向已删除页面的名称，名称树重建为单个叶节点；
+- 链接注释：保留页面上跳转到已删除页面的链接被删除；
+- 表单域：控件全部位于已删除页面的表单域被删除。
+
+reclaimed_by_type 按对象类型统计没有写入输出的对象及其字节数，format_prune_report
+把删除页面的结果格式化为报告。
+"""
+import re
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+
+# 按对象字典中的关键字归类 [(类型, 正则)]，依次匹配
+OBJECT_TYPES = (
+    ("页面", re.compile(rb"/Type\s*/Pages?\b")),
+    ("字体", re.compile(rb"/Type\s*/Font(?:Descriptor)?\b|/Length[123]\b|/Subtype\s*/(?:Type1C|CIDFontType0C|OpenType)\b")),
+    ("图像", re.compile(rb"/Subtype\s*/Image\b")),
+    ("表单XObject", re.compile(rb"/Subtype\s*/Form\b")),
+    ("注释和表单域", re.compile(rb"/Type\s*/Annot\b|/Subtype\s*/(?:Link|Widget)\b|/FT\s*/")),
+    ("书签和目标", re.compile(rb"/Title\s*[(<]|/Type\s*/Outlines\b|/Limits\s*\[")),
+)
+# 对象流和交叉引用流是文件结构，其中的对象已逐个统计
+_CONTAINER = re.compile(rb"/Type\s*/(?:ObjStm|XRef)\b")
+_STREAM = "内容流和其它流"
+_OTHER = "其它"
+
+
+class PrunePlan:
+    """复制前确定的修改：{(对象号, 代号): 修改后的字典}、各页的注释和统计"""
+
+    def __init__(self):
+        self.overrides = {}
+        self.annots = {}  # {页面 (对象号, 代号): 过滤后的 /Annots 数组}
+        self.removed = {'outlines': 0, 'destinations': 0, 'links': 0, 'fields': 0}
+
+    def editable(self, ref):
+        """返回间接字典对象的可修改副本（同一对象只复制一次）"""
+        key = (ref.idnum, ref.generation)
+        obj = self.overrides.get(key)
+        if obj is None:
+            obj = self.overrides[key] = DictionaryObject()
+            dict.update(obj, dict.items(ref.get_object()))
+        return obj
+
+
+def prune_plan(reader, kept_pages):
+    """kept_pages 为保留页面的 (对象号, 代号) 集合，返回 PrunePlan"""
+    plan = PrunePlan()
+    removed_pages = set()
+    for page in reader.pages:
+        ref = page.indirect_reference
+        if ref is not None and (ref.idnum, ref.generation) not in kept_pages:
+            removed_pages.add((ref.idnum, ref.generation))
+    if not removed_pages:
+        return plan
+
+    root_ref = dict.__getitem__(reader.trailer, "/Root")
+    catalog = plan.editable(root_ref)
+    names = _named_destinations(catalog)
+
+    def is_stale(target):
+        page = _destination_page(target, names)
+        return page is not None and page in removed_pages
+
+    # 保留页面上跳转到已删除页面的链接
+    kept_annots = set()
+    for page in reader.pages:
+        ref = page.indirect_reference
+        if ref is None or (ref.idnum, ref.generation) in removed_pages:
+            continue
+        annots = _resolve(dict.get(page, "/Annots"))
+        if not isinstance(annots, ArrayObject):
+            continue
+        kept = ArrayObject()
+        for annot_ref in annots:
+            annot = _resolve(annot_ref)
+            if (isinstance(annot, DictionaryObject) and annot.get("/Subtype") == "/Link"
+                    and is_stale(_link_target(annot))):
+                plan.removed['links'] += 1
+                continue
+            kept.append(annot_ref)
+            if isinstance(annot_ref, IndirectObject):
+                kept_annots.add((annot_ref.idnum, annot_ref.generation))
+        if len(kept) != len(annots):
+            plan.annots[(ref.idnum, ref.generation)] = kept
+
+    outlines = dict.get(catalog, "/Outlines")
+    if isinstance(outlines, IndirectObject):
+        if not _prune_outline(outlines, plan, is_stale, set())[0]:
+            del catalog["/Outlines"]
+            if dict.get(catalog, "/PageMode") == "/UseOutlines":
+                del catalog["/PageMode"]
+
+    _prune_named_destinations(catalog, plan, is_stale)
+    _prune_form(catalog, plan, kept_annots)
+    return plan
+
+
+def reclaimed_by_type(copier, written):
+    """按类型统计原文件中没有写入输出的对象：{类型: {'objects': 个数, 'bytes': 字节数}}
+
+    copier 为 pdf_passthrough.RawObjectCopier，written 为已写出的 (对象号, 代号)。
+    对象流中的对象按重新序列化后的长度估算。
+    """
+    from pdf_stream_writer import serialize
+
+    reader = copier.reader
+    report = {}
+    candidates = [(num, generation) for generation, table in reader.xref.items() for num in table]
+    candidates.extend((num, 0) for num in reader.xref_objStm)
+    for key in candidates:
+        if key in written:
+            continue
+        num, generation = key
+        if generation == 0 and num in reader.xref_objStm:
+            obj = reader.get_object(IndirectObject(num, 0, reader))
+            if obj is None:
+                continue
+            dictionary = serialize(obj, lambda ind: (ind.idnum, ind.generation))
+            size, is_stream = len(dictionary), False
+        else:
+            offset = reader.xref[generation][num]
+            extent = copier._extent(num, generation, offset)
+            if extent is None or reader.xref_free_entry.get(generation, {}).get(num):
+                continue
+            start, dictionary_end, end = extent
+            dictionary = copier.data[start:dictionary_end]
+            size, is_stream = end - start, dictionary_end != end - len(b"endobj")
+        if _CONTAINER.search(dictionary):
+            continue
+        kind = _classify(dictionary, is_stream)
+        entry = report.setdefault(kind, {'objects': 0, 'bytes': 0})
+        entry['objects'] += 1
+        entry['bytes'] += size
+    return report
+
+
+# 报告中各项清理的名称
+PRUNED_NAMES = (("outlines", "书签"), ("destinations", "命名目标"), ("links", "链接"), ("fields", "表单域"))
+
+
+def format_prune_report(result):
+    """把 remove_pages 的结果格式化为输出大小报告的文本行"""
+    from pdf_metrics import format_bytes
+
+    lines = []
+    if result.get('output_bytes') is not None:
+        lines.append(f"文件大小: {format_bytes(result['input_bytes'])} → {format_bytes(result['output_bytes'])}")
+    reclaimed = sorted(result.get('reclaimed', {}).items(), key=lambda item: -item[1]['bytes'])
+    if reclaimed:
+        lines.append("未写入的对象:")
+        for kind, entry in reclaimed:
+            lines.append(f"  {kind}: {entry['objects']} 个，{format_bytes(entry['bytes'])}")
+    pruned = [f"{title} {result['pruned'][key]} 个" for key, title in PRUNED_NAMES
+              if result.get('pruned', {}).get(key)]
+    if pruned:
+        lines.append("清理指向已删除页面的条目: " + "，".join(pruned))
+    return lines
+
+
+def _classify(dictionary, is_stream):
+    for kind, pattern in OBJECT_TYPES:
+        if pattern.search(dictionary):
+            return kind
+    return _STREAM if is_stream else _OTHER
+
+
+def _resolve(obj):
+    return obj.get_object() if isinstance(obj, IndirectObject) else obj
+
+
+def _named_destinations(catalog):
+    """{名称: 目标}，包括旧式的 /Dests 字典和 /Names 中的 /Dests 名称树"""
+    names = {}
+    dests = _resolve(dict.get(catalog, "/Dests"))
+    if isinstance(dests, DictionaryObject):
+        for key, value in dict.items(dests):
+            names[_name_key(key)] = value
+    tree = _resolve(dict.get(_resolve(dict.get(catalog, "/Names")) or {}, "/Dests"))
+    if isinstance(tree, DictionaryObject):
+        for key, value in _name_tree_items(tree, set()):
+            names[_name_key(key)] = value
+    return names
+
+
+def _name_key(name):
+    # 目标名称可能是名称对象、文本字符串或字节字符串
+    if isinstance(name, bytes):
+        return name.decode("latin-1")
+    if isinstance(name, NameObject):
+        return name[1:]
+    return str(name)
+
+
+def _name_tree_items(node, seen):
+    """按顺序返回名称树中的 (名称, 值)"""
+    if id(node) in seen:
+        return
+    seen.add(id(node))
+    entries = _resolve(dict.get(node, "/Names"))
+    if isinstance(entries, ArrayObject):
+        for index in range(0, len(entries) - 1, 2):
+            yield entries[index], entries[index + 1]
+    for kid in _resolve(dict.get(node, "/Kids")) or ():
+        kid = _resolve(kid)
+        if isinstance(kid, DictionaryObject):
+            yield from _name_tree_items(kid, seen)
+
+
+def _destination_page(target, names, depth=0):
+    """目标指向的页面 (对象号, 代号)，不是页面目标时返回 None"""
+    target = _resolve(target)
+    if isinstance(target, DictionaryObject):
+        target = _resolve(dict.get(target, "/D"))
+    if isinstance(target, (str, bytes)) and depth < 4:
+        # 命名目标（名称或字符串）
+        return _destination_page(names.get(_name_key(target)), names, depth + 1)
+    if isinstance(target, ArrayObject) and target and isinstance(target[0], IndirectObject):
+        return target[0].idnum, target[0].generation
+    return None
+
+
+def _link_target(item):
+    """书签项或链接注释的跳转目标（只考虑 /Dest 和 GoTo 动作）"""
+    if "/Dest" in item:
+        return dict.get(item, "/Dest")
+    action = _resolve(dict.get(item, "/A"))
+    if isinstance(action, DictionaryObject) and action.get("/S") == "/GoTo":
+        return dict.get(action, "/D")
+    return None
+
+
+def _outline_children(node, seen):
+    child = dict.get(node, "/First")
+    while isinstance(child, IndirectObject) and (child.idnum, child.generation) not in seen:
+        seen.add((child.idnum, child.generation))
+        yield child
+        child = dict.get(child.get_object(), "/Next")
+
+
+def _prune_outline(ref, plan, is_stale, seen, is_item=False):
+    """删除指向已删除页面的书签项，返回 (是否保留, 展开时可见的子孙项数)"""
+    node = ref.get_object()
+    children = list(_outline_children(node, seen))
+    kept = []
+    counts = {}
+    for child in children:
+        keep, count = _prune_outline(child, plan, is_stale, seen, is_item=True)
+        if keep:
+            kept.append(child)
+            counts[child.idnum] = count
+
+    stale = is_item and is_stale(_link_target(node))
+    if not kept and (stale or (not is_item and children)):
+        # 书签项本身失效，或书签根节点的子项全部被删除
+        plan.removed['outlines'] += stale
+        return False, 0
+
+    # 可见项数：保留的子项，加上其中展开的子项的可见子孙
+    visible = len(kept)
+    for child in kept:
+        if int(_current(plan, child).get("/Count", 0)) > 0:
+            visible += counts[child.idnum]
+
+    if not stale and kept == children and not any(
+            (child.idnum, child.generation) in plan.overrides for child in kept):
+        return True, visible
+
+    item = plan.editable(ref)
+    if stale:
+        # 目标页面已删除，但子项仍保留：只去掉跳转
+        plan.removed['outlines'] += 1
+        item.pop("/Dest", None)
+        item.pop("/A", None)
+    if kept != children:
+        for index, child in enumerate(kept):
+            entry = plan.editable(child)
+            entry.pop("/Prev", None)
+            entry.pop("/Next", None)
+            if index:
+                entry[NameObject("/Prev")] = kept[index - 1]
+            if index + 1 < len(kept):
+                entry[NameObject("/Next")] = kept[index + 1]
+        for key in ("/First", "/Last", "/Count"):
+            item.pop(key, None)
+        if kept:
+            item[NameObject("/First")] = kept[0]
+            item[NameObject("/Last")] = kept[-1]
+    if kept:
+        # 关闭的书签项 /Count 为负数
+        closed = is_item and int(node.get("/Count", 0)) < 0
+        item[NameObject("/Count")] = NumberObject(-visible if closed else visible)
+    return True, visible
+
+
+def _current(plan, ref):
+    return plan.overrides.get((ref.idnum, ref.generation)) or ref.get_object()
+
+
+def _prune_named_destinations(catalog, plan, is_stale):
+    dests_ref = dict.get(catalog, "/Dests")
+    dests = _resolve(dests_ref)
+    if isinstance(dests, DictionaryObject):
+        stale = [key for key, value in dict.items(dests) if is_stale(value)]
+        if stale:
+            if isinstance(dests_ref, IndirectObject):
+                edited = plan.editable(dests_ref)
+            else:
+                # 直接字典属于读取器缓存中的文档目录，同一会话再次保存时仍要用到，不能原地修改
+                edited = DictionaryObject()
+                dict.update(edited, dict.items(dests))
+                catalog[NameObject("/Dests")] = edited
+            for key in stale:
+                del edited[key]
+            plan.removed['destinations'] += len(stale)
+
+    names_ref = dict.get(catalog, "/Names")
+    names = _resolve(names_ref)
+    if not isinstance(names, DictionaryObject):
+        return
+    tree = _resolve(dict.get(names, "/Dests"))
+    if not isinstance(tree, DictionaryObject):
+        return
+    entries = list(_name_tree_items(tree, set()))
+    kept = [(key, value) for key, value in entries if not is_stale(value)]
+    if len(kept) == len(entries):
+        return
+    plan.removed['destinations'] += len(entries) - len(kept)
+
+    # 名称树重建为单个叶节点，原来的中间节点不再被引用
+    leaf = DictionaryObject()
+    leaf[NameObject("/Names")] = ArrayObject(item for pair in kept for item in pair)
+    if isinstance(names_ref, IndirectObject):
+        plan.editable(names_ref)[NameObject("/Dests")] = leaf
+    else:
+        edited = DictionaryObject()
+        dict.update(edited, dict.items(names))
+        edited[NameObject("/Dests")] = leaf
+        catalog[NameObject("/Names")] = edited
+
+
+def _prune_form(catalog, plan, kept_annots):
+    form_ref = dict.get(catalog, "/AcroForm")
+    form = _resolve(form_ref)
+    if not isinstance(form, DictionaryObject):
+        return
+    fields = _resolve(dict.get(form, "/Fields"))
+    if not isinstance(fields, ArrayObject):
+        return
+    kept = _prune_fields(fields, plan, kept_annots, set())
+    if kept is None:
+        return
+    if isinstance(form_ref, IndirectObject):
+        plan.editable(form_ref)[NameObject("/Fields")] = kept
+    else:
+        edited = DictionaryObject()
+        dict.update(edited, dict.items(form))
+        edited[NameObject("/Fields")] = kept
+        catalog[NameObject("/AcroForm")] = edited
+
+
+def _prune_fields(refs, plan, kept_annots, seen):
+    """删除控件全部位于已删除页面的表单域，有变化时返回新的数组，否则返回 None"""
+    kept = ArrayObject()
+    changed = False
+    for ref in refs:
+        if not isinstance(ref, IndirectObject) or (ref.idnum, ref.generation) in seen:
+            kept.append(ref)
+            continue
+        seen.add((ref.idnum, ref.generation))
+        field = ref.get_object()
+        kids = _resolve(dict.get(field, "/Kids"))
+        if isinstance(kids, ArrayObject) and kids:
+            new_kids = _prune_fields(kids, plan, kept_annots, seen)
+            if new_kids is not None:
+                changed = True
+                if not new_kids:
+                    plan.removed['fields'] += 1
+                    continue
+                plan.editable(ref)[NameObject("/Kids")] = new_kids
+        elif field.get("/Subtype") == "/Widget" and (ref.idnum, ref.generation) not in kept_annots:
+            # 控件所在页面已删除（与表单域合并的控件也按表单域计数）
+            changed = True
+            if "/T" in field or "/FT" in field:
+                plan.removed['fields'] += 1
+            continue
+        kept.append(ref)
+    return kept if changed else None
@@ -0,0 +1,111 @@
+"""页面旋转设置
+
+RotationModel 把整个文档的旋转表示为一个统一的基准角度加上少数页面相对基准的
+偏移量（稀疏字典，以90°为单位）。旋转全部页面、全部重置只修改基准角度；
+按偏移量记录的直方图使“已旋转页数”的计算与页数无关。奇数页、偶数页或任意
+范围的旋转一次完成，耗时与范围内的页数成正比。
+"""
+from pdf_selection import PageSelection
+
+
+class RotationModel:
+    """文档各页追加的顺时针旋转角度（0、90、180、270）"""
+
+    def __init__(self, page_count=0):
+        self.page_count = page_count
+        self._base = 0  # 所有页面共同的旋转（90°的倍数）
+        self._deltas = {}  # {页码: 相对基准的旋转（1~3，即90°的倍数）}
+        self._counts = [0, 0, 0, 0]  # 各偏移量的页数，_counts[0] 始终为0
+
+    def copy(self):
+        model = RotationModel(self.page_count)
+        model._base = self._base
+        model._deltas = dict(self._deltas)
+        model._counts = list(self._counts)
+        return model
+
+    def get(self, page_num, default=0):
+        """页面的旋转角度，与 dict.get 用法相同（default 仅为兼容保留）"""
+        return (self._base + self._deltas.get(page_num, 0)) % 4 * 90
+
+    @property
+    def rotated_count(self):
+        """旋转角度不为0的页数"""
+        if self._base == 0:
+            return len(self._deltas)
+        # 偏移量恰好抵消基准角度的页面没有旋转
+        return self.page_count - self._counts[-self._base % 4]
+
+    def __bool__(self):
+        return self.rotated_count > 0
+
+    def items(self):
+        """按页码顺序返回旋转角度不为0的 (页码, 角度)"""
+        if self._base == 0:
+            for page_num in sorted(self._deltas):
+                yield page_num, self._deltas[page_num] * 90
+            return
+        for page_num in range(self.page_count):
+            angle = self.get(page_num)
+            if angle:
+                yield page_num, angle
+
+    def set(self, page_num, angle):
+        """把单个页面设为指定角度"""
+        self._set_delta(page_num, (_quarters(angle) - self._base) % 4)
+
+    def rotate(self, page_num, angle):
+        """在页面当前角度上追加旋转"""
+        self._set_delta(page_num, (self._deltas.get(page_num, 0) + _quarters(angle)) % 4)
+
+    def set_pages(self, pages, angle):
+        """把一组页面（可迭代的页码或 PageSelection）设为指定角度"""
+        if self._is_all(pages):
+            self.set_all(angle)
+            return
+        delta = (_quarters(angle) - self._base) % 4
+        for page_num in pages:
+            self._set_delta(page_num, delta)
+
+    def rotate_pages(self, pages, angle):
+        """在一组页面当前角度上追加旋转"""
+        if self._is_all(pages):
+            self.rotate_all(angle)
+            return
+        quarters = _quarters(angle)
+        for page_num in pages:
+            self._set_delta(page_num, (self._deltas.get(page_num, 0) + quarters) % 4)
+
+    def set_all(self, angle):
+        """把所有页面设为指定角度"""
+        self._base = _quarters(angle)
+        self._deltas = {}
+        self._counts = [0, 0, 0, 0]
+
+    def rotate_all(self, angle):
+        """所有页面在当前角度上追加旋转，各页之间的差异保持不变"""
+        self._base = (self._base + _quarters(angle)) % 4
+
+    def reset(self):
+        """取消所有旋转"""
+        self.set_all(0)
+
+    def _is_all(self, pages):
+        return isinstance(pages, PageSelection) and pages.bounds == [0, self.page_count]
+
+    def _set_delta(self, page_num, delta):
+        old = self._deltas.get(page_num, 0)
+        if old == delta:
+            return
+        self._counts[old] -= old != 0
+        if delta:
+            self._deltas[page_num] = delta
+            self._counts[delta] += 1
+        else:
+            del self._deltas[page_num]
+
+
+def _quarters(angle):
+    if angle % 90:
+        raise ValueError(f"旋转角度必须是90的倍数: {angle}")
+    return angle // 90 % 4
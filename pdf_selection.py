@@ -0,0 +1,211 @@
+"""页面选择
+
+PageSelection 用有序的区间端点列表表示一组页码：bounds 中相邻的两个端点
+[start, stop) 为一个选中的区间。全选、全不选、反选只修改端点，耗时与页数无关；
+计数与区间数成正比；判断某页是否选中用二分查找。十万页的文档也能即时全选和反选。
+
+页码范围表达式（页码从1开始）：
+    "1-10,15,20-"   第1到10页、第15页、第20页到最后一页
+    "-5"            第1到5页
+    "odd" / "even"  奇数页 / 偶数页
+    "all"           全部页面
+"""
+from bisect import bisect_left, bisect_right
+
+
+class PageRangeError(ValueError):
+    """页码范围或旋转设置有误"""
+
+
+class PageSelection:
+    """页码集合（从0开始），支持 in、len、迭代以及 add/discard"""
+
+    def __init__(self, page_count=0, bounds=None):
+        self.page_count = page_count
+        self.bounds = list(bounds) if bounds else []  # 区间端点，严格递增
+
+    @classmethod
+    def from_pages(cls, pages, page_count):
+        """由页码集合创建"""
+        selection = cls(page_count)
+        for start, stop in _runs(sorted(set(pages))):
+            selection.bounds.extend((start, stop))
+        return selection
+
+    @classmethod
+    def parse(cls, expression, page_count):
+        """解析页码范围表达式，出错时抛出 PageRangeError"""
+        selection = cls(page_count)
+        for part in expression.replace(" ", "").split(","):
+            if not part:
+                continue
+            keyword = part.lower()
+            if keyword == "all":
+                selection.select_all()
+            elif keyword in ("odd", "even"):
+                # 奇数页为从0开始的偶数下标，每页一个区间
+                first = 0 if keyword == "odd" else 1
+                bounds = [point for start in range(first, page_count, 2)
+                          for point in (start, start + 1)]
+                selection.update(cls(page_count, bounds))
+            else:
+                start, stop = _parse_range(part, page_count)
+                selection.add_range(start, stop)
+        return selection
+
+    def copy(self):
+        return PageSelection(self.page_count, self.bounds)
+
+    def __contains__(self, page_num):
+        return bisect_right(self.bounds, page_num) % 2 == 1
+
+    def __len__(self):
+        bounds = self.bounds
+        return sum(bounds[1::2]) - sum(bounds[0::2])
+
+    def __bool__(self):
+        return bool(self.bounds)
+
+    def __iter__(self):
+        for start, stop in self.ranges():
+            yield from range(start, stop)
+
+    def __eq__(self, other):
+        if isinstance(other, PageSelection):
+            return self.bounds == other.bounds
+        return NotImplemented
+
+    def __repr__(self):
+        return f"PageSelection({self.page_count}, {self.to_expression()!r})"
+
+    def ranges(self):
+        """依次返回选中的区间 (start, stop)"""
+        bounds = self.bounds
+        return zip(bounds[0::2], bounds[1::2])
+
+    def add(self, page_num):
+        self.add_range(page_num, page_num + 1)
+
+    def discard(self, page_num):
+        self.discard_range(page_num, page_num + 1)
+
+    def add_range(self, start, stop):
+        self._assign(start, stop, True)
+
+    def discard_range(self, start, stop):
+        self._assign(start, stop, False)
+
+    def update(self, other):
+        """并入另一个选择（并集）"""
+        if not self.bounds:
+            self.bounds = list(other.bounds)
+        elif other.bounds:
+            self._combine(other, lambda a, b: a or b)
+
+    def difference_update(self, other):
+        """去掉另一个选择中的页面（差集）"""
+        if self.bounds and other.bounds:
+            self._combine(other, lambda a, b: a and not b)
+
+    def select_all(self):
+        self.bounds = [0, self.page_count] if self.page_count else []
+
+    def clear(self):
+        self.bounds = []
+
+    def invert(self):
+        """反选：在 0 和 page_count 处各翻转一次选中状态"""
+        self._toggle_point(0)
+        self._toggle_point(self.page_count)
+
+    def to_expression(self):
+        """转换为页码范围表达式（页码从1开始）"""
+        parts = []
+        for start, stop in self.ranges():
+            if stop - start == 1:
+                parts.append(str(start + 1))
+            elif stop == self.page_count:
+                parts.append(f"{start + 1}-")
+            else:
+                parts.append(f"{start + 1}-{stop}")
+        return ",".join(parts)
+
+    def _assign(self, start, stop, value):
+        """把 [start, stop) 设为选中或未选中，只替换该范围内的端点"""
+        start = max(start, 0)
+        stop = min(stop, self.page_count)
+        if start >= stop:
+            return
+        bounds = self.bounds
+        left = bisect_left(bounds, start)
+        right = bisect_right(bounds, stop)
+        before = left % 2 == 1  # start 之前一页的状态
+        after = right % 2 == 1  # stop 处的状态
+        new = []
+        if before != value:
+            new.append(start)
+        if after != value:
+            new.append(stop)
+        bounds[left:right] = new
+
+    def _combine(self, other, op):
+        """按端点顺序扫描两个选择，只在 op(本选择状态, 另一选择状态) 变化处记录端点"""
+        table = [op(False, False), op(False, True), op(True, False), op(True, True)]
+        a, b = self.bounds, other.bounds
+        end = max(a[-1] if a else 0, b[-1] if b else 0) + 1
+        i = j = 0
+        in_a = in_b = 0
+        state = table[0]
+        bounds = []
+        while i < len(a) or j < len(b):
+            point = min(a[i] if i < len(a) else end, b[j] if j < len(b) else end)
+            if i < len(a) and a[i] == point:
+                in_a ^= 1
+                i += 1
+            if j < len(b) and b[j] == point:
+                in_b ^= 1
+                j += 1
+            new_state = table[in_a * 2 + in_b]
+            if new_state != state:
+                bounds.append(point)
+                state = new_state
+        self.bounds = bounds
+
+    def _toggle_point(self, point):
+        bounds = self.bounds
+        index = bisect_left(bounds, point)
+        if index < len(bounds) and bounds[index] == point:
+            del bounds[index]
+        else:
+            bounds.insert(index, point)
+
+
+def _parse_range(part, page_count):
+    """解析单个范围（页码从1开始），返回从0开始的 [start, stop)"""
+    try:
+        if "-" in part:
+            first, last = part.split("-", 1)
+            first = int(first) if first else 1
+            last = int(last) if last else page_count
+        else:
+            first = last = int(part)
+    except ValueError:
+        raise PageRangeError(f"无法识别的页码范围: {part}") from None
+
+    if first < 1 or last > page_count or first > last:
+        raise PageRangeError(f"页码范围 {part} 超出文档页数（共 {page_count} 页）")
+    return first - 1, last
+
+
+def _runs(pages):
+    """把有序页码列表拆成连续的区间"""
+    start = previous = None
+    for page_num in pages:
+        if previous is not None and page_num == previous + 1:
+            previous = page_num
+            continue
+        if start is not None:
+            yield start, previous + 1
+        start = previous = page_num
+    if start is not None:
+        yield start, previous + 1
@@ -0,0 +1,71 @@
+"""PDF文档会话
+
+一个会话只打开并解析一次PDF文件：文件以只读方式内存映射，PyPDF2 直接在映射上
+解析交叉引用表，加载、预览和保存都使用同一个解析结果，不再把整个文件读入内存，
+也不再为保存重新解析。保存前可检查文件在加载之后是否被其它程序修改。
+"""
+import mmap
+import os
+from pdf_metrics import stage
+from pdf_startup import lazy_import
+
+PyPDF2 = lazy_import("PyPDF2")
+
+
+class DocumentChangedError(Exception):
+    """文件在加载之后被修改"""
+
+
+class PDFSession:
+    """PDF文档会话"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            st = os.fstat(self._file.fileno())
+            self.size = st.st_size
+            self.stamp = st.st_mtime_ns  # 加载时的修改时间，缩略图渲染和缓存也以此区分版本
+            if self.size == 0:
+                raise PyPDF2.errors.PdfReadError("文件为空")
+
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            with stage("parse", bytes_read=self.size):
+                self.reader = PyPDF2.PdfReader(self._map)
+                self.page_count = len(self.reader.pages)
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def pages(self):
+        return self.reader.pages
+
+    def is_changed(self):
+        """文件在加载之后是否被修改（大小或修改时间变化）"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return True
+        return st.st_size != self.size or st.st_mtime_ns != self.stamp
+
+    def check_unchanged(self):
+        """文件在加载之后被修改时抛出 DocumentChangedError"""
+        if self.is_changed():
+            raise DocumentChangedError(f"文件在加载后已被修改: {os.path.basename(self.path)}")
+
+    def close(self):
+        """释放内存映射和文件句柄"""
+        self.reader = None
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,115 @@
+"""启动加速与启动耗时测量
+
+PyPDF2、PyMuPDF(fitz) 和 PIL 加载较慢，而打开窗口、浏览文件都用不到它们。各模块
+通过 lazy_import 引用这些库，第一次真正使用时才导入；主窗口显示后再由后台线程
+预先导入（warm_up），用户选好文件时通常已经加载完毕。
+
+测量启动耗时：
+    python pdf_page_remover.py --startup-time   显示主窗口后输出耗时并退出
+    python pdf_startup.py                       在独立进程中测量各模块的冷导入耗时
+"""
+import importlib
+import sys
+import threading
+import time
+
+# 本模块被导入的时间；各工具最先导入本模块，近似为程序开始运行的时间
+# （不含 Python 解释器自身的启动时间）
+STARTED_AT = time.perf_counter()
+
+# 启动时不应加载的模块
+HEAVY_MODULES = ("PyPDF2", "fitz", "PIL.Image", "PIL.ImageTk")
+
+# 后台预热已导入模块的耗时 {模块名: 秒}
+import_times = {}
+
+
+class LazyModule:
+    """模块代理，第一次访问属性时才导入模块"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = "已加载" if self._module is not None else "未加载"
+        return f"<延迟导入模块 {self._name}（{state}）>"
+
+
+def lazy_import(name):
+    """返回延迟导入的模块；模块已导入时直接返回模块本身"""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+
+def warm_up(modules):
+    """在后台线程中依次导入 modules，导入耗时记录在 import_times 中"""
+    def run():
+        for name in modules:
+            if name in sys.modules:
+                continue
+            start = time.perf_counter()
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                continue
+            import_times[name] = time.perf_counter() - start
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def finish_startup(root, tool, modules=()):
+    """主窗口创建完成后调用
+
+    命令行参数带 --startup-time 时，窗口显示后立即输出启动耗时和已加载的重量级
+    模块并退出；否则在窗口显示后开始后台预热 modules。按 F12 打开诊断面板。
+    """
+    if "--startup-time" in sys.argv[1:]:
+        root.update()
+        elapsed = time.perf_counter() - STARTED_AT
+        loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+        print(f"{tool}: 主窗口显示用时 {elapsed * 1000:.0f} ms，"
+              f"已加载: {', '.join(loaded) or '无'}")
+        root.destroy()
+        sys.exit(0)
+
+    root.bind_all("<F12>", lambda event: show_diagnostics(root))
+    root.after_idle(lambda: warm_up(modules))
+
+
+def show_diagnostics(root):
+    """打开诊断面板（第一次打开时才导入）"""
+    from pdf_diagnostics import show_diagnostics
+
+    return show_diagnostics(root)
+
+
+def measure_import(module):
+    """在新的 Python 进程中测量模块的冷导入耗时（秒），使用 -X importtime"""
+    import subprocess
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    # 最后一行是被测模块本身，第二列为包含依赖在内的累计耗时（微秒）
+    last = result.stderr.strip().splitlines()[-1]
+    return int(last.split("|")[1]) / 1e6
+
+
+def main():
+    modules = ("pdf_page_remover", "pdf_page_rotator", "pdf_merger", "pdf_cli") + HEAVY_MODULES
+    for module in modules:
+        print(f"{module:<20} {measure_import(module) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
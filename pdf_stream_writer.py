@@ -0,0 +1,518 @@
+"""流式PDF写入
+
+PyPDF2 的 PdfWriter 会把所有页面和它们引用的对象保存在内存中，直到最后一次性
+写出。这里的 StreamingPdfWriter 在复制页面时立即把对象写入输出文件，只在内存中
+保留对象号到文件偏移量的对照表；每个输入文档处理完后即可关闭，合并大量大文件时
+内存占用约为单个输入文档的大小，而不是所有输入之和。
+
+开启去重（dedup=True）时，对象在其引用的对象全部写出后再按序列化内容计算哈希，
+内容相同的字体、图像、ICC 配置文件等只写出一份，其它文档中的引用指向同一个对象。
+
+开启压缩（compress=True）时，字典、数组等非流对象攒够一批后打包进 Flate 压缩的
+对象流（PDF 1.5），交叉引用表写为压缩的交叉引用流；flate=True 时没有任何过滤器的
+流（例如未压缩的内容流）用 Flate 重新压缩。
+"""
+import gc
+import hashlib
+import io
+import os
+import time
+import zlib
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+from pdf_metrics import peak_rss, stage
+from pdf_session import PDFSession
+
+# 页面可从页面树父节点继承的属性
+INHERITABLE_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+# 去重时递归写出引用对象的最大深度，超过后按普通方式排队写出
+MAX_DEDUP_DEPTH = 100
+
+# 压缩输出：每个对象流最多存放的对象数和未压缩字节数
+OBJECT_STREAM_OBJECTS = 200
+OBJECT_STREAM_BYTES = 1 << 20
+# Flate 压缩级别；短于 MIN_FLATE_LENGTH 的流不值得重新压缩
+FLATE_LEVEL = 6
+MIN_FLATE_LENGTH = 64
+
+
+def serialize(obj, ref_for, flate=False):
+    """把 PyPDF2 对象序列化为字节串
+
+    间接引用通过 ref_for 换算为输出中的对象号，ref_for 也可以返回 (对象号, 代号)。
+    flate 为 True 时没有过滤器的流用 Flate 压缩（压缩后更小时）。
+    """
+    out = []
+    _serialize(obj, ref_for, out, flate)
+    return b"".join(out)
+
+
+def _serialize(obj, ref_for, out, flate=False):
+    if isinstance(obj, IndirectObject):
+        num = ref_for(obj)
+        if num is None:
+            out.append(b"null")
+        elif isinstance(num, tuple):
+            out.append(b"%d %d R" % num)
+        else:
+            out.append(b"%d 0 R" % num)
+    elif isinstance(obj, StreamObject):
+        # /Length 直接写为数值，不再引用原文件中的长度对象
+        data = obj._data
+        compressed = None
+        if flate and "/Filter" not in obj and len(data) >= MIN_FLATE_LENGTH:
+            compressed = zlib.compress(data, FLATE_LEVEL)
+            if len(compressed) < len(data):
+                data = compressed
+            else:
+                compressed = None
+        out.append(b"<<")
+        for key, value in obj.items():
+            if key == "/Length" or (compressed is not None and key == "/DecodeParms"):
+                continue
+            out.append(NameObject(key).renumber())
+            out.append(b" ")
+            _serialize(value, ref_for, out, flate)
+        if compressed is not None:
+            out.append(b"/Filter /FlateDecode")
+        out.append(b"/Length %d>>\nstream\n" % len(data))
+        out.append(data)
+        out.append(b"\nendstream")
+    elif isinstance(obj, DictionaryObject):
+        out.append(b"<<")
+        for key, value in obj.items():
+            out.append(NameObject(key).renumber())
+            out.append(b" ")
+            _serialize(value, ref_for, out, flate)
+        out.append(b">>")
+    elif isinstance(obj, ArrayObject):
+        out.append(b"[")
+        for index, item in enumerate(obj):
+            if index:
+                out.append(b" ")
+            _serialize(item, ref_for, out, flate)
+        out.append(b"]")
+    else:
+        buf = io.BytesIO()
+        obj.write_to_stream(buf, None)
+        out.append(buf.getvalue())
+
+
+class StreamingPdfWriter:
+    """逐个写出对象的PDF写入器
+
+    用法：对每个输入文档调用 add_source(reader) 得到 SourceImporter，逐页
+    import_page，处理完调用 importer.finish() 后即可释放该文档；全部完成后
+    调用 close() 写出页面树、文档目录和交叉引用表。
+    """
+
+    def __init__(self, stream, version="1.7", dedup=False, first_num=1, pages_num=None,
+                 compress=False, flate=False):
+        self.stream = stream
+        self.dedup = dedup
+        self.compress = compress
+        self.flate = flate
+        self.position = 0
+        self.offsets = {}  # {对象号: 文件偏移量}
+        self.packed = {}  # 压缩输出：对象流中的对象 {对象号: (对象流的对象号, 序号)}
+        self.generations = {}  # 代号不为0的对象 {对象号: 代号}（保留原对象号复制时使用）
+        self.page_nums = []  # 输出文档中各页面的对象号
+        self.shared = {}  # 去重：{内容哈希: 对象号}，跨输入文档共用
+        self.dedup_objects = 0  # 因内容相同而省略的对象数
+        self.dedup_bytes = 0  # 因此节省的字节数
+        # 新分配的对象号从 first_num 开始，页面树根节点可以沿用指定的对象号
+        self._next_num = first_num
+        self.pages_num = pages_num if pages_num is not None else self.allocate()
+        self._batch = []  # 尚未写出的对象流内容 [(对象号, 内容)]
+        self._batch_num = None
+        self._batch_bytes = 0
+
+        if compress and version < "1.5":
+            # 对象流和交叉引用流需要 PDF 1.5
+            version = "1.5"
+        self._write(f"%PDF-{version}\n".encode("ascii") + b"%\xe2\xe3\xcf\xd3\n")
+
+    def allocate(self):
+        """分配一个新的对象号"""
+        num = self._next_num
+        self._next_num += 1
+        return num
+
+    def write_object(self, num, obj, ref_for):
+        """序列化并写出一个对象"""
+        self.write_raw(num, serialize(obj, ref_for, self.flate))
+
+    def is_written(self, num):
+        """对象号是否已写出（包括已放入对象流、尚未写出的对象）"""
+        return num in self.offsets or num in self.packed
+
+    def write_shared(self, body):
+        """写出可共用的对象内容，内容与已写出的对象相同时直接返回该对象号"""
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        num = self.shared.get(digest)
+        if num is not None:
+            self.dedup_objects += 1
+            # 对象内容、对象头尾和交叉引用表中的一行
+            self.dedup_bytes += len(body) + len(b"%d 0 obj\n\nendobj\n" % num) + 20
+            return num
+        num = self.shared[digest] = self.allocate()
+        self.write_raw(num, body)
+        return num
+
+    def write_raw(self, num, body):
+        """写出已序列化的对象内容；压缩输出时非流对象放入对象流"""
+        if self.compress and not self.generations.get(num) and not body.endswith(b"endstream"):
+            self._pack(num, body)
+            return
+        self.offsets[num] = self.position
+        self._write(b"%d %d obj\n" % (num, self.generations.get(num, 0)))
+        self._write(body)
+        self._write(b"\nendobj\n")
+
+    def write_verbatim(self, num, generation, data):
+        """写出原文件中完整的对象（从对象头到 endobj），内容不做任何处理"""
+        self.offsets[num] = self.position
+        if generation:
+            self.generations[num] = generation
+        self._write(data)
+        self._write(b"\n")
+
+    def add_source(self, reader):
+        """开始复制一个输入文档"""
+        return SourceImporter(self, reader)
+
+    def close(self, catalog_entries=None, info=None, root=None, info_ref=None, first_id=None):
+        """写出页面树、文档目录、交叉引用表和文件尾
+
+        root / info_ref 为已写出的文档目录和文档信息的 (对象号, 代号)，提供 root 时
+        不再生成新的文档目录；first_id 为沿用的文件标识第一部分（字节串）。
+        """
+        kids = b" ".join(b"%d %d R" % (num, self.generations.get(num, 0)) for num in self.page_nums)
+        self.write_raw(
+            self.pages_num,
+            b"<</Type /Pages /Kids [" + kids + b"] /Count %d>>" % len(self.page_nums)
+        )
+
+        if root is None:
+            root = (self.allocate(), 0)
+            catalog = b"<</Type /Catalog /Pages %d %d R" % (
+                self.pages_num, self.generations.get(self.pages_num, 0))
+            for key, value in (catalog_entries or {}).items():
+                catalog += NameObject(key).renumber() + b" " + value
+            self.write_raw(root[0], catalog + b">>")
+
+        if info:
+            info_ref = (self.allocate(), 0)
+            self.write_raw(info_ref[0], info)
+
+        if self.compress:
+            self._flush_batch()
+            self._write_xref_stream(root, info_ref, first_id)
+        else:
+            self._write_xref(root, info_ref, first_id)
+        self.stream.flush()
+
+    def _pack(self, num, body):
+        if self._batch_num is None:
+            self._batch_num = self.allocate()
+        self.packed[num] = (self._batch_num, len(self._batch))
+        self._batch.append((num, body))
+        self._batch_bytes += len(body)
+        if len(self._batch) >= OBJECT_STREAM_OBJECTS or self._batch_bytes >= OBJECT_STREAM_BYTES:
+            self._flush_batch()
+
+    def _flush_batch(self):
+        """把攒下的对象写为一个对象流"""
+        if not self._batch:
+            return
+        header, offset = [], 0
+        for num, body in self._batch:
+            header.append(b"%d %d" % (num, offset))
+            offset += len(body) + 1
+        header = b" ".join(header) + b"\n"
+        data = zlib.compress(header + b"".join(body + b"\n" for _, body in self._batch), FLATE_LEVEL)
+        num, count = self._batch_num, len(self._batch)
+        self._batch, self._batch_num, self._batch_bytes = [], None, 0
+        self.write_raw(num, b"<</Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d>>\nstream\n"
+                       % (count, len(header), len(data)) + data + b"\nendstream")
+
+    def _free_list(self, size):
+        # 预留但最终没有写出的对象号（例如指向未复制页面的引用）记为空闲对象
+        free = [num for num in range(1, size) if not self.is_written(num)]
+        return dict(zip([0] + free, free + [0]))
+
+    def _trailer_entries(self, size, root, info, first_id, xref_offset):
+        file_id = hashlib.md5(b"%d-%d-%f" % (size, xref_offset, time.time())).hexdigest().encode("ascii")
+        first_id = first_id.hex().encode("ascii") if first_id else file_id
+        entries = b"/Size %d /Root %d %d R" % (size, *root)
+        if info is not None:
+            entries += b" /Info %d %d R" % info
+        return entries + b" /ID [<%s> <%s>]" % (first_id, file_id)
+
+    def _write_xref_stream(self, root, info, first_id=None):
+        """写出压缩的交叉引用流，它同时代替文件尾字典"""
+        xref_num = self.allocate()
+        size = self._next_num
+        xref_offset = self.offsets[xref_num] = self.position
+        next_free = self._free_list(size)
+
+        width = max(1, (max(xref_offset, size).bit_length() + 7) // 8)
+        rows = []
+        for num in range(size):
+            if num in self.offsets:
+                rows.append(b"\x01" + self.offsets[num].to_bytes(width, "big")
+                            + self.generations.get(num, 0).to_bytes(2, "big"))
+            elif num in self.packed:
+                stream_num, index = self.packed[num]
+                rows.append(b"\x02" + stream_num.to_bytes(width, "big") + index.to_bytes(2, "big"))
+            else:
+                generation = 65535 if num == 0 else 1
+                rows.append(b"\x00" + next_free[num].to_bytes(width, "big") + generation.to_bytes(2, "big"))
+        data = zlib.compress(b"".join(rows), FLATE_LEVEL)
+
+        entries = self._trailer_entries(size, root, info, first_id, xref_offset)
+        self._write(b"%d 0 obj\n<</Type /XRef %s /W [1 %d 2] /Filter /FlateDecode /Length %d>>\nstream\n"
+                    % (xref_num, entries, width, len(data)))
+        self._write(data + b"\nendstream\nendobj\n")
+        self._write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+
+    def _write_xref(self, root, info, first_id=None):
+        size = self._next_num
+        xref_offset = self.position
+        next_free = self._free_list(size)
+
+        lines = [b"xref\n0 %d\n" % size]
+        for num in range(size):
+            if num in self.offsets:
+                lines.append(b"%010d %05d n\r\n" % (self.offsets[num], self.generations.get(num, 0)))
+            else:
+                generation = 65535 if num == 0 else 1
+                lines.append(b"%010d %05d f\r\n" % (next_free[num], generation))
+        self._write(b"".join(lines))
+
+        entries = self._trailer_entries(size, root, info, first_id, xref_offset)
+        self._write(b"trailer\n<<" + entries + b">>\n")
+        self._write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.position += len(data)
+
+
+class SourceImporter:
+    """把一个输入文档的页面复制到 StreamingPdfWriter
+
+    每复制一页，就把该页引用到的、尚未写出的对象全部写出。同一文档中多页共用的
+    字体、图像等对象只写一次；写入器开启去重时，不同文档中内容相同的对象也只写一次。
+    """
+
+    def __init__(self, writer, reader):
+        self.writer = writer
+        self.reader = reader
+        self._map = {}  # {(原对象号, 代号): 新对象号}
+        self._queue = []  # 已分配对象号、尚未写出的对象
+        self._page_keys = None
+        self._pending = set()  # 去重：正在写出（等待其引用对象写出）的对象
+        self._reserved = {}  # 去重：被循环引用、已提前分配对象号的对象
+
+    def import_page(self, page_index, rotate=0):
+        """复制一页，rotate 为在原有 /Rotate 基础上追加的顺时针角度，返回新对象号"""
+        page = self.reader.pages[page_index]
+        ref = page.indirect_reference
+        if ref is not None and (ref.idnum, ref.generation) in self._map:
+            num = self._map[(ref.idnum, ref.generation)]
+        else:
+            num = self.writer.allocate()
+            if ref is not None:
+                self._map[(ref.idnum, ref.generation)] = num
+
+        page_dict = DictionaryObject()
+        for key, value in page.items():
+            if key != "/Parent":
+                page_dict[NameObject(key)] = value
+
+        # 页面树被重建，从原父节点继承的属性需要写入页面本身
+        for key in INHERITABLE_PAGE_KEYS:
+            if key not in page_dict:
+                inherited = self._inherited(page, key)
+                if inherited is not None:
+                    page_dict[NameObject(key)] = inherited
+
+        if rotate % 360:
+            current = int(page_dict.get("/Rotate", 0))
+            page_dict[NameObject("/Rotate")] = NumberObject((current + rotate) % 360)
+
+        page_dict[NameObject("/Parent")] = IndirectObject(self.writer.pages_num, 0, None)
+        self.writer.write_object(num, page_dict, self._ref_for_page)
+        self.writer.page_nums.append(num)
+        self._drain()
+        return num
+
+    def finish(self):
+        """写出所有剩余对象，并释放对输入文档的引用"""
+        self._drain()
+        self.reader = None
+        self._map.clear()
+
+    def _ref_for_page(self, ind):
+        # 页面字典中的 /Parent 已指向新页面树
+        if ind.pdf is None:
+            return ind.idnum
+        return self._ref(ind)
+
+    def _ref(self, ind):
+        """返回原文档中间接引用对应的新对象号，首次遇到时分配对象号并排队写出"""
+        key = (ind.idnum, ind.generation)
+        num = self._map.get(key)
+        if num is not None:
+            return num
+
+        if self._is_page(key):
+            # 指向其它页面的引用（如链接目标）：若该页之后被复制则指向它，
+            # 否则对象号保持空闲，阅读器按 null 处理
+            num = self._map[key] = self.writer.allocate()
+            return num
+
+        if key in self._pending:
+            # 循环引用：对象尚未写完，只能提前分配对象号，该对象不参与去重
+            num = self._map[key] = self._reserved[key] = self.writer.allocate()
+            return num
+
+        obj = ind.get_object()
+        if isinstance(obj, DictionaryObject) and obj.get("/Type") == "/Pages":
+            # 原页面树节点统一指向新的页面树
+            return self.writer.pages_num
+
+        if self.writer.dedup and len(self._pending) < MAX_DEDUP_DEPTH:
+            return self._write_shared(key, ind, obj)
+
+        num = self._map[key] = self.writer.allocate()
+        self._queue.append((num, ind))
+        return num
+
+    def _write_shared(self, key, ind, obj):
+        """先写出对象引用的所有对象，再按序列化内容去重写出该对象"""
+        self._pending.add(key)
+        try:
+            body = serialize(obj, self._ref, self.writer.flate)
+        finally:
+            self._pending.discard(key)
+
+        num = self._reserved.pop(key, None)
+        if num is not None:
+            self.writer.write_raw(num, body)
+        elif self._shareable(obj):
+            num = self._map[key] = self.writer.write_shared(body)
+        else:
+            num = self._map[key] = self.writer.allocate()
+            self.writer.write_raw(num, body)
+        self._evict(ind)
+        return num
+
+    def _drain(self):
+        while self._queue:
+            num, ind = self._queue.pop()
+            self.writer.write_object(num, ind.get_object(), self._ref)
+            self._evict(ind)
+
+    def _evict(self, ind):
+        # 对象已写出且不会再被读取，从读取器缓存中移除，大图像数据立即释放
+        cache = getattr(self.reader, "resolved_objects", {})
+        cache.pop((ind.generation, ind.idnum), None)
+
+    @staticmethod
+    def _shareable(obj):
+        # 注释和表单域属于特定页面或父节点，即使内容相同也不能共用
+        if isinstance(obj, DictionaryObject):
+            return (obj.get("/Type") != "/Annot" and "/Parent" not in obj
+                    and "/P" not in obj)
+        return True
+
+    def _is_page(self, key):
+        if self._page_keys is None:
+            self._page_keys = set()
+            for page in self.reader.pages:
+                ref = page.indirect_reference
+                if ref is not None:
+                    self._page_keys.add((ref.idnum, ref.generation))
+        return key in self._page_keys
+
+    @staticmethod
+    def _inherited(page, key):
+        node = page.get("/Parent")
+        while node is not None:
+            node = node.get_object()
+            if key in node:
+                return dict.__getitem__(node, key)
+            node = node.get("/Parent")
+        return None
+
+
+def stream_merge(paths, output_stream, task=None, dedup=False, pages_for=None, compress=False,
+                 flate=False):
+    """流式合并多个PDF文件
+
+    每个输入文件通过内存映射打开，页面复制完成后立即关闭，输出逐对象写入
+    output_stream。task 可选，提供 report(进度, 消息) 和 check_cancelled()
+    （例如 pdf_tasks.BackgroundTask）。dedup 为 True 时合并内容相同的对象，
+    compress / flate 见 StreamingPdfWriter。
+    pages_for(文件序号, session) 可选，返回该文件要复制的 [(页码, 追加的顺时针角度)]，
+    默认复制全部页面。
+    返回统计信息字典：页数、输出字节数、耗时、吞吐量（输入字节/秒）、进程峰值
+    内存，以及去重省略的对象数和字节数。
+    """
+    start = time.perf_counter()
+    writer = StreamingPdfWriter(output_stream, dedup=dedup, compress=compress, flate=flate)
+    total_input = sum(os.path.getsize(path) for path in paths)
+    done_input = 0
+
+    for index, path in enumerate(paths):
+        with PDFSession(path) as session:
+            importer = writer.add_source(session.reader)
+            if pages_for is None:
+                pages = [(page_index, 0) for page_index in range(session.page_count)]
+            else:
+                pages = list(pages_for(index, session))
+            # 页面对象边读取边写出，这一阶段同时包含复制和写出
+            with stage("copy-pages") as record:
+                position = writer.position
+                for done, (page_index, rotate) in enumerate(pages, 1):
+                    if task is not None:
+                        task.check_cancelled()
+                    importer.import_page(page_index, rotate)
+                    if task is not None:
+                        fraction = (done_input + session.size * done / len(pages)) / max(total_input, 1)
+                        task.report(
+                            min(fraction, 0.99),
+                            f"正在合并第 {index + 1}/{len(paths)} 个文件，"
+                            f"第 {page_index + 1}/{session.page_count} 页"
+                        )
+                importer.finish()
+                record.bytes_written = writer.position - position
+            done_input += session.size
+        # PyPDF2 的页面和读取器之间存在循环引用，立即回收，避免多个输入文档同时驻留内存
+        gc.collect()
+
+    with stage("write") as record:
+        position = writer.position
+        writer.close()
+        record.bytes_written = writer.position - position
+    elapsed = time.perf_counter() - start
+    return {
+        'files': len(paths),
+        'pages': len(writer.page_nums),
+        'input_bytes': total_input,
+        'output_bytes': writer.position,
+        'seconds': elapsed,
+        'throughput': total_input / elapsed if elapsed > 0 else 0.0,
+        'peak_rss': peak_rss(),
+        'dedup_objects': writer.dedup_objects,
+        'bytes_saved': writer.dedup_bytes,
+    }
@@ -0,0 +1,164 @@
+"""后台任务与原子写入
+
+保存、合并等耗时操作在后台线程中执行，进度和结果通过 root.after 轮询回送到
+Tk 主线程，界面在任务期间保持响应并可随时取消。输出先写入目标目录下的临时文件，
+成功后再原子地替换目标文件，失败或取消时不会留下不完整的PDF。
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# 进程的 umask。os.umask 只能在设置的同时读取，在导入时（主线程）读取一次，
+# 避免后台线程修改 umask 时与其它线程创建文件冲突
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class TaskCancelled(Exception):
+    """任务被用户取消"""
+
+
+@contextmanager
+def atomic_output(path):
+    """以临时文件写入 path，正常结束时原子替换目标文件，出错或取消时删除临时文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        # mkstemp 创建的文件只有所有者可读写，替换前改为原文件的权限（新文件按 umask）
+        os.chmod(tmp_path, _output_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _output_mode(path):
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+class NullTask:
+    """不报告进度、不可取消的任务，在命令行等无界面场景中代替 BackgroundTask"""
+
+    def check_cancelled(self):
+        pass
+
+    def report(self, fraction, message=""):
+        pass
+
+
+class ProgressWriter:
+    """包装输出文件：每次写入前检查是否取消，并按已写入字节数报告进度"""
+
+    def __init__(self, file, task, expected_bytes, start=0.0, end=1.0):
+        self.file = file
+        self.task = task
+        self.expected_bytes = max(expected_bytes, 1)
+        self.start = start
+        self.end = end
+        self.written = 0
+
+    def write(self, data):
+        self.task.check_cancelled()
+        n = self.file.write(data)
+        self.written += len(data)
+        fraction = min(self.written / self.expected_bytes, 0.99)
+        self.task.report(
+            self.start + (self.end - self.start) * fraction,
+            f"正在写入文件... {self.written // 1024} KB"
+        )
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class BackgroundTask:
+    """在后台线程中执行 work(task)
+
+    work 通过 task.report(进度, 消息) 报告 0~1 的进度，并在适当位置调用
+    task.check_cancelled()。回调都在主线程中执行：on_progress(进度, 消息)、
+    on_success(返回值)、on_error(异常)、on_cancelled()。
+    """
+
+    POLL_INTERVAL = 50  # 毫秒
+
+    def __init__(self, root, work, on_progress=None, on_success=None,
+                 on_error=None, on_cancelled=None):
+        self.root = root
+        self.work = work
+        self.on_progress = on_progress
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_cancelled = on_cancelled
+
+        self._cancel_event = threading.Event()
+        self._progress = None  # 最新进度 (进度, 消息)，只保留最后一次
+        self._shown_progress = None
+        self._outcome = None  # ('success'|'error'|'cancelled', 值)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.root.after(self.POLL_INTERVAL, self._poll)
+        return self
+
+    @property
+    def running(self):
+        return self._thread is not None and self._outcome is None
+
+    def cancel(self):
+        """请求取消，任务在下一个检查点结束"""
+        self._cancel_event.set()
+
+    def wait(self, timeout=None):
+        """等待后台线程结束（退出程序前调用，保证临时文件被清理）"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise TaskCancelled()
+
+    def report(self, fraction, message=""):
+        self._progress = (fraction, message)
+
+    def _run(self):
+        try:
+            result = self.work(self)
+        except TaskCancelled:
+            self._outcome = ('cancelled', None)
+        except Exception as e:
+            self._outcome = ('error', e)
+        else:
+            self._outcome = ('success', result)
+
+    def _poll(self):
+        progress = self._progress
+        if progress is not None and progress is not self._shown_progress:
+            self._shown_progress = progress
+            if self.on_progress is not None:
+                self.on_progress(*progress)
+
+        if self._outcome is None:
+            self.root.after(self.POLL_INTERVAL, self._poll)
+            return
+
+        kind, value = self._outcome
+        if kind == 'success' and self.on_success is not None:
+            self.on_success(value)
+        elif kind == 'error' and self.on_error is not None:
+            self.on_error(value)
+        elif kind == 'cancelled' and self.on_cancelled is not None:
+            self.on_cancelled()
@@ -0,0 +1,178 @@
+"""缩略图磁盘缓存
+
+PDF页面删除工具和旋转工具共用。缓存以PDF文件内容的哈希值加页码、缩放和旋转角度
+为键，同一文件（即使被移动或改名）再次打开时直接读取缓存，无需重新渲染。
+缓存目录有总大小上限，超出时按最近使用时间（LRU）淘汰。
+"""
+import hashlib
+import os
+import threading
+import zlib
+
+# 默认缓存上限 200 MB
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+_MAGIC = b"PDFT1"
+_SUFFIX = ".thumb"
+_KEYS_DIR = "keys"  # 文件哈希的记录，与缩略图一同按LRU淘汰
+
+
+def default_cache_dir():
+    """默认缓存目录（Windows 下位于 LOCALAPPDATA，其它系统位于 ~/.cache）"""
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "PDF-tools", "thumbnails")
+
+
+class ThumbnailCache:
+    """缩略图磁盘缓存
+
+    可在多个进程和线程中同时使用：写入先写临时文件再重命名，读取命中时更新文件的
+    修改时间作为最近使用时间。hits/misses 只统计当前进程内的访问次数。
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._file_keys = {}
+
+    def file_key(self, path, stamp=None):
+        """计算PDF文件的内容哈希
+
+        计算结果按 (路径, 大小, 修改时间) 记录在缓存目录中，同一文件再次打开时
+        不必重新读取整个文件。
+        """
+        ident, memo_path = self._key_memo(path, stamp)
+        key = self._known_key(ident, memo_path)
+        if not key:
+            digest = hashlib.blake2b(digest_size=16)
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            key = digest.hexdigest()
+            self._write_atomic(memo_path, key.encode("ascii"))
+            self._file_keys[ident] = key
+        return key
+
+    def known_file_key(self, path, stamp=None):
+        """返回已记录的文件哈希，尚未计算过时返回None（不读取PDF文件内容）"""
+        return self._known_key(*self._key_memo(path, stamp)) or None
+
+    def _key_memo(self, path, stamp):
+        st = os.stat(path)
+        stamp = st.st_mtime_ns if stamp is None else stamp
+        ident = f"{os.path.abspath(path)}|{st.st_size}|{stamp}"
+        memo_path = os.path.join(
+            self.directory, _KEYS_DIR, hashlib.sha1(ident.encode("utf-8")).hexdigest()
+        )
+        return ident, memo_path
+
+    def _known_key(self, ident, memo_path):
+        if ident in self._file_keys:
+            return self._file_keys[ident]
+        try:
+            with open(memo_path, "r", encoding="ascii") as f:
+                key = f.read().strip()
+        except OSError:
+            return ""
+        if key:
+            try:
+                # 记录与缩略图一样按修改时间淘汰
+                os.utime(memo_path)
+            except OSError:
+                pass
+            self._file_keys[ident] = key
+        return key
+
+    def get(self, file_key, page_num, zoom, rotation=0):
+        """读取缓存的缩略图 (模式, 宽, 高, 像素数据)，未命中时返回None"""
+        path = self._entry_path(file_key, page_num, zoom, rotation)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            thumb = self._decode(data)
+        except (OSError, ValueError, zlib.error):
+            self.misses += 1
+            return None
+
+        try:
+            # 更新修改时间，作为LRU淘汰的依据
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return thumb
+
+    def put(self, file_key, page_num, zoom, rotation, thumb):
+        """写入一张缩略图 (模式, 宽, 高, 像素数据)，写入失败时忽略"""
+        path = self._entry_path(file_key, page_num, zoom, rotation)
+        try:
+            self._write_atomic(path, self._encode(thumb))
+        except OSError:
+            pass
+
+    def trim(self):
+        """按LRU淘汰缓存，使总大小不超过上限，返回淘汰的条目数"""
+        entries = []
+        total = 0
+        for root, _dirs, files in os.walk(self.directory):
+            in_keys = os.path.basename(root) == _KEYS_DIR
+            for name in files:
+                if not (in_keys or name.endswith(_SUFFIX)) or name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, path))
+                total += st.st_size
+
+        removed = 0
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self):
+        """返回命中/未命中统计"""
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _entry_path(self, file_key, page_num, zoom, rotation):
+        name = f"{file_key}-p{page_num}-z{zoom}-r{rotation % 360}{_SUFFIX}"
+        return os.path.join(self.directory, file_key[:2], name)
+
+    @staticmethod
+    def _encode(thumb):
+        mode, width, height, samples = thumb
+        header = f"{mode} {width} {height}\n".encode("ascii")
+        return _MAGIC + header + zlib.compress(samples, 1)
+
+    @staticmethod
+    def _decode(data):
+        if not data.startswith(_MAGIC):
+            raise ValueError("不是缩略图缓存文件")
+        header_end = data.index(b"\n")
+        mode, width, height = data[len(_MAGIC):header_end].decode("ascii").split()
+        samples = zlib.decompress(data[header_end + 1:])
+        if len(samples) != int(width) * int(height) * len(mode):
+            raise ValueError("缩略图缓存文件已损坏")
+        return mode, int(width), int(height), samples
+
+    @staticmethod
+    def _write_atomic(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)